@@ -0,0 +1,290 @@
+"""Benchmark suite for the Bloom filter operations, renderers and Flask routes.
+
+Run from the repository root:
+
+    python benchmarks/run_benchmarks.py                      # full run, JSON to benchmarks/results/
+    python benchmarks/run_benchmarks.py --quick              # smaller grid for a fast check
+    python benchmarks/run_benchmarks.py --baseline old.json  # flag regressions against an earlier run
+
+Single-element operations are timed call by call, so latency percentiles come from
+real per-call samples; batch operations report throughput. After every section the
+process's peak RSS so far is recorded from resource.getrusage; it is a high-water
+mark, so each value covers that section and all earlier ones (run one section with
+--sections to see its own peak). With --baseline, any timing more than
+--threshold slower than the baseline run is listed and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+import bloom_core  # noqa: E402
+import bloom_visualizations  # noqa: E402
+import main  # noqa: E402
+
+FULL_SIZES = [10 ** e for e in range(3, 10)]
+FULL_HASHES = list(range(1, 17))
+QUICK_SIZES = [10 ** 3, 10 ** 5, 10 ** 7]
+QUICK_HASHES = [1, 4, 8, 16]
+
+RENDER_SIZES = [100, 1000, 100_000, 10_000_000]
+
+def peak_rss_kb():
+    """Peak resident set size of this process so far (not per section), in KiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and KiB on Linux
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def summarize(samples_ns):
+    """Latency percentiles (microseconds) and throughput for per-call timings"""
+    samples = np.asarray(samples_ns, dtype=np.float64) / 1000
+    return {
+        'calls': len(samples),
+        'p50_us': float(np.percentile(samples, 50)),
+        'p90_us': float(np.percentile(samples, 90)),
+        'p99_us': float(np.percentile(samples, 99)),
+        'max_us': float(samples.max()),
+        'ops_per_second': float(len(samples) / (samples.sum() / 1e6))
+    }
+
+def time_calls(func, args):
+    """Call func once per argument, returning the per-call durations in nanoseconds"""
+    timer = time.perf_counter_ns
+    samples = []
+    for arg in args:
+        start = timer()
+        func(arg)
+        samples.append(timer() - start)
+    return samples
+
+def time_repeated(func, repeat):
+    """Median and best wall time (milliseconds) of repeat calls to func"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {'repeat': repeat, 'median_ms': float(np.median(samples)), 'min_ms': float(min(samples))}
+
+def bench_operations(sizes, hash_counts, calls, batch):
+    """add / contains / get_hash_positions latency, plus batch throughput, per (size, k)"""
+    results = []
+    members = [f"user_{i}" for i in range(calls)]
+    probes = [f"probe_{i}" for i in range(calls)]
+    batch_members = [f"batch_{i}" for i in range(batch)]
+    for size in sizes:
+        for k in hash_counts:
+            bf = bloom_core.BloomFilter(size, k, track_elements=False)
+            row = {'size': size, 'num_hashes': k}
+            row['add'] = summarize(time_calls(bf.add, members))
+            row['contains_hit'] = summarize(time_calls(bf.contains, members))
+            row['contains_miss'] = summarize(time_calls(bf.contains, probes))
+            row['get_hash_positions'] = summarize(time_calls(bf.get_hash_positions, probes))
+
+            start = time.perf_counter()
+            bf.add_many(batch_members)
+            add_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            bf.contains_many(batch_members)
+            contains_seconds = time.perf_counter() - start
+            row['add_many_per_second'] = batch / add_seconds
+            row['contains_many_per_second'] = batch / contains_seconds
+            results.append(row)
+            print(f"  size={size:>13,} k={k:>2}  add p50 {row['add']['p50_us']:7.2f}us  "
+                  f"contains p50 {row['contains_hit']['p50_us']:7.2f}us  "
+                  f"add_many {row['add_many_per_second']:>12,.0f}/s", flush=True)
+            del bf
+    return results
+
+def _filled_filter(size, k, fraction=0.3):
+    """Production-mode filter with about `fraction` of its bits set"""
+    bf = bloom_core.BloomFilter(size, k, track_elements=False)
+    count = max(1, int(-size / k * np.log1p(-fraction)))
+    for start in range(0, count, 100_000):
+        bf.add_many(f"user_{i}" for i in range(start, min(count, start + 100_000)))
+    return bf
+
+def bench_renderers(sizes, repeat):
+    """Wall time of every create_*_visualization function at several filter sizes"""
+    results = []
+    for size in sizes:
+        bf = _filled_filter(size, 4)
+        scalable = bloom_core.ScalableBloomFilter(max(10, size // 40), 0.01, track_elements=False)
+        scalable.add_many(f"user_{i}" for i in range(max(10, size // 20)))
+        renderers = {
+            'create_bloom_filter_visualization': lambda: bloom_visualizations.create_bloom_filter_visualization(bf),
+            'create_hash_visualization': lambda: bloom_visualizations.create_hash_visualization(bf, 'user_1'),
+            'create_comparison_visualization': lambda: bloom_visualizations.create_comparison_visualization(
+                {'a': bf, 'b': bf, 'c': bf}),
+            'create_slices_visualization': lambda: bloom_visualizations.create_slices_visualization(scalable, 'user_1'),
+        }
+        for name, render in renderers.items():
+            row = {'renderer': name, 'size': size, **time_repeated(render, repeat)}
+            results.append(row)
+            print(f"  {name:<36} size={size:>11,}  {row['median_ms']:9.2f} ms", flush=True)
+
+    demo = main._demo_filters([{'size': 100, 'hashes': 3}, {'size': 500, 'hashes': 5}], 8)
+    row = {'renderer': 'create_performance_analysis', 'size': 500,
+           **time_repeated(lambda: bloom_visualizations.create_performance_analysis(demo, main.DEMO_PROFILES), repeat)}
+    results.append(row)
+    print(f"  {'create_performance_analysis':<36} size={500:>11,}  {row['median_ms']:9.2f} ms", flush=True)
+    return results
+
+def bench_routes(repeat):
+    """End-to-end latency of the Flask routes through the test client"""
+    client = main.app.test_client()
+    results = []
+
+    def route(name, method, url, expect=200, **kwargs):
+        def call():
+            response = client.open(url, method=method, **kwargs)
+            if response.status_code != expect:
+                raise RuntimeError(f'{name}: HTTP {response.status_code} {response.get_data(as_text=True)[:200]}')
+        row = {'route': name, **time_repeated(call, repeat)}
+        results.append(row)
+        print(f"  {name:<40} {row['median_ms']:9.2f} ms", flush=True)
+
+    create = {'filter_id': 'bench', 'size': 1000, 'num_hashes': 4}
+    route('POST /create_filter', 'POST', '/create_filter', json=create)
+    route('POST /add_element', 'POST', '/add_element', json={'filter_id': 'bench', 'element': 'user_1'})
+    route('POST /add_element (no image)', 'POST', '/add_element',
+          json={'filter_id': 'bench', 'element': 'user_2', 'include_image': False})
+    route('POST /add_multiple', 'POST', '/add_multiple',
+          json={'filter_id': 'bench', 'elements': ','.join(f'user_{i}' for i in range(50))})
+    route('POST /check_element', 'POST', '/check_element', json={'filter_id': 'bench', 'element': 'user_1'})
+    route('GET /filters/<id>/image', 'GET', '/filters/bench/image')
+    route('POST /filters/<id>/check (300)', 'POST', '/filters/bench/check',
+          json=[f'user_{i}' for i in range(300)])
+
+    client.post('/create_filter', json={'filter_id': 'bench-large', 'capacity': 1_000_000,
+                                        'error_rate': 0.01, 'mode': 'production', 'include_image': False})
+    body = '\n'.join(f'user_{i}' for i in range(100_000)).encode()
+    route('POST /filters/<id>/ingest (100k)', 'POST', '/filters/bench-large/ingest', data=body)
+    route('POST /check_element (10M bits)', 'POST', '/check_element',
+          json={'filter_id': 'bench-large', 'element': 'user_1'})
+
+    # Chart routes memoize by configuration: time a fresh configuration each call
+    counter = iter(range(10 ** 6))
+    for name in ('compare_filters', 'performance_analysis'):
+        def call(name=name):
+            configurations = [{'size': 100 + next(counter), 'hashes': 3}, {'size': 500, 'hashes': 5}]
+            response = client.post(f'/{name}', json={'configurations': configurations})
+            if response.status_code != 200:
+                raise RuntimeError(f'{name}: HTTP {response.status_code}')
+        row = {'route': f'POST /{name}', **time_repeated(call, repeat)}
+        results.append(row)
+        print(f"  {row['route']:<40} {row['median_ms']:9.2f} ms", flush=True)
+
+    client.delete('/filters/bench')
+    client.delete('/filters/bench-large')
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def timings(results):
+    """Flatten a results file into {label: milliseconds or microseconds} for comparison"""
+    flat = {}
+    for row in results.get('operations', []):
+        for op in ('add', 'contains_hit', 'contains_miss', 'get_hash_positions'):
+            flat[f"{op} size={row['size']} k={row['num_hashes']} p50_us"] = row[op]['p50_us']
+    for row in results.get('renderers', []):
+        flat[f"{row['renderer']} size={row['size']} ms"] = row['median_ms']
+    for row in results.get('routes', []):
+        flat[f"{row['route']} ms"] = row['median_ms']
+    return flat
+
+def regressions(current, baseline, threshold):
+    """Timings that got more than threshold (a fraction) slower than in the baseline"""
+    now, before = timings(current), timings(baseline)
+    slower = []
+    for label, value in now.items():
+        old = before.get(label)
+        if old and value > old * (1 + threshold):
+            slower.append((label, old, value))
+    return slower
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help='small grid: sizes 1e3/1e5/1e7, k 1/4/8/16')
+    parser.add_argument('--sizes', type=lambda v: [int(float(x)) for x in v.split(',')],
+                        help='comma-separated filter sizes in bits (default 1e3..1e9)')
+    parser.add_argument('--hashes', type=lambda v: [int(x) for x in v.split(',')],
+                        help='comma-separated hash counts (default 1..16)')
+    parser.add_argument('--calls', type=int, default=None, help='timed calls per single-element operation')
+    parser.add_argument('--batch', type=int, default=None, help='elements per add_many/contains_many batch')
+    parser.add_argument('--repeat', type=int, default=None, help='repetitions per renderer and route')
+    parser.add_argument('--sections', default='operations,renderers,routes',
+                        help='comma-separated subset of operations,renderers,routes')
+    parser.add_argument('--output', type=Path, help='JSON output path (default benchmarks/results/<time>.json)')
+    parser.add_argument('--baseline', type=Path, help='earlier results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown fraction counted as a regression')
+    args = parser.parse_args()
+
+    sizes = args.sizes or (QUICK_SIZES if args.quick else FULL_SIZES)
+    hash_counts = args.hashes or (QUICK_HASHES if args.quick else FULL_HASHES)
+    calls = args.calls or (500 if args.quick else 2000)
+    batch = args.batch or (10_000 if args.quick else 100_000)
+    repeat = args.repeat or (3 if args.quick else 10)
+    sections = set(args.sections.split(','))
+
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'hash_engine': bloom_core.DEFAULT_HASH_ENGINE,
+            'calls': calls,
+            'batch': batch,
+            'repeat': repeat
+        },
+        # Process high-water mark after each section, including all earlier sections
+        'cumulative_peak_rss_kb': {}
+    }
+
+    if 'operations' in sections:
+        print('Operations')
+        results['operations'] = bench_operations(sizes, hash_counts, calls, batch)
+        results['cumulative_peak_rss_kb']['operations'] = peak_rss_kb()
+    if 'renderers' in sections:
+        print('Renderers')
+        results['renderers'] = bench_renderers(RENDER_SIZES if not args.quick else RENDER_SIZES[:3], repeat)
+        results['cumulative_peak_rss_kb']['renderers'] = peak_rss_kb()
+    if 'routes' in sections:
+        print('Routes')
+        results['routes'] = bench_routes(repeat)
+        results['cumulative_peak_rss_kb']['routes'] = peak_rss_kb()
+    print(f"Peak RSS: {peak_rss_kb() / 1024:.1f} MiB")
+
+    output = args.output or REPO_ROOT / 'benchmarks' / 'results' / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        slower = regressions(results, json.loads(args.baseline.read_text()), args.threshold)
+        for label, old, new in slower:
+            print(f"REGRESSION {label}: {old:.3f} -> {new:.3f} (+{(new / old - 1):.0%})")
+        if slower:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+if __name__ == '__main__':
+    main_cli()
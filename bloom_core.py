@@ -0,0 +1,1668 @@
+"""Bloom filter core: packed bit arrays, hash engines, filter types and parameter sweeps.
+
+Needs only NumPy (and optionally xxhash), so API-only workers and batch jobs can use
+the filters without loading Flask, Pillow or matplotlib. The drawing code lives in
+bloom_visualizations and the web app in main.
+"""
+import os
+import hashlib
+import math
+import time
+import struct
+import sys
+import threading
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from functools import wraps
+from contextlib import contextmanager
+
+try:
+    import xxhash
+except ImportError:  # optional fast hash engine
+    xxhash = None
+
+# Number of set bits for every possible byte value
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def _popcount(data):
+    """Total number of set bits in a uint8 array"""
+    if not hasattr(np, 'bitwise_count'):  # NumPy < 2.0
+        return int(_POPCOUNT[data].sum(dtype=np.int64))
+    whole = len(data) // 8 * 8
+    # Count eight bytes at a time, then the leftover tail
+    total = int(np.bitwise_count(data[:whole].view(np.uint64)).sum(dtype=np.int64)) if whole else 0
+    return total + int(np.bitwise_count(data[whole:]).sum(dtype=np.int64))
+
+def packed_nbytes(size):
+    """Bytes needed to hold size bits"""
+    return (size + 7) // 8
+
+class _ThreadStages:
+    """One thread's stage stack, its running totals and the stages of its current request"""
+    __slots__ = ('thread', 'stack', 'totals', 'request')
+
+    def __init__(self, stages):
+        self.thread = threading.current_thread()
+        # [stage, resumed at, seconds banked while paused]
+        self.stack = []
+        # stage -> [calls, seconds]
+        self.totals = {name: [0, 0.0] for name in stages}
+        self.request = None
+
+class StageTimer:
+    """Cumulative wall time of the hot-path stages (hashing, bit updates, drawing...).
+
+    Stages are timed exclusively: while a nested stage runs (hashing inside a draw,
+    say) the enclosing stage's clock is paused, so no time is counted twice. Each
+    thread accumulates into its own totals, so the hot path takes no lock; totals()
+    sums them. Between begin_request() and end_request() the calling thread's stages
+    are also collected for that one request. With enabled set to False every hook
+    costs a single flag check.
+    """
+
+    def __init__(self, stages):
+        self.enabled = True
+        self.stages = tuple(stages)
+        self._local = threading.local()
+        # Per-thread totals of live threads, and the folded totals of finished ones
+        self._threads = []
+        self._finished = {name: [0, 0.0] for name in self.stages}
+        self._lock = threading.Lock()
+
+    def timed(self, name):
+        """Decorator timing every call of a function as the given stage"""
+        def decorator(func):
+            @wraps(func)
+            def timed_call(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                state = self._enter(name)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self._exit(state)
+            return timed_call
+        return decorator
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as the given stage"""
+        if not self.enabled:
+            yield
+            return
+        state = self._enter(name)
+        try:
+            yield
+        finally:
+            self._exit(state)
+
+    def begin_request(self):
+        self._state().request = {}
+
+    def end_request(self):
+        """Stop collecting for the current thread's request; returns {stage: seconds}"""
+        state = self._state()
+        stages, state.request = state.request, None
+        return stages or {}
+
+    def totals(self):
+        """{stage: (calls, seconds)} since the process started"""
+        with self._lock:
+            self._fold_finished()
+            totals = {name: list(total) for name, total in self._finished.items()}
+            for state in self._threads:
+                for name, (calls, seconds) in state.totals.items():
+                    totals[name][0] += calls
+                    totals[name][1] += seconds
+        return {name: tuple(total) for name, total in totals.items()}
+
+    def _state(self):
+        try:
+            return self._local.state
+        except AttributeError:
+            state = self._local.state = _ThreadStages(self.stages)
+            with self._lock:
+                self._fold_finished()
+                self._threads.append(state)
+            return state
+
+    def _fold_finished(self):
+        """Move the totals of threads that have exited into _finished (lock held)"""
+        live = []
+        for state in self._threads:
+            if state.thread.is_alive():
+                live.append(state)
+                continue
+            for name, (calls, seconds) in state.totals.items():
+                self._finished[name][0] += calls
+                self._finished[name][1] += seconds
+        self._threads = live
+
+    def _enter(self, name):
+        now = time.perf_counter()
+        state = self._state()
+        stack = state.stack
+        if stack:
+            # Pause the enclosing stage: bank its time so far
+            outer = stack[-1]
+            outer[2] += now - outer[1]
+        stack.append([name, now, 0.0])
+        return state
+
+    def _exit(self, state):
+        now = time.perf_counter()
+        stack = state.stack
+        name, resumed, banked = stack.pop()
+        seconds = banked + now - resumed
+        if stack:
+            stack[-1][1] = now
+        total = state.totals[name]
+        total[0] += 1
+        total[1] += seconds
+        if state.request is not None:
+            state.request[name] = state.request.get(name, 0.0) + seconds
+
+# Process-wide stage timings, exported on /metrics
+stage_timer = StageTimer(('hash', 'bits', 'draw', 'png', 'base64', 'json'))
+
+class PackedBitArray:
+    """Bit array packed eight slots per byte in a NumPy uint8 buffer.
+
+    The number of set bits is kept up to date as bits are set, so count() is O(1).
+    Read-only maps are the exception: a writer in another process may set bits
+    underneath them, so they count afresh on every call.
+    """
+
+    def __init__(self, size, bits=None):
+        self.size = size
+        # Running number of set bits; None until count() first pops an existing buffer
+        self._count = None
+        if bits is None:
+            bits = np.zeros(packed_nbytes(size), dtype=np.uint8)
+            self._count = 0
+        elif bits.shape != (packed_nbytes(size),):
+            raise ValueError(f'expected {packed_nbytes(size)} bytes of bits, got {bits.shape}')
+        # Either an in-memory array or a numpy.memmap over a filter file
+        self.bits = bits
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError('bit index out of range')
+        return int(self.bits[index >> 3] >> (index & 7)) & 1
+
+    def __setitem__(self, index, value):
+        if not 0 <= index < self.size:
+            raise IndexError('bit index out of range')
+        self.adjust_count((1 if value else 0) - self[index])
+        if value:
+            self.bits[index >> 3] |= np.uint8(1 << (index & 7))
+        else:
+            self.bits[index >> 3] &= np.uint8(~(1 << (index & 7)) & 0xFF)
+
+    def unpack(self, start=0, stop=None):
+        """Return bits[start:stop] as a uint8 array of 0s and 1s"""
+        stop = self.size if stop is None else min(stop, self.size)
+        if start >= stop:
+            return np.zeros(0, dtype=np.uint8)
+        chunk = self.bits[start >> 3:(stop + 7) >> 3]
+        unpacked = np.unpackbits(chunk, bitorder='little')
+        offset = start & 7
+        return unpacked[offset:offset + stop - start]
+
+    @stage_timer.timed('bits')
+    def set_indices(self, indices):
+        """Set every bit in an integer index array (duplicates allowed); returns the newly set positions"""
+        unique = np.unique(np.asarray(indices, dtype=np.uint64))
+        new = unique[~self.test_indices(unique)]
+        self.adjust_count(len(new))
+        byte_index = (new >> np.uint64(3)).astype(np.intp)
+        masks = np.left_shift(np.uint8(1), (new & np.uint64(7)).astype(np.uint8))
+        # Unbuffered OR so several bits landing in the same byte all stick
+        np.bitwise_or.at(self.bits, byte_index, masks)
+        return new
+
+    @stage_timer.timed('bits')
+    def test_indices(self, indices):
+        """Return a boolean array, shaped like indices, of the bits at those positions"""
+        indices = np.asarray(indices, dtype=np.uint64)
+        byte_index = (indices >> np.uint64(3)).astype(np.intp)
+        shifts = (indices & np.uint64(7)).astype(np.uint8)
+        return ((self.bits[byte_index] >> shifts) & 1).astype(bool)
+
+    def set_positions(self, positions):
+        """set_indices() for a few Python-int positions, without NumPy array overhead"""
+        bits = self.bits
+        new = []
+        for index in positions:
+            byte, mask = index >> 3, 1 << (index & 7)
+            value = int(bits[byte])
+            if not value & mask:
+                bits[byte] = value | mask
+                new.append(index)
+        self.adjust_count(len(new))
+        return new
+
+    def packed_bits(self):
+        """The bits as a little-endian packed uint8 array"""
+        return self.bits
+
+    @property
+    def num_words(self):
+        """Number of 64-bit words covering the bits (the last one may be partial)"""
+        return -(-len(self.bits) // 8)
+
+    def _word_bytes(self, word_indices):
+        """(n, 8) byte positions of words and a mask of those inside the buffer"""
+        positions = np.asarray(word_indices, dtype=np.intp).reshape(-1, 1) * 8 + np.arange(8)
+        return positions, positions < len(self.bits)
+
+    def words(self, word_indices):
+        """The little-endian 64-bit words at the given word indices (zero-padded past the end)"""
+        positions, inside = self._word_bytes(word_indices)
+        gathered = np.zeros(positions.shape, dtype=np.uint8)
+        gathered[inside] = self.bits[positions[inside]]
+        return gathered.view('<u8').ravel()
+
+    def or_words(self, word_indices, words):
+        """OR little-endian 64-bit words into the bits at the given word indices"""
+        positions, inside = self._word_bytes(word_indices)
+        values = np.ascontiguousarray(words, dtype='<u8').view(np.uint8).reshape(-1, 8)
+        if self._count is None:
+            np.bitwise_or.at(self.bits, positions[inside], values[inside])
+            return
+        touched = np.unique(positions[inside])
+        before = _popcount(self.bits[touched])
+        np.bitwise_or.at(self.bits, positions[inside], values[inside])
+        self._count += _popcount(self.bits[touched]) - before
+
+    def nonzero_words(self):
+        """Indices of the 64-bit words holding at least one set bit"""
+        full = len(self.bits) // 8
+        indices = np.flatnonzero(self.bits[:full * 8].view('<u8'))
+        if full * 8 < len(self.bits) and self.bits[full * 8:].any():
+            indices = np.append(indices, full)
+        return indices
+
+    def count(self):
+        """Number of bits set to 1"""
+        if self._count is not None:
+            return self._count
+        count = _popcount(self.bits)
+        if self.bits.flags.writeable:
+            self._count = count
+        return count
+
+    def adjust_count(self, delta):
+        """Account for delta bits set (or, if negative, cleared) by writing to bits directly"""
+        if self._count is not None:
+            self._count += delta
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+_MASK64 = (1 << 64) - 1
+
+def _rotl64(x, r):
+    return ((x << r) | (x >> (64 - r))) & _MASK64
+
+def _fmix64(k):
+    k ^= k >> 33
+    k = (k * 0xff51afd7ed558ccd) & _MASK64
+    k ^= k >> 33
+    k = (k * 0xc4ceb9fe1a85ec53) & _MASK64
+    k ^= k >> 33
+    return k
+
+def murmur3_128(data, seed=0):
+    """MurmurHash3 x64 128-bit, returned as 16 little-endian bytes"""
+    c1 = 0x87c37b91114253d5
+    c2 = 0x4cf5ad432745937f
+    length = len(data)
+    h1 = h2 = seed
+    nblocks = length // 16
+
+    for block in range(nblocks):
+        k1 = int.from_bytes(data[block * 16:block * 16 + 8], 'little')
+        k2 = int.from_bytes(data[block * 16 + 8:block * 16 + 16], 'little')
+
+        k1 = (_rotl64((k1 * c1) & _MASK64, 31) * c2) & _MASK64
+        h1 ^= k1
+        h1 = (_rotl64(h1, 27) + h2) & _MASK64
+        h1 = (h1 * 5 + 0x52dce729) & _MASK64
+
+        k2 = (_rotl64((k2 * c2) & _MASK64, 33) * c1) & _MASK64
+        h2 ^= k2
+        h2 = (_rotl64(h2, 31) + h1) & _MASK64
+        h2 = (h2 * 5 + 0x38495ab5) & _MASK64
+
+    tail = data[nblocks * 16:]
+    k1 = int.from_bytes(tail[:8], 'little')
+    k2 = int.from_bytes(tail[8:], 'little')
+    if len(tail) > 8:
+        k2 = (_rotl64((k2 * c2) & _MASK64, 33) * c1) & _MASK64
+        h2 ^= k2
+    if tail:
+        k1 = (_rotl64((k1 * c1) & _MASK64, 31) * c2) & _MASK64
+        h1 ^= k1
+
+    h1 ^= length
+    h2 ^= length
+    h1 = (h1 + h2) & _MASK64
+    h2 = (h2 + h1) & _MASK64
+    h1 = _fmix64(h1)
+    h2 = _fmix64(h2)
+    h1 = (h1 + h2) & _MASK64
+    h2 = (h2 + h1) & _MASK64
+    return h1.to_bytes(8, 'little') + h2.to_bytes(8, 'little')
+
+class HashEngine:
+    """Turns an element into the two 64-bit hashes used for double hashing"""
+    name = None
+
+    def digest(self, data):
+        """Return at least 16 bytes of hash output for the given bytes"""
+        raise NotImplementedError
+
+    @stage_timer.timed('hash')
+    def hash_pair(self, element):
+        """Return (h1, h2) for an element; h2 is forced odd so strides never collapse"""
+        digest = self.digest(str(element).encode('utf-8'))
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        return h1, h2
+
+    @stage_timer.timed('hash')
+    def hash_pairs(self, elements):
+        """Vectorized hash_pair: return uint64 arrays (h1, h2) for a batch of elements"""
+        digest = self.digest
+        joined = b''.join([digest(str(element).encode('utf-8'))[:16] for element in elements])
+        pairs = np.frombuffer(joined, dtype='<u8').reshape(-1, 2).astype(np.uint64)
+        return pairs[:, 0], pairs[:, 1] | np.uint64(1)
+
+class Blake2bEngine(HashEngine):
+    name = 'blake2b'
+
+    def digest(self, data):
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+class MD5Engine(HashEngine):
+    name = 'md5'
+
+    def digest(self, data):
+        return hashlib.md5(data).digest()
+
+class Murmur3Engine(HashEngine):
+    name = 'murmur3'
+
+    def digest(self, data):
+        return murmur3_128(data)
+
+class XXHashEngine(HashEngine):
+    name = 'xxhash'
+
+    def digest(self, data):
+        return xxhash.xxh3_128_digest(data)
+
+HASH_ENGINES = {engine.name: engine for engine in (Blake2bEngine(), MD5Engine(), Murmur3Engine())}
+if xxhash is not None:
+    HASH_ENGINES[XXHashEngine.name] = XXHashEngine()
+
+DEFAULT_HASH_ENGINE = 'blake2b'
+
+# Rough per-element cost of exact-mode tracking (a short str object)
+_TRACKED_ELEMENT_BYTES = 60
+
+def get_hash_engine(engine):
+    """Look up a hash engine by name (engine instances are passed through)"""
+    if isinstance(engine, HashEngine):
+        return engine
+    try:
+        return HASH_ENGINES[engine]
+    except KeyError:
+        raise ValueError(f"Unknown hash engine '{engine}', choose from {sorted(HASH_ENGINES)}")
+
+class PackedCounterArray:
+    """4-bit saturating counters packed two per byte in a NumPy uint8 buffer.
+
+    Item access and unpack() expose the counters as a bit array (1 where the counter
+    is non-zero) so the renderers can draw counting filters like plain ones.
+    """
+    MAX_COUNT = 15
+
+    def __init__(self, size):
+        self.size = size
+        self.counters = np.zeros((size + 1) // 2, dtype=np.uint8)
+        # Running number of non-zero counters, kept by _update
+        self._nonzero = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        return 1 if self.get_count(index) else 0
+
+    def get_count(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError('counter index out of range')
+        return int(self.counters[index >> 1] >> ((index & 1) * 4)) & 0xF
+
+    def counts(self, start=0, stop=None):
+        """Return counters[start:stop] as a uint8 array"""
+        stop = self.size if stop is None else min(stop, self.size)
+        if start >= stop:
+            return np.zeros(0, dtype=np.uint8)
+        chunk = self.counters[start >> 1:(stop + 1) >> 1]
+        nibbles = np.stack([chunk & 0xF, chunk >> 4], axis=1).ravel()
+        offset = start & 1
+        return nibbles[offset:offset + stop - start]
+
+    def unpack(self, start=0, stop=None):
+        """Return the non-zero mask of counters[start:stop] as 0s and 1s"""
+        return (self.counts(start, stop) > 0).astype(np.uint8)
+
+    @stage_timer.timed('bits')
+    def increment(self, indices):
+        """Add one per occurrence of each index, saturating at MAX_COUNT"""
+        self._update(indices, 1)
+
+    @stage_timer.timed('bits')
+    def decrement(self, indices):
+        """Subtract one per occurrence of each index; saturated counters stay put"""
+        self._update(indices, -1)
+
+    @stage_timer.timed('bits')
+    def test_indices(self, indices):
+        """Return a boolean array, shaped like indices, of which counters are non-zero"""
+        indices = np.asarray(indices, dtype=np.uint64)
+        byte_index = (indices >> np.uint64(1)).astype(np.intp)
+        shifts = ((indices & np.uint64(1)) * np.uint64(4)).astype(np.uint8)
+        return ((self.counters[byte_index] >> shifts) & 0xF) > 0
+
+    def packed_bits(self):
+        """Non-zero mask of the counters as a little-endian packed uint8 array"""
+        return np.packbits(self.unpack(), bitorder='little')
+
+    def count(self):
+        """Number of non-zero counters"""
+        return self._nonzero
+
+    @property
+    def nbytes(self):
+        return self.counters.nbytes
+
+    def _update(self, indices, sign):
+        indices = np.sort(np.asarray(indices, dtype=np.int64).ravel())
+        if indices.size == 0:
+            return
+        # Collapse repeated indices into (index, occurrences)
+        starts = np.flatnonzero(np.r_[True, indices[1:] != indices[:-1]])
+        unique = indices[starts]
+        occurrences = np.diff(np.r_[starts, indices.size])
+        # Even and odd indices live in different nibbles; handling them separately
+        # keeps byte indices unique within each fancy-indexed write
+        for parity in (0, 1):
+            selected = (unique & 1) == parity
+            byte_index = unique[selected] >> 1
+            shift = 4 * parity
+            current = (self.counters[byte_index].astype(np.int64) >> shift) & 0xF
+            updated = np.clip(current + sign * occurrences[selected], 0, self.MAX_COUNT)
+            if sign < 0:
+                updated = np.where(current == self.MAX_COUNT, current, updated)
+            self._nonzero += int(np.count_nonzero(updated > 0) - np.count_nonzero(current > 0))
+            keep = self.counters[byte_index] & np.uint8(0xF0 >> shift)
+            self.counters[byte_index] = keep | (updated.astype(np.uint8) << shift)
+
+# Process-wide change stamps: every mutation gives a filter a new, larger generation,
+# so (filter, generation) identifies one state of its bits for caching and ETags
+_generation_counter = itertools.count(1)
+
+def _next_generation():
+    return next(_generation_counter)
+
+# On-disk filter format: a 64-byte little-endian header followed by the packed bits.
+#   magic (4s) | version (H) | flags (H) | size in bits (Q) | num_hashes (I) | block bits (I)
+#   | insertions (Q) | hash engine name (16s) | padding (16x)
+FILTER_FILE_MAGIC = b'TBLF'
+FILTER_FILE_VERSION = 1
+FILTER_FILE_HEADER = struct.Struct('<4sHHQIIQ16s16x')
+# Flag bit for a cache-blocked layout; the block size is then stored in the block bits field
+FILTER_FILE_BLOCKED = 0x1
+
+class BloomFilter:
+    """Bloom filter over a packed bit array.
+
+    With track_elements=True (the teaching demo) every added element is also kept
+    in added_elements so exact counts and accuracy can be shown. Production mode
+    (track_elements=False) keeps no elements: it counts insertions and estimates
+    cardinality and false positive rate from the bits themselves.
+    """
+    def __init__(self, size, num_hashes, hash_engine=DEFAULT_HASH_ENGINE, track_elements=True,
+                 bit_array=None):
+        if size < 1:
+            raise ValueError('size must be at least 1')
+        if num_hashes < 1:
+            raise ValueError('num_hashes must be at least 1')
+        self.size = size
+        self.num_hashes = num_hashes
+        self.bit_array = bit_array if bit_array is not None else PackedBitArray(size)
+        self.added_elements = set() if track_elements else None
+        self.insertions = 0
+        self.hash_engine = get_hash_engine(hash_engine)
+        self.generation = _next_generation()
+        # Generation that last changed each 64-bit word, once enable_change_tracking() is called
+        self.word_generations = None
+        # Backing file when opened with BloomFilter.open()
+        self.path = None
+        self.writable = True
+    
+    def add(self, element):
+        """Add an element to the Bloom filter"""
+        self._check_writable()
+        if self.added_elements is not None:
+            self.added_elements.add(element)
+        self.insertions += 1
+        self.generation = _next_generation()
+        self._insert_positions(self.get_hash_positions(element))
+    
+    def contains(self, element):
+        """Check if an element might be in the Bloom filter"""
+        for index in self.get_hash_positions(element):
+            if self.bit_array[index] == 0:
+                return False
+        return True
+    
+    def add_many(self, elements):
+        """Add a batch of elements; returns which ones were (possibly) present beforehand"""
+        elements = list(elements)
+        return self._add_hashed(elements, *self.hash_engine.hash_pairs(elements))
+    
+    def contains_many(self, elements):
+        """Check a batch of elements at once; returns a boolean array"""
+        return self._contains_hashed(*self.hash_engine.hash_pairs(list(elements)))
+    
+    def _add_hashed(self, elements, h1, h2):
+        """add_many() for elements whose (h1, h2) hashes are already known"""
+        self._check_writable()
+        indices = self._indices(h1, h2)
+        was_present = self.bit_array.test_indices(indices).all(axis=1)
+        self.generation = _next_generation()
+        self._insert_indices(indices)
+        if self.added_elements is not None:
+            self.added_elements.update(elements)
+        self.insertions += len(elements)
+        return was_present
+    
+    def _contains_hashed(self, h1, h2):
+        return self.bit_array.test_indices(self._indices(h1, h2)).all(axis=1)
+    
+    def changed_bits(self, elements):
+        """Sorted positions that adding elements would turn on (call before adding them)"""
+        indices = self._batch_indices(list(elements)).ravel()
+        return np.unique(indices[~self.bit_array.test_indices(indices)]).tolist()
+    
+    def get_hash_positions(self, element):
+        """Get the hash positions for an element (Kirsch-Mitzenmacher double hashing)"""
+        h1, h2 = self.hash_engine.hash_pair(element)
+        return [((h1 + i * h2) & _MASK64) % self.size for i in range(self.num_hashes)]
+    
+    def _insert_indices(self, indices):
+        """Record positions for newly added elements; returns the positions newly set"""
+        new = self.bit_array.set_indices(indices)
+        if self.word_generations is not None:
+            self.word_generations[(new >> np.uint64(6)).astype(np.intp)] = self.generation
+        return new
+    
+    def _insert_positions(self, positions):
+        """_insert_indices() for one element's positions as Python ints (the scalar add path)"""
+        new = self.bit_array.set_positions(positions)
+        if self.word_generations is not None:
+            for index in new:
+                self.word_generations[index >> 6] = self.generation
+        return new
+    
+    def _check_writable(self):
+        if not self.writable:
+            raise ValueError(f"Bloom filter file '{self.path}' is open read-only")
+    
+    def _batch_indices(self, elements):
+        """(n, k) uint64 array of hash positions for a batch of elements"""
+        h1, h2 = self.hash_engine.hash_pairs(elements)
+        return self._indices(h1, h2)
+    
+    def _indices(self, h1, h2):
+        """Double hashing over uint64 arrays; wraps mod 2**64 like get_hash_positions"""
+        steps = np.arange(self.num_hashes, dtype=np.uint64)
+        return (h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(self.size)
+    
+    def memory_usage(self):
+        """Approximate bytes held by this filter (bits plus any tracked elements)"""
+        usage = self.bit_array.nbytes
+        if self.word_generations is not None:
+            usage += self.word_generations.nbytes
+        if self.added_elements is not None:
+            # Set table plus a typical short-string element
+            usage += sys.getsizeof(self.added_elements) + len(self.added_elements) * _TRACKED_ELEMENT_BYTES
+        return usage
+    
+    @property
+    def track_elements(self):
+        return self.added_elements is not None
+    
+    @property
+    def element_count(self):
+        """Exact number of distinct elements, or the bit-based estimate in production mode"""
+        if self.added_elements is not None:
+            return len(self.added_elements)
+        return int(round(self.estimated_count()))
+    
+    def fill_ratio(self):
+        """Fraction of bits currently set"""
+        return self.bit_array.count() / self.size
+    
+    def estimated_count(self):
+        """Estimate distinct elements from the set bits (Swamidass-Baldi estimator)"""
+        set_bits = self.bit_array.count()
+        if set_bits >= self.size:
+            # Saturated filter: the estimator diverges, fall back to the insertion counter
+            return float(self.insertions)
+        return -(self.size / self.num_hashes) * math.log1p(-set_bits / self.size)
+    
+    def get_false_positive_rate(self):
+        """Calculate false positive rate (theoretical in exact mode, from the fill ratio otherwise)"""
+        if self.added_elements is None:
+            return self.fill_ratio() ** self.num_hashes
+        
+        return self.expected_false_positive_rate(len(self.added_elements))
+    
+    def expected_false_positive_rate(self, count):
+        """Theoretical false positive rate once count distinct elements have been added"""
+        if count == 0:
+            return 0.0
+        
+        # Calculate probability of a bit being set
+        p = 1 - (1 - 1/self.size) ** (self.num_hashes * count)
+        
+        # False positive rate is p^k where k is number of hash functions
+        return p ** self.num_hashes
+    
+    def _check_compatible(self, other):
+        """Raise ValueError unless other has the same type and bit layout as this filter"""
+        if type(other) is not type(self):
+            raise ValueError(f'Cannot combine a {type(self).__name__} with a {type(other).__name__}')
+        if not isinstance(self.bit_array, PackedBitArray):
+            raise ValueError('Only bit-array filters can be combined bitwise')
+        if self._layout() != other._layout():
+            raise ValueError('Filters must have the same size, hash count and hash engine to be combined')
+    
+    def _layout(self):
+        return self.size, self.num_hashes, self.hash_engine.name
+    
+    def _empty_like(self, track_elements):
+        return type(self)(self.size, self.num_hashes, self.hash_engine, track_elements=track_elements)
+    
+    def union(self, other):
+        """New filter holding everything in either filter (bitwise OR)"""
+        self._check_compatible(other)
+        track = self.added_elements is not None and other.added_elements is not None
+        result = self._empty_like(track)
+        np.bitwise_or(self.bit_array.bits, other.bit_array.bits, out=result.bit_array.bits)
+        result.bit_array.adjust_count(_popcount(result.bit_array.bits))
+        result._bits_rewritten()
+        if track:
+            result.added_elements = self.added_elements | other.added_elements
+        result.insertions = self.insertions + other.insertions
+        return result
+    
+    def intersection(self, other):
+        """New filter answering 'might be present' only where both filters do (bitwise AND).
+
+        This can report more false positives than a filter built from the common
+        elements alone, since bits set by different elements may coincide.
+        """
+        self._check_compatible(other)
+        track = self.added_elements is not None and other.added_elements is not None
+        result = self._empty_like(track)
+        np.bitwise_and(self.bit_array.bits, other.bit_array.bits, out=result.bit_array.bits)
+        result.bit_array.adjust_count(_popcount(result.bit_array.bits))
+        result._bits_rewritten()
+        if track:
+            result.added_elements = self.added_elements & other.added_elements
+        result.insertions = min(self.insertions, other.insertions)
+        return result
+    
+    def update(self, other):
+        """Merge other into this filter in place (bitwise OR)"""
+        self._check_writable()
+        self._check_compatible(other)
+        if self.added_elements is not None:
+            if other.added_elements is None:
+                raise ValueError('Cannot merge a production-mode filter into an exact-mode one')
+            self.added_elements |= other.added_elements
+        self.generation = _next_generation()
+        added = other.bit_array.bits & ~self.bit_array.bits
+        self._mark_changed(added)
+        np.bitwise_or(self.bit_array.bits, other.bit_array.bits, out=self.bit_array.bits)
+        self.bit_array.adjust_count(_popcount(added))
+        self._bits_rewritten()
+        self.insertions += other.insertions
+    
+    def intersection_update(self, other):
+        """Keep only the bits also set in other, in place (bitwise AND)"""
+        self._check_writable()
+        self._check_compatible(other)
+        if self.added_elements is not None and other.added_elements is not None:
+            self.added_elements &= other.added_elements
+        self.generation = _next_generation()
+        cleared = self.bit_array.bits & ~other.bit_array.bits
+        self._mark_changed(cleared)
+        np.bitwise_and(self.bit_array.bits, other.bit_array.bits, out=self.bit_array.bits)
+        self.bit_array.adjust_count(-_popcount(cleared))
+        self._bits_rewritten()
+        self.insertions = min(self.insertions, other.insertions)
+    
+    def enable_change_tracking(self):
+        """Start recording which 64-bit words change, for export_delta(since > 0).
+
+        Costs one 8-byte generation stamp per 64 bits, doubling the filter's memory.
+        Words already set are stamped with the current generation.
+        """
+        if not isinstance(self.bit_array, PackedBitArray):
+            raise ValueError('Only bit-array filters support change tracking')
+        if self.word_generations is None:
+            self.word_generations = np.zeros(self.bit_array.num_words, dtype=np.uint64)
+            self.word_generations[self.bit_array.nonzero_words()] = self.generation
+    
+    def _bits_rewritten(self):
+        """Called after the bits were changed wholesale rather than through _insert_indices"""
+    
+    def _mark_changed(self, changed_bytes):
+        """Stamp the words containing any nonzero byte of a bytewise change mask"""
+        if self.word_generations is not None:
+            self.word_generations[np.unique(np.flatnonzero(changed_bytes) >> 3)] = self.generation
+    
+    def export_delta(self, since=0):
+        """Words changed after generation `since`, as (word indices, 64-bit words) uint64 arrays.
+
+        since=0 exports every nonzero word and works without change tracking; later
+        generations need enable_change_tracking(). Deltas only carry set bits, so they
+        replicate adds and unions; apply them with import_delta().
+        """
+        if not isinstance(self.bit_array, PackedBitArray):
+            raise ValueError('Only bit-array filters can export deltas')
+        if self.word_generations is not None:
+            indices = np.flatnonzero(self.word_generations > np.uint64(since))
+        elif since == 0:
+            indices = self.bit_array.nonzero_words()
+        else:
+            raise ValueError('Change tracking is off: export with since=0 or enable change tracking first')
+        return indices.astype(np.uint64), self.bit_array.words(indices)
+    
+    def import_delta(self, word_indices, words):
+        """OR words exported by a filter with the same layout into this one"""
+        self._check_writable()
+        if not isinstance(self.bit_array, PackedBitArray):
+            raise ValueError('Only bit-array filters can import deltas')
+        if self.added_elements is not None:
+            raise ValueError('Deltas carry no elements; import them into production-mode filters')
+        word_indices = np.asarray(word_indices, dtype=np.uint64)
+        if word_indices.size and int(word_indices.max()) >= self.bit_array.num_words:
+            raise ValueError('Delta word index out of range for this filter')
+        self.generation = _next_generation()
+        self.bit_array.or_words(word_indices, words)
+        self._bits_rewritten()
+        if self.word_generations is not None:
+            self.word_generations[word_indices.astype(np.intp)] = self.generation
+    
+    def snapshot(self, path):
+        """Write the filter to path in the on-disk format (atomically replaces the file)"""
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(self._file_header())
+            f.write(memoryview(np.ascontiguousarray(self.bit_array.bits)))
+        os.replace(tmp_path, path)
+    
+    def flush(self):
+        """Persist a writable file-backed filter: bits first, then the header count"""
+        if self.path is None or not self.writable:
+            return
+        self.bit_array.bits.flush()
+        with open(self.path, 'r+b') as f:
+            f.write(self._file_header())
+    
+    @classmethod
+    def for_capacity(cls, capacity, error_rate, hash_engine=DEFAULT_HASH_ENGINE, track_elements=True):
+        """Filter sized by plan_filter() to hold capacity elements at error_rate"""
+        plan = plan_filter(capacity, error_rate)
+        return cls(plan['size'], plan['num_hashes'], hash_engine, track_elements=track_elements)
+    
+    @classmethod
+    def open(cls, path, mode='r'):
+        """Open a filter file without copying its bits.
+
+        The bit array is a numpy.memmap over the file, so opening is instant and
+        read-only ('r') maps share the page cache across worker processes. Use
+        'r+' for the single writer and call flush() to persist its changes.
+        Opened filters are in production mode (no element set is stored). A file
+        written by a BlockedBloomFilter opens as one.
+        """
+        if mode not in ('r', 'r+'):
+            raise ValueError("mode must be 'r' or 'r+'")
+        with open(path, 'rb') as f:
+            header = f.read(FILTER_FILE_HEADER.size)
+        if len(header) < FILTER_FILE_HEADER.size:
+            raise ValueError(f'{path} is too short to be a Bloom filter file')
+        magic, version, flags, size, num_hashes, block_bits, insertions, engine = FILTER_FILE_HEADER.unpack(header)
+        if magic != FILTER_FILE_MAGIC:
+            raise ValueError(f'{path} is not a Bloom filter file')
+        if version != FILTER_FILE_VERSION:
+            raise ValueError(f'Unsupported Bloom filter file version {version}')
+        if flags & ~FILTER_FILE_BLOCKED:
+            raise ValueError(f'Unsupported Bloom filter file flags {flags:#x}')
+        
+        layout = {}
+        filter_class = BloomFilter
+        if flags & FILTER_FILE_BLOCKED:
+            filter_class = BlockedBloomFilter
+            layout['block_bits'] = block_bits
+        if not issubclass(filter_class, cls):
+            raise ValueError(f'{path} holds a {filter_class.__name__}, not a {cls.__name__}')
+        
+        bits = np.memmap(path, dtype=np.uint8, mode=mode, offset=FILTER_FILE_HEADER.size,
+                         shape=(packed_nbytes(size),))
+        bloom_filter = filter_class(size, num_hashes, engine.rstrip(b'\0').decode('ascii'),
+                                    track_elements=False, bit_array=PackedBitArray(size, bits), **layout)
+        bloom_filter.insertions = insertions
+        bloom_filter.path = path
+        bloom_filter.writable = (mode == 'r+')
+        return bloom_filter
+    
+    def _file_header(self):
+        if not isinstance(self.bit_array, PackedBitArray):
+            raise ValueError(f'A {type(self).__name__} cannot be saved as a filter file')
+        engine = self.hash_engine.name.encode('ascii')
+        if len(engine) > 16:
+            raise ValueError(f"Hash engine name '{self.hash_engine.name}' is too long to store")
+        flags, block_bits = self._file_layout()
+        return FILTER_FILE_HEADER.pack(FILTER_FILE_MAGIC, FILTER_FILE_VERSION, flags, self.size,
+                                       self.num_hashes, block_bits, self.insertions, engine)
+    
+    def _file_layout(self):
+        """Header (flags, block bits) describing how positions map onto the bits"""
+        return 0, 0
+
+class CountingBloomFilter(BloomFilter):
+    """Bloom filter over 4-bit counters, so elements can be removed (un-swipes)"""
+    def __init__(self, size, num_hashes, hash_engine=DEFAULT_HASH_ENGINE, track_elements=True):
+        super().__init__(size, num_hashes, hash_engine, track_elements=track_elements,
+                         bit_array=PackedCounterArray(size))
+    
+    def _insert_indices(self, indices):
+        self.bit_array.increment(indices)
+    
+    def _insert_positions(self, positions):
+        self.bit_array.increment(positions)
+    
+    def remove(self, element):
+        """Remove an element; returns False (and changes nothing) if it is definitely absent.
+
+        In exact mode only elements that were actually added are removed: decrementing
+        the counters of a false positive would take them away from other elements and
+        turn those into false negatives.
+        """
+        if self.added_elements is not None and element not in self.added_elements:
+            return False
+        if not self.contains(element):
+            return False
+        self.bit_array.decrement(self.get_hash_positions(element))
+        if self.added_elements is not None:
+            self.added_elements.discard(element)
+        self.insertions = max(0, self.insertions - 1)
+        self.generation = _next_generation()
+        return True
+    
+    def remove_many(self, elements):
+        """Remove a batch of elements; returns which ones were (possibly) present and removed"""
+        elements = list(elements)
+        indices = self._batch_indices(elements)
+        present = self.bit_array.test_indices(indices).all(axis=1)
+        if self.added_elements is not None:
+            # As in remove(): only added elements, and each of them once
+            removed = set()
+            for i, element in enumerate(elements):
+                present[i] = present[i] and element in self.added_elements and element not in removed
+                if present[i]:
+                    removed.add(element)
+        self.bit_array.decrement(indices[present])
+        if self.added_elements is not None:
+            self.added_elements.difference_update(e for e, p in zip(elements, present) if p)
+        self.insertions = max(0, self.insertions - int(present.sum()))
+        if present.any():
+            self.generation = _next_generation()
+        return present
+
+def _aligned_zeros(nbytes, alignment=64):
+    """Zeroed uint8 array whose first byte sits on an alignment-byte boundary"""
+    buffer = np.zeros(nbytes + alignment, dtype=np.uint8)
+    offset = -buffer.ctypes.data % alignment
+    return buffer[offset:offset + nbytes]
+
+def _block_salts(count):
+    """Fixed odd 64-bit multipliers (a splitmix64 sequence), one per in-block hash"""
+    salts = []
+    state = 0
+    for _ in range(count):
+        state = (state + 0x9e3779b97f4a7c15) & _MASK64
+        z = state
+        z = ((z ^ (z >> 30)) * 0xbf58476d1ce4e5b9) & _MASK64
+        z = ((z ^ (z >> 27)) * 0x94d049bb133111eb) & _MASK64
+        salts.append((z ^ (z >> 31)) | 1)
+    return salts
+
+class BlockedBloomFilter(BloomFilter):
+    """Cache-blocked (split) Bloom filter.
+
+    The bit array is divided into blocks of block_bits bits (512 = one 64-byte cache
+    line, aligned in memory). An element's first hash picks a block and all k bits
+    are placed inside it, so every add or lookup touches a single cache line. The
+    size is rounded up to a whole number of blocks.
+    """
+    def __init__(self, size, num_hashes, hash_engine=DEFAULT_HASH_ENGINE, track_elements=True, block_bits=512,
+                 bit_array=None):
+        if block_bits < 8 or block_bits & (block_bits - 1):
+            raise ValueError('block_bits must be a power of two and at least 8')
+        if num_hashes > block_bits:
+            raise ValueError('num_hashes cannot exceed block_bits')
+        self.block_bits = block_bits
+        self.num_blocks = max(1, -(-size // block_bits))
+        self._offset_shift = 64 - (block_bits.bit_length() - 1)
+        self._salts = _block_salts(num_hashes)
+        size = self.num_blocks * block_bits
+        empty = bit_array is None
+        if empty:
+            bit_array = PackedBitArray(size, _aligned_zeros(packed_nbytes(size)))
+        elif len(bit_array) != size:
+            raise ValueError('bit_array must hold a whole number of blocks')
+        super().__init__(size, num_hashes, hash_engine, track_elements=track_elements, bit_array=bit_array)
+        # False positive rate of a lookup landing in a block with c bits set, for c = 0..block_bits
+        self._block_rates = (np.arange(block_bits + 1) / block_bits) ** num_hashes
+        # Set bits per block and how many blocks have each count, kept up to date by
+        # _insert_indices; None until first needed or after a wholesale change
+        self._block_counts = None
+        self._count_histogram = None
+        if empty:
+            self._block_counts = np.zeros(self.num_blocks, dtype=np.int64)
+            self._count_histogram = np.bincount(self._block_counts, minlength=block_bits + 1)
+    
+    def get_hash_positions(self, element):
+        """Hash positions for an element, all inside the block chosen by h1"""
+        h1, h2 = self.hash_engine.hash_pair(element)
+        base = (h1 % self.num_blocks) * self.block_bits
+        # Multiply-shift: the top bits of h2 * salt_i pick each bit within the block
+        return [base + (((h2 * salt) & _MASK64) >> self._offset_shift) for salt in self._salts]
+    
+    def _indices(self, h1, h2):
+        base = (h1 % np.uint64(self.num_blocks)) * np.uint64(self.block_bits)
+        salts = np.array(self._salts, dtype=np.uint64)
+        offsets = (h2[:, None] * salts[None, :]) >> np.uint64(self._offset_shift)
+        return base[:, None] + offsets
+    
+    def _layout(self):
+        return super()._layout() + (self.block_bits,)
+    
+    def _file_layout(self):
+        return FILTER_FILE_BLOCKED, self.block_bits
+    
+    def _empty_like(self, track_elements):
+        return BlockedBloomFilter(self.size, self.num_hashes, self.hash_engine,
+                                  track_elements=track_elements, block_bits=self.block_bits)
+    
+    def _insert_indices(self, indices):
+        new = super()._insert_indices(indices)
+        if self._block_counts is not None and len(new):
+            blocks, added = np.unique(new // np.uint64(self.block_bits), return_counts=True)
+            blocks = blocks.astype(np.intp)
+            before = self._block_counts[blocks]
+            self._block_counts[blocks] = before + added
+            np.subtract.at(self._count_histogram, before, 1)
+            np.add.at(self._count_histogram, before + added, 1)
+        return new
+    
+    def _insert_positions(self, positions):
+        new = super()._insert_positions(positions)
+        if self._block_counts is not None:
+            for index in new:
+                block = index // self.block_bits
+                before = int(self._block_counts[block])
+                self._block_counts[block] = before + 1
+                self._count_histogram[before] -= 1
+                self._count_histogram[before + 1] += 1
+        return new
+    
+    def _bits_rewritten(self):
+        self._block_counts = self._count_histogram = None
+    
+    def _block_stats(self):
+        """(set bits per block, number of blocks per set-bit count)"""
+        if self._block_counts is not None:
+            return self._block_counts, self._count_histogram
+        bits = self.bit_array.bits
+        if not hasattr(np, 'bitwise_count'):  # NumPy < 2.0
+            counts = _POPCOUNT[bits].reshape(self.num_blocks, -1).sum(axis=1, dtype=np.int64)
+        else:
+            # Blocks of 64 bits or more are whole words, so count them eight bytes at a time
+            words = bits.view(np.uint64) if self.block_bits >= 64 else bits
+            counts = np.bitwise_count(words).reshape(self.num_blocks, -1).sum(axis=1, dtype=np.int64)
+        histogram = np.bincount(counts, minlength=self.block_bits + 1)
+        # A read-only map can be changed underneath by the writer, so it is never cached
+        if self.bit_array.bits.flags.writeable:
+            self._block_counts, self._count_histogram = counts, histogram
+        return counts, histogram
+    
+    def block_fill(self):
+        """Fraction of bits set in each block"""
+        return self._block_stats()[0] / self.block_bits
+    
+    def get_false_positive_rate(self):
+        """False positive rate accounting for uneven block loads"""
+        if self.added_elements is None:
+            # A lookup lands in one block, so average the per-block rates
+            histogram = self._block_stats()[1]
+            return float(histogram @ self._block_rates) / self.num_blocks
+        return self.expected_false_positive_rate(len(self.added_elements))
+    
+    def expected_false_positive_rate(self, count):
+        """Theoretical false positive rate accounting for uneven block loads"""
+        if count == 0:
+            return 0.0
+        # Block loads are ~Poisson(count / num_blocks) (Putze, Sanders & Singler, 2007).
+        # Sum the loads within 10 standard deviations, with the pmf in log space so
+        # heavily loaded blocks do not underflow exp(-load).
+        load = count / self.num_blocks
+        spread = 10 * math.sqrt(load) + 10
+        rate = 0.0
+        for i in range(max(0, int(load - spread)), int(load + spread) + 1):
+            probability = math.exp(i * math.log(load) - load - math.lgamma(i + 1))
+            set_fraction = 1 - (1 - 1 / self.block_bits) ** (self.num_hashes * i)
+            rate += probability * set_fraction ** self.num_hashes
+        return rate
+
+class TimeDecayingBloomFilter:
+    """Bloom filter whose entries expire after a time window.
+
+    The window is split into rotating generations, each a plain production-mode
+    Bloom filter. New swipes go into the newest generation and lookups check all
+    of them; every window_seconds / generations the oldest generation is dropped
+    and a fresh one started, so expiry costs one allocation instead of a rebuild.
+    An entry disappears between window * (generations - 1) / generations and
+    window seconds after it was added.
+    """
+    def __init__(self, size, num_hashes, window_seconds=90 * 24 * 3600, generations=3,
+                 hash_engine=DEFAULT_HASH_ENGINE, clock=time.time):
+        if generations < 1:
+            raise ValueError('generations must be at least 1')
+        if window_seconds <= 0:
+            raise ValueError('window_seconds must be positive')
+        self.generation_size = size
+        self.generation_hashes = num_hashes
+        self.window_seconds = window_seconds
+        self.generation_seconds = window_seconds / generations
+        self.hash_engine = get_hash_engine(hash_engine)
+        self.clock = clock
+        # Newest generation first
+        self.slices = [self._new_generation() for _ in range(generations)]
+        self.rotated_at = clock()
+    
+    def _new_generation(self):
+        return BloomFilter(self.generation_size, self.generation_hashes, self.hash_engine, track_elements=False)
+    
+    def rotate(self, steps=1):
+        """Drop the oldest generation(s) and start fresh ones"""
+        for _ in range(min(steps, len(self.slices))):
+            self.slices.pop()
+            self.slices.insert(0, self._new_generation())
+    
+    def expire(self):
+        """Rotate once for every generation period that has elapsed"""
+        elapsed = self.clock() - self.rotated_at
+        steps = int(elapsed // self.generation_seconds)
+        if steps > 0:
+            self.rotate(steps)
+            self.rotated_at += steps * self.generation_seconds
+        return steps
+    
+    def add(self, element):
+        self.expire()
+        self.slices[0].add(element)
+    
+    def add_many(self, elements):
+        """Add a batch of elements; returns which ones were (possibly) present beforehand"""
+        elements = list(elements)
+        was_present = self.contains_many(elements)
+        self.slices[0].add_many(elements)
+        return was_present
+    
+    def contains(self, element):
+        self.expire()
+        return any(s.contains(element) for s in self.slices)
+    
+    def contains_many(self, elements):
+        self.expire()
+        elements = list(elements)
+        found = np.zeros(len(elements), dtype=bool)
+        for s in self.slices:
+            found |= s.contains_many(elements)
+        return found
+    
+    def get_hash_positions(self, element):
+        """Hash positions of an element in each generation (identical, since they share a layout)"""
+        return [s.get_hash_positions(element) for s in self.slices]
+    
+    @property
+    def size(self):
+        return sum(s.size for s in self.slices)
+    
+    @property
+    def num_hashes(self):
+        return self.generation_hashes
+    
+    @property
+    def insertions(self):
+        return sum(s.insertions for s in self.slices)
+    
+    @property
+    def generation(self):
+        """Changes on every add and rotation (rotations bring in freshly stamped generations)"""
+        return max(s.generation for s in self.slices)
+    
+    @property
+    def track_elements(self):
+        return False
+    
+    @property
+    def element_count(self):
+        return sum(s.element_count for s in self.slices)
+    
+    def describe_slices(self):
+        """One label per generation for the visualizations"""
+        labels = []
+        for i, s in enumerate(self.slices):
+            age = 'current' if i == 0 else f'{i * self.generation_seconds / 3600:g}h old'
+            labels.append(f"Generation {i + 1} ({age}): ~{s.element_count} profiles")
+        return labels
+    
+    def get_false_positive_rate(self):
+        """Chance that any live generation reports a false hit"""
+        miss = 1.0
+        for s in self.slices:
+            miss *= 1 - s.get_false_positive_rate()
+        return 1 - miss
+    
+    def memory_usage(self):
+        return sum(s.memory_usage() for s in self.slices)
+    
+    def flush(self):
+        """Time-decaying filters live in memory only"""
+
+def optimal_size(capacity, error_rate):
+    """Bits needed to hold capacity elements at the given false positive rate"""
+    return max(1, math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+
+def optimal_num_hashes(size, capacity):
+    """Hash count that minimises the false positive rate for size bits and capacity elements"""
+    return max(1, round(size / capacity * math.log(2)))
+
+def plan_filter(capacity, error_rate):
+    """Size a Bloom filter for capacity elements at a target false positive rate.
+
+    Returns the optimal size m = -n ln p / (ln 2)^2 and hash count k = (m / n) ln 2,
+    plus the memory they cost and the false positive rate the rounded m and k give.
+    """
+    if not math.isfinite(capacity) or capacity < 1:
+        raise ValueError('capacity must be a finite number of at least 1')
+    if not 0 < error_rate < 1:
+        raise ValueError('error_rate must be between 0 and 1')
+    size = optimal_size(capacity, error_rate)
+    num_hashes = optimal_num_hashes(size, capacity)
+    return {
+        'capacity': capacity,
+        'error_rate': error_rate,
+        'size': size,
+        'num_hashes': num_hashes,
+        'bits_per_element': size / capacity,
+        'memory_bytes': packed_nbytes(size),
+        'expected_fp_rate': (1 - math.exp(-num_hashes * capacity / size)) ** num_hashes
+    }
+
+def plan_grid(capacities, error_rates):
+    """plan_filter() over every (capacity, error_rate) pair at once.
+
+    Returns a dict of 2-D arrays indexed [capacity, error_rate], computed with NumPy
+    broadcasting so dashboards can tabulate thousands of plans per request.
+    """
+    n = np.asarray(capacities, dtype=np.float64).reshape(-1, 1)
+    p = np.asarray(error_rates, dtype=np.float64).reshape(1, -1)
+    # Comparisons with NaN are all false, so test for what is valid and negate
+    if not (np.isfinite(n) & (n >= 1)).all():
+        raise ValueError('capacities must be finite numbers of at least 1')
+    if not ((p > 0) & (p < 1)).all():
+        raise ValueError('error rates must be between 0 and 1')
+    size = np.maximum(1, np.ceil(-n * np.log(p) / np.log(2) ** 2))
+    num_hashes = np.maximum(1, np.round(size / n * np.log(2)))
+    return {
+        'capacity': np.broadcast_to(n, size.shape).astype(np.int64),
+        'error_rate': np.broadcast_to(p, size.shape),
+        'size': size.astype(np.int64),
+        'num_hashes': num_hashes.astype(np.int64),
+        'bits_per_element': size / n,
+        'memory_bytes': np.ceil(size / 8).astype(np.int64),
+        'expected_fp_rate': (1 - np.exp(-num_hashes * n / size)) ** num_hashes
+    }
+
+class ScalableBloomFilter:
+    """Bloom filter that grows by chaining slices (Almeida et al., 2007).
+
+    Slice i holds initial_capacity * growth_factor**i elements at an error rate of
+    error_rate * (1 - tightening_ratio) * tightening_ratio**i, so the compound false
+    positive rate stays below error_rate however many slices get added. A new slice
+    is started once the current one reaches its capacity.
+    """
+    def __init__(self, initial_capacity=100, error_rate=0.01, growth_factor=2, tightening_ratio=0.85,
+                 hash_engine=DEFAULT_HASH_ENGINE, track_elements=True):
+        if initial_capacity < 1:
+            raise ValueError('initial_capacity must be at least 1')
+        if not 0 < error_rate < 1:
+            raise ValueError('error_rate must be between 0 and 1')
+        if growth_factor < 1:
+            raise ValueError('growth_factor must be at least 1')
+        if not 0 < tightening_ratio < 1:
+            raise ValueError('tightening_ratio must be between 0 and 1')
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.growth_factor = growth_factor
+        self.tightening_ratio = tightening_ratio
+        self.hash_engine = get_hash_engine(hash_engine)
+        self.added_elements = set() if track_elements else None
+        self.slices = []
+        self.capacities = []
+        self._add_slice()
+        self.generation = _next_generation()
+    
+    def _add_slice(self):
+        i = len(self.slices)
+        capacity = int(self.initial_capacity * self.growth_factor ** i)
+        slice_error = self.error_rate * (1 - self.tightening_ratio) * self.tightening_ratio ** i
+        self.slices.append(BloomFilter.for_capacity(capacity, slice_error, self.hash_engine, track_elements=False))
+        self.capacities.append(capacity)
+    
+    def add(self, element):
+        """Add an element, starting a new slice when the current one is full"""
+        if self.added_elements is not None:
+            self.added_elements.add(element)
+        self.generation = _next_generation()
+        if self.contains(element):
+            return
+        if self.slices[-1].insertions >= self.capacities[-1]:
+            self._add_slice()
+        self.slices[-1].add(element)
+    
+    def add_many(self, elements):
+        """Add a batch of elements; returns which ones were (possibly) present beforehand"""
+        elements = list(elements)
+        # Every slice uses this filter's hash engine, so the batch is hashed once
+        h1, h2 = self.hash_engine.hash_pairs(elements)
+        was_present = self._contains_hashed(h1, h2)
+        if self.added_elements is not None:
+            self.added_elements.update(elements)
+        self.generation = _next_generation()
+        # Only genuinely new elements count against slice capacity
+        first_rows = {}
+        for row, (element, present) in enumerate(zip(elements, was_present.tolist())):
+            if not present:
+                first_rows.setdefault(element, row)
+        rows = np.fromiter(first_rows.values(), dtype=np.intp, count=len(first_rows))
+        new_elements = list(first_rows)
+        while len(rows):
+            if self.slices[-1].insertions >= self.capacities[-1]:
+                self._add_slice()
+            room = self.capacities[-1] - self.slices[-1].insertions
+            self.slices[-1]._add_hashed(new_elements[:room], h1[rows[:room]], h2[rows[:room]])
+            new_elements, rows = new_elements[room:], rows[room:]
+        return was_present
+    
+    def contains(self, element):
+        """Check if an element might be in any slice"""
+        return any(s.contains(element) for s in self.slices)
+    
+    def contains_many(self, elements):
+        """Check a batch of elements against every slice; returns a boolean array"""
+        return self._contains_hashed(*self.hash_engine.hash_pairs(list(elements)))
+    
+    def _contains_hashed(self, h1, h2):
+        found = np.zeros(len(h1), dtype=bool)
+        for s in self.slices:
+            found |= s._contains_hashed(h1, h2)
+        return found
+    
+    def get_hash_positions(self, element):
+        """Hash positions of an element in each slice"""
+        return [s.get_hash_positions(element) for s in self.slices]
+    
+    @property
+    def size(self):
+        return sum(s.size for s in self.slices)
+    
+    @property
+    def num_hashes(self):
+        """Hash count of the newest slice"""
+        return self.slices[-1].num_hashes
+    
+    @property
+    def insertions(self):
+        return sum(s.insertions for s in self.slices)
+    
+    @property
+    def track_elements(self):
+        return self.added_elements is not None
+    
+    @property
+    def element_count(self):
+        if self.added_elements is not None:
+            return len(self.added_elements)
+        return self.insertions
+    
+    def describe_slices(self):
+        """One label per slice for the visualizations"""
+        return [f"Slice {i + 1}: {s.size} bits, {s.num_hashes} hashes, {s.insertions}/{capacity} profiles"
+                for i, (s, capacity) in enumerate(zip(self.slices, self.capacities))]
+    
+    def get_false_positive_rate(self):
+        """Compound false positive rate: the chance that any slice reports a false hit"""
+        miss = 1.0
+        for s in self.slices:
+            miss *= 1 - s.get_false_positive_rate()
+        return 1 - miss
+    
+    def memory_usage(self):
+        usage = sum(s.memory_usage() for s in self.slices)
+        if self.added_elements is not None:
+            usage += sys.getsizeof(self.added_elements) + len(self.added_elements) * _TRACKED_ELEMENT_BYTES
+        return usage
+    
+    def flush(self):
+        """Scalable filters live in memory only"""
+
+class ShardedBloomFilter:
+    """Bloom filter partitioned into num_shards independent sub-filters.
+
+    The top 32 bits of an element's first hash (its hash prefix) pick one shard, and
+    all k positions go into that shard, which is an ordinary BloomFilter. Shards can
+    therefore be filled on different nodes and combined shard by shard: merged with
+    union/update, or kept in sync with export_delta/import_delta.
+    """
+    def __init__(self, size, num_hashes, num_shards=4, hash_engine=DEFAULT_HASH_ENGINE, track_elements=True):
+        if num_shards < 1:
+            raise ValueError('num_shards must be at least 1')
+        self.hash_engine = get_hash_engine(hash_engine)
+        shard_size = max(1, -(-size // num_shards))
+        self.shards = [BloomFilter(shard_size, num_hashes, self.hash_engine, track_elements=track_elements)
+                       for _ in range(num_shards)]
+    
+    def shard_index(self, h1):
+        """Shard for a first hash (int or uint64 array): its top 32 bits scaled to num_shards"""
+        if isinstance(h1, np.ndarray):
+            return ((h1 >> np.uint64(32)) * np.uint64(len(self.shards))) >> np.uint64(32)
+        return ((h1 >> 32) * len(self.shards)) >> 32
+    
+    def shard_for(self, element):
+        h1, _ = self.hash_engine.hash_pair(element)
+        return self.shards[self.shard_index(h1)]
+    
+    def add(self, element):
+        self.shard_for(element).add(element)
+    
+    def add_many(self, elements):
+        """Add a batch of elements; returns which ones were (possibly) present beforehand"""
+        elements = list(elements)
+        h1, h2 = self.hash_engine.hash_pairs(elements)
+        owners = self.shard_index(h1)
+        was_present = np.zeros(len(elements), dtype=bool)
+        for i, shard in enumerate(self.shards):
+            rows = np.flatnonzero(owners == i)
+            if rows.size:
+                was_present[rows] = shard._add_hashed([elements[j] for j in rows.tolist()], h1[rows], h2[rows])
+        return was_present
+    
+    def contains(self, element):
+        return self.shard_for(element).contains(element)
+    
+    def contains_many(self, elements):
+        h1, h2 = self.hash_engine.hash_pairs(list(elements))
+        owners = self.shard_index(h1)
+        found = np.zeros(len(h1), dtype=bool)
+        for i, shard in enumerate(self.shards):
+            rows = np.flatnonzero(owners == i)
+            if rows.size:
+                found[rows] = shard._contains_hashed(h1[rows], h2[rows])
+        return found
+    
+    def get_hash_positions(self, element):
+        """Hash positions of an element in each shard (empty except in its own shard)"""
+        owner = self.shard_for(element)
+        return [s.get_hash_positions(element) if s is owner else [] for s in self.shards]
+    
+    @property
+    def slices(self):
+        """The shards, so the layered-filter visualizations and routes apply"""
+        return self.shards
+    
+    @property
+    def size(self):
+        return sum(s.size for s in self.shards)
+    
+    @property
+    def num_hashes(self):
+        return self.shards[0].num_hashes
+    
+    @property
+    def insertions(self):
+        return sum(s.insertions for s in self.shards)
+    
+    @property
+    def generation(self):
+        return max(s.generation for s in self.shards)
+    
+    @property
+    def track_elements(self):
+        return self.shards[0].track_elements
+    
+    @property
+    def added_elements(self):
+        """Elements added across all shards (a new set), or None in production mode"""
+        if not self.track_elements:
+            return None
+        return set().union(*(s.added_elements for s in self.shards))
+    
+    @property
+    def element_count(self):
+        # Every element lives in exactly one shard
+        return sum(s.element_count for s in self.shards)
+    
+    def shard_fill(self):
+        """Fraction of bits set in each shard"""
+        return [s.fill_ratio() for s in self.shards]
+    
+    def describe_slices(self):
+        """One label per shard for the visualizations"""
+        return [f"Shard {i + 1}: {s.size} bits, ~{s.element_count} profiles, {s.fill_ratio():.1%} full"
+                for i, s in enumerate(self.shards)]
+    
+    def get_false_positive_rate(self):
+        """A lookup probes one shard chosen by hash, so the rate is the shards' average"""
+        return sum(s.get_false_positive_rate() for s in self.shards) / len(self.shards)
+    
+    def memory_usage(self):
+        return sum(s.memory_usage() for s in self.shards)
+    
+    def flush(self):
+        """Sharded filters live in memory only"""
+    
+    def _check_compatible(self, other):
+        if not isinstance(other, ShardedBloomFilter) or len(other.shards) != len(self.shards):
+            raise ValueError('Sharded filters must have the same number of shards to be combined')
+    
+    def _combined(self, other, combine):
+        self._check_compatible(other)
+        result = ShardedBloomFilter.__new__(ShardedBloomFilter)
+        result.hash_engine = self.hash_engine
+        result.shards = [combine(a, b) for a, b in zip(self.shards, other.shards)]
+        return result
+    
+    def union(self, other):
+        return self._combined(other, BloomFilter.union)
+    
+    def intersection(self, other):
+        return self._combined(other, BloomFilter.intersection)
+    
+    def update(self, other):
+        self._check_compatible(other)
+        if self.track_elements and not other.track_elements:
+            raise ValueError('Cannot merge a production-mode filter into an exact-mode one')
+        for a, b in zip(self.shards, other.shards):
+            a._check_compatible(b)
+        for a, b in zip(self.shards, other.shards):
+            a.update(b)
+    
+    def intersection_update(self, other):
+        self._check_compatible(other)
+        for a, b in zip(self.shards, other.shards):
+            a._check_compatible(b)
+        for a, b in zip(self.shards, other.shards):
+            a.intersection_update(b)
+    
+    def enable_change_tracking(self):
+        for s in self.shards:
+            s.enable_change_tracking()
+
+# Parameter sweeps: many filter configurations scored against one large workload
+SWEEP_FILTER_TYPES = {'bloom': BloomFilter, 'blocked': BlockedBloomFilter}
+# Rows of hash positions built at a time, bounding worker memory at chunk * k * 8 bytes
+_SWEEP_CHUNK = 1 << 16
+
+def synthetic_workload(members, probes, seed=0):
+    """Distinct profile IDs to insert and disjoint never-inserted IDs to probe with"""
+    return ([f"user_{seed}_{i}" for i in range(members)],
+            [f"probe_{seed}_{i}" for i in range(probes)])
+
+def sweep_grid(sizes, hash_counts, hash_engines=(DEFAULT_HASH_ENGINE,), filter_type='bloom'):
+    """Every (size, k, hash engine) combination as a list of sweep configurations"""
+    return [{'type': filter_type, 'size': size, 'num_hashes': k, 'hash_engine': engine}
+            for size, k, engine in itertools.product(sizes, hash_counts, hash_engines)]
+
+def _sweep_worker(task):
+    """Build one configuration from shared (h1, h2) digests and measure it (runs in a pool process)"""
+    shm = shared_memory.SharedMemory(name=task['shm_name'], track=False)
+    try:
+        digests = np.ndarray((2, task['members'] + task['probes']), dtype=np.uint64, buffer=shm.buf)
+        result = _evaluate_configuration(task['config'], digests[0], digests[1], task['members'])
+        # Views into the block must be gone before it can be closed
+        del digests
+        return result
+    finally:
+        shm.close()
+
+def _evaluate_configuration(config, h1, h2, members):
+    """Insert the first `members` digests, probe with the rest and compare with theory"""
+    filter_class = SWEEP_FILTER_TYPES[config['type']]
+    options = {'block_bits': config['block_bits']} if 'block_bits' in config else {}
+    bf = filter_class(config['size'], config['num_hashes'], config['hash_engine'],
+                      track_elements=False, **options)
+    
+    start = time.perf_counter()
+    for lo in range(0, members, _SWEEP_CHUNK):
+        hi = min(members, lo + _SWEEP_CHUNK)
+        bf._insert_indices(bf._indices(h1[lo:hi], h2[lo:hi]))
+    bf.insertions = members
+    insert_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    false_positives = 0
+    for lo in range(members, len(h1), _SWEEP_CHUNK):
+        hi = min(len(h1), lo + _SWEEP_CHUNK)
+        found = bf.bit_array.test_indices(bf._indices(h1[lo:hi], h2[lo:hi])).all(axis=1)
+        false_positives += int(found.sum())
+    probe_seconds = time.perf_counter() - start
+    
+    probes = len(h1) - members
+    return {
+        'type': config['type'],
+        'size': bf.size,
+        'num_hashes': bf.num_hashes,
+        'hash_engine': bf.hash_engine.name,
+        'members': members,
+        'probes': probes,
+        'false_positives': false_positives,
+        'measured_fp_rate': false_positives / probes if probes else 0.0,
+        'theoretical_fp_rate': bf.expected_false_positive_rate(members),
+        'fill_ratio': bf.fill_ratio(),
+        'bits_per_element': bf.size / members if members else None,
+        'memory_bytes': bf.bit_array.nbytes,
+        'insert_seconds': insert_seconds,
+        'probe_seconds': probe_seconds
+    }
+
+def _normalize_sweep_config(config):
+    config = dict(config)
+    config['type'] = config.get('type', 'bloom')
+    if config['type'] not in SWEEP_FILTER_TYPES:
+        raise ValueError(f"Sweeps support filter types {sorted(SWEEP_FILTER_TYPES)}, not '{config['type']}'")
+    config['size'] = int(config['size'])
+    config['num_hashes'] = int(config['num_hashes'])
+    config['hash_engine'] = get_hash_engine(config.get('hash_engine', DEFAULT_HASH_ENGINE)).name
+    if 'block_bits' in config:
+        config['block_bits'] = int(config['block_bits'])
+    # Fail fast on bad parameters instead of inside a worker
+    if config['size'] < 1 or config['num_hashes'] < 1:
+        raise ValueError('size and num_hashes must be at least 1')
+    return config
+
+def run_sweep(configurations, members, probes, executor=None):
+    """Score every configuration against one workload in parallel.
+
+    members are inserted into each filter and probes (which should not be members)
+    measure the false positive rate. Each hash engine's (h1, h2) digests are computed
+    once here and shared with the worker processes through shared memory, so workers
+    only build bit arrays and run batched lookups. Results come back in
+    configuration order. Without an executor a temporary process pool is used.
+    """
+    configurations = [_normalize_sweep_config(c) for c in configurations]
+    members = list(members)
+    probes = list(probes)
+    total = len(members) + len(probes)
+    
+    blocks = {}
+    try:
+        for engine_name in dict.fromkeys(c['hash_engine'] for c in configurations):
+            shm = shared_memory.SharedMemory(create=True, size=max(1, 2 * total * 8))
+            blocks[engine_name] = shm
+            digests = np.ndarray((2, total), dtype=np.uint64, buffer=shm.buf)
+            digests[0], digests[1] = get_hash_engine(engine_name).hash_pairs(members + probes)
+            del digests
+        
+        tasks = [{'shm_name': blocks[c['hash_engine']].name, 'config': c,
+                  'members': len(members), 'probes': len(probes)} for c in configurations]
+        if executor is not None:
+            return list(executor.map(_sweep_worker, tasks))
+        with ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn')) as pool:
+            return list(pool.map(_sweep_worker, tasks))
+    finally:
+        for shm in blocks.values():
+            shm.close()
+            shm.unlink()
+
@@ -0,0 +1,565 @@
+"""Pillow and matplotlib drawings of Bloom filters.
+
+Imported on first use by the web app, so processes that only answer membership
+checks never load Pillow; matplotlib is imported only when a performance chart is
+drawn.
+"""
+import io
+import math
+import threading
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont, features
+import numpy as np
+
+from bloom_core import _POPCOUNT, stage_timer
+
+def _visible_bit_range(size, bit_size, start_x, max_x):
+    """Return the [first, last) bit indices whose cells fall between x=0 and max_x"""
+    first = max(0, -(start_x // bit_size))
+    last = min(size, max(first, (max_x - start_x + bit_size - 1) // bit_size))
+    return first, last
+
+def _draw_block_boundaries(draw, bloom_filter, start_x, start_y, bit_size, first, last):
+    """Mark the cache-line blocks of a blocked filter with vertical lines"""
+    block_bits = getattr(bloom_filter, 'block_bits', None)
+    if not block_bits:
+        return
+    for boundary in range(-(-first // block_bits) * block_bits, last + 1, block_bits):
+        x = start_x + boundary * bit_size - 1
+        draw.line([x, start_y - 8, x, start_y + bit_size + 2], fill='blue', width=2)
+
+@lru_cache(maxsize=None)
+def _load_fonts():
+    """Load the large, medium and small fonts once per process"""
+    try:
+        return (ImageFont.truetype("arial.ttf", 20),
+                ImageFont.truetype("arial.ttf", 16),
+                ImageFont.truetype("arial.ttf", 12))
+    except OSError:
+        return (ImageFont.load_default(),) * 3
+
+# Cell colours (fill, border) for clear and set bits
+_CELL_COLORS = (('lightgray', 'gray'), ('green', 'darkgreen'))
+
+def _draw_cell(draw, x, y, bit_size, color, border_color):
+    # Draw bit - ensure positive dimensions
+    right = x + max(1, bit_size - 2)
+    bottom = y + max(1, bit_size - 2)
+    draw.rectangle([x, y, right, bottom], fill=color, outline=border_color)
+
+class _BitRowRaster:
+    """Cached drawing of a filter's bit row.
+
+    The first render draws every visible cell; later renders compare the current
+    bits with the ones last drawn and repaint only the cells that changed, so an
+    add or check costs O(changed cells) draw calls rather than O(size).
+    """
+    # Row offset inside the strip, leaving room above it for block boundary lines
+    ROW_Y = 10
+
+    def __init__(self, bloom_filter, width):
+        self.size = bloom_filter.size
+        self.bit_size = max(1, min(20, (width - 100) // bloom_filter.size))
+        self.start_x = (width - bloom_filter.size * self.bit_size) // 2
+        self.first, self.last = _visible_bit_range(bloom_filter.size, self.bit_size, self.start_x, width)
+        self.image = Image.new('RGB', (width, self.ROW_Y + self.bit_size + 30), 'white')
+        self.bits = np.zeros(self.last - self.first, dtype=np.uint8)
+        
+        draw = ImageDraw.Draw(self.image)
+        _, _, font_small = _load_fonts()
+        for i in range(self.first, self.last):
+            x = self.start_x + i * self.bit_size
+            _draw_cell(draw, x, self.ROW_Y, self.bit_size, *_CELL_COLORS[0])
+            
+            # Draw index
+            if i % 10 == 0:  # Show every 10th index
+                draw.text((x, self.ROW_Y + self.bit_size + 5), str(i), fill='black', font=font_small)
+        _draw_block_boundaries(draw, bloom_filter, self.start_x, self.ROW_Y, self.bit_size, self.first, self.last)
+
+    def update(self, bloom_filter):
+        """Repaint the cells whose bits changed since the last render"""
+        current = bloom_filter.bit_array.unpack(self.first, self.last)
+        changed = np.flatnonzero(current != self.bits)
+        if changed.size == 0:
+            return
+        
+        draw = ImageDraw.Draw(self.image)
+        for offset in changed.tolist():
+            self.paint_cell(draw, self.first + offset, self.ROW_Y, *_CELL_COLORS[current[offset]])
+        _draw_block_boundaries(draw, bloom_filter, self.start_x, self.ROW_Y, self.bit_size, self.first, self.last)
+        self.bits = current
+
+    def paint_cell(self, draw, index, y, color, border_color):
+        """Repaint one visible cell at row y exactly as a full redraw would show it"""
+        if not self.first <= index < self.last:
+            return
+        x = self.start_x + index * self.bit_size
+        if self.bit_size == 1 and index < self.last - 1:
+            # 1px cells are drawn 2px wide and the next cell covers the overhang,
+            # so only this cell's own column is visible
+            draw.line([x, y, x, y + 1], fill=border_color)
+        else:
+            _draw_cell(draw, x, y, self.bit_size, color, border_color)
+
+# Heatmap rendering for filters too large to draw one cell per bit
+_HEATMAP_HEIGHT = 120
+_HEATMAP_SAMPLE_BYTES = 64
+_CLEAR_RGB = np.array([211, 211, 211], dtype=np.float64)  # lightgray
+_SET_RGB = np.array([0, 128, 0], dtype=np.float64)  # green
+_HIGHLIGHT_RGB = np.array([255, 0, 0], dtype=np.uint8)  # red
+
+def _fill_density(bit_array, cells):
+    """Split the bits into about `cells` equal runs and return (fraction set per run, bits per run).
+
+    Runs longer than _HEATMAP_SAMPLE_BYTES bytes are estimated from evenly spaced
+    sample bytes, so the work is bounded by the number of cells, not the filter size.
+    """
+    size = len(bit_array)
+    packed = bit_array.packed_bits()
+    if size <= cells * 8:
+        # Fewer than 8 bits per cell: the whole array is small, unpack it
+        bits_per_cell = -(-size // cells)
+        bits = np.unpackbits(packed, bitorder='little')[:size]
+        n = -(-size // bits_per_cell)
+        padded = np.zeros(n * bits_per_cell, dtype=np.uint8)
+        padded[:size] = bits
+        valid = np.full(n, bits_per_cell)
+        valid[-1] = size - (n - 1) * bits_per_cell
+        return padded.reshape(n, bits_per_cell).sum(axis=1) / valid, bits_per_cell
+    
+    bytes_per_cell = -(-len(packed) // cells)
+    n = -(-len(packed) // bytes_per_cell)
+    step = max(1, bytes_per_cell // _HEATMAP_SAMPLE_BYTES)
+    full = packed[:(n - 1) * bytes_per_cell].reshape(n - 1, bytes_per_cell)[:, ::step]
+    density = np.empty(n)
+    density[:-1] = _POPCOUNT[full].sum(axis=1) / (full.shape[1] * 8)
+    tail = packed[(n - 1) * bytes_per_cell:]
+    density[-1] = _POPCOUNT[tail].sum() / (size - (n - 1) * bytes_per_cell * 8)
+    return density, bytes_per_cell * 8
+
+def _heatmap_image(bit_array, max_width, max_height, highlight=()):
+    """Render a bit array as a fill-density heatmap straight from NumPy.
+
+    Returns (image, bits per heatmap cell). Cells go from light gray (empty) to
+    green (all bits set); cells holding a highlighted position are red.
+    """
+    density, bits_per_cell = _fill_density(bit_array, min(len(bit_array), max_width * max_height))
+    n = len(density)
+    cell_px = max(1, math.isqrt(max_width * max_height // n))
+    while True:
+        cols = max(1, min(n, max_width // cell_px))
+        rows = -(-n // cols)
+        if rows * cell_px <= max_height or cell_px == 1:
+            break
+        cell_px -= 1
+    
+    grid = np.full((rows * cols, 3), 255, dtype=np.uint8)
+    grid[:n] = (_CLEAR_RGB + (_SET_RGB - _CLEAR_RGB) * density[:, None]).round().astype(np.uint8)
+    for position in highlight:
+        grid[position // bits_per_cell] = _HIGHLIGHT_RGB
+    grid = grid.reshape(rows, cols, 3)
+    if cell_px > 1:
+        grid = grid.repeat(cell_px, axis=0).repeat(cell_px, axis=1)
+    return Image.fromarray(grid, 'RGB'), bits_per_cell
+
+def _uses_heatmap(size, available_width):
+    """Filters wider than the canvas at one pixel per bit are drawn as heatmaps"""
+    return size > available_width
+
+# Bit-row rasters of recently rendered filters: id(filter) -> (weakref to filter, raster)
+_RASTER_CACHE_SIZE = 128
+_raster_cache = OrderedDict()
+_raster_cache_lock = threading.Lock()
+
+def _bit_row_raster(bloom_filter, width):
+    """Up-to-date cached bit-row raster for a filter (callers hold the filter's lock)"""
+    key = (id(bloom_filter), width)
+    with _raster_cache_lock:
+        entry = _raster_cache.get(key)
+        if entry is not None and entry[0]() is bloom_filter:
+            _raster_cache.move_to_end(key)
+            raster = entry[1]
+        else:
+            raster = None
+    
+    if raster is None:
+        raster = _BitRowRaster(bloom_filter, width)
+        with _raster_cache_lock:
+            _raster_cache[key] = (weakref.ref(bloom_filter), raster)
+            while len(_raster_cache) > _RASTER_CACHE_SIZE:
+                _raster_cache.popitem(last=False)
+    
+    raster.update(bloom_filter)
+    return raster
+
+@stage_timer.timed('draw')
+def create_bloom_filter_visualization(bloom_filter, width=800, height=600):
+    """Create a visual representation of the Bloom filter with Tinder context"""
+    # Create image
+    img = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(img)
+    
+    font_large, font_medium, font_small = _load_fonts()
+    
+    start_y = 100
+    if _uses_heatmap(bloom_filter.size, width - 100):
+        # Too many bits for one cell each: draw a fill-density heatmap
+        heatmap, bits_per_cell = _heatmap_image(bloom_filter.bit_array, width - 100, _HEATMAP_HEIGHT)
+        img.paste(heatmap, (50, start_y))
+        bit_size = heatmap.height
+        draw.text((50, start_y + bit_size + 5), f"Heatmap: each cell covers {bits_per_cell} bits, shade = share set",
+                  fill='black', font=font_small)
+    else:
+        # Paste the cached bit row (only changed cells get repainted)
+        raster = _bit_row_raster(bloom_filter, width)
+        bit_size = raster.bit_size
+        img.paste(raster.image, (0, start_y - raster.ROW_Y))
+    
+    # Draw title
+    draw.text((width//2 - 150, 20), "Tinder Bloom Filter - Swiped Profiles", fill='black', font=font_large)
+    
+    # Draw statistics
+    stats_y = start_y + bit_size + 50
+    draw.text((50, stats_y), f"User Pool Size: {bloom_filter.size} profiles", fill='black', font=font_medium)
+    hash_text = f"Hash Functions: {bloom_filter.num_hashes}"
+    if getattr(bloom_filter, 'block_bits', None):
+        hash_text += f" (in {bloom_filter.num_blocks} blocks of {bloom_filter.block_bits} bits)"
+    draw.text((50, stats_y + 25), hash_text, fill='black', font=font_medium)
+    swiped_label = "Profiles Swiped" if bloom_filter.track_elements else "Profiles Swiped (est.)"
+    draw.text((50, stats_y + 50), f"{swiped_label}: {bloom_filter.element_count}", fill='black', font=font_medium)
+    
+    # Calculate and display false positive rate
+    fp_rate = bloom_filter.get_false_positive_rate()
+    draw.text((50, stats_y + 75), f"False Positive Rate: {fp_rate:.4f}", fill='black', font=font_medium)
+    
+    # Draw legend
+    legend_y = stats_y + 120
+    draw.rectangle([50, legend_y, 70, legend_y + 20], fill='green', outline='darkgreen')
+    draw.text((80, legend_y), "Profile Swiped (1)", fill='black', font=font_medium)
+    draw.rectangle([50, legend_y + 30, 70, legend_y + 50], fill='lightgray', outline='gray')
+    draw.text((80, legend_y + 30), "Profile Not Swiped (0)", fill='black', font=font_medium)
+    
+    return img
+
+@stage_timer.timed('draw')
+def create_hash_visualization(bloom_filter, element, width=800, height=600):
+    """Create visualization showing hash positions for a specific profile"""
+    img = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(img)
+    
+    font_large, font_medium, font_small = _load_fonts()
+    
+    # Draw title
+    draw.text((width//2 - 200, 20), f"Checking Profile: '{element}'", fill='black', font=font_large)
+    
+    # Get hash positions for this element
+    hash_positions = bloom_filter.get_hash_positions(element)
+    
+    start_y = 100
+    if _uses_heatmap(bloom_filter.size, width - 100):
+        # Too many bits for one cell each: heatmap with the hashed cells in red
+        heatmap, bits_per_cell = _heatmap_image(bloom_filter.bit_array, width - 100, _HEATMAP_HEIGHT,
+                                                highlight=hash_positions)
+        img.paste(heatmap, (50, start_y))
+        bit_size = heatmap.height
+        draw.text((50, start_y + bit_size + 5), f"Heatmap: each cell covers {bits_per_cell} bits, shade = share set",
+                  fill='black', font=font_small)
+    else:
+        # Paste the cached bit row (only changed cells get repainted)
+        raster = _bit_row_raster(bloom_filter, width)
+        bit_size = raster.bit_size
+        img.paste(raster.image, (0, start_y - raster.ROW_Y))
+        
+        # Highlight this profile's positions on top of the cached row
+        for i in set(hash_positions):
+            raster.paint_cell(draw, i, start_y, 'red', 'darkred')
+        _draw_block_boundaries(draw, bloom_filter, raster.start_x, start_y, bit_size, raster.first, raster.last)
+    
+    # Draw hash positions info
+    info_y = start_y + bit_size + 50
+    draw.text((50, info_y), f"Hash Positions: {hash_positions}", fill='black', font=font_medium)
+    
+    # Check if element is in filter
+    is_in_filter = bloom_filter.contains(element)
+    status_color = 'red' if is_in_filter else 'green'
+    status_text = "MIGHT BE SWIPED" if is_in_filter else "DEFINITELY NOT SWIPED"
+    draw.text((50, info_y + 25), f"Tinder Decision: {status_text}", fill=status_color, font=font_medium)
+    
+    # Draw legend
+    legend_y = info_y + 60
+    draw.rectangle([50, legend_y, 70, legend_y + 20], fill='red', outline='darkred')
+    draw.text((80, legend_y), f"Hash positions for '{element}'", fill='black', font=font_medium)
+    draw.rectangle([50, legend_y + 30, 70, legend_y + 50], fill='green', outline='darkgreen')
+    draw.text((80, legend_y + 30), "Profiles already swiped", fill='black', font=font_medium)
+    draw.rectangle([50, legend_y + 60, 70, legend_y + 80], fill='lightgray', outline='gray')
+    draw.text((80, legend_y + 60), "Profiles not swiped", fill='black', font=font_medium)
+    
+    return img
+
+@stage_timer.timed('draw')
+def create_comparison_visualization(bloom_filters, width=1200, height=800):
+    """Create comparison visualization of multiple Bloom filters"""
+    img = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(img)
+    
+    font_large, font_medium, font_small = _load_fonts()
+    
+    # Draw title
+    draw.text((width//2 - 200, 20), "Tinder Bloom Filter Comparison", fill='black', font=font_large)
+    
+    # Calculate layout
+    num_filters = len(bloom_filters)
+    cols = min(3, num_filters)
+    rows = (num_filters + cols - 1) // cols
+    
+    filter_width = (width - 50) // cols
+    filter_height = (height - 150) // rows
+    
+    for i, (name, bf) in enumerate(bloom_filters.items()):
+        row = i // cols
+        col = i % cols
+        
+        x_offset = 25 + col * filter_width
+        y_offset = 80 + row * filter_height
+        
+        # Draw filter name
+        draw.text((x_offset, y_offset), name, fill='black', font=font_medium)
+        
+        start_y = y_offset + 30
+        if hasattr(bf, 'shards'):
+            # Sharded filter: one bar per shard, filled up to its fill ratio
+            bit_size = max(1, min(_HEATMAP_HEIGHT, filter_height - 110))
+            bar_width = max(1, (filter_width - 20) // len(bf.shards))
+            for j, fill in enumerate(bf.shard_fill()):
+                x = x_offset + 10 + j * bar_width
+                right = x + max(1, bar_width - 2)
+                draw.rectangle([x, start_y, right, start_y + bit_size], fill='lightgray', outline='gray')
+                filled = round(fill * bit_size)
+                if filled:
+                    draw.rectangle([x, start_y + bit_size - filled, right, start_y + bit_size],
+                                   fill='green', outline='darkgreen')
+        elif _uses_heatmap(bf.size, filter_width - 20):
+            # Large filter: fill-density heatmap sized to the panel
+            heatmap, _ = _heatmap_image(bf.bit_array, filter_width - 20,
+                                        max(1, min(_HEATMAP_HEIGHT, filter_height - 110)))
+            img.paste(heatmap, (x_offset + 10, start_y))
+            bit_size = heatmap.height
+        else:
+            # Calculate bit visualization - ensure minimum size
+            bit_size = max(1, min(8, (filter_width - 20) // bf.size))
+            bit_array_width = bf.size * bit_size
+            start_x = x_offset + (filter_width - bit_array_width) // 2
+            
+            # Draw bit array
+            bits = bf.bit_array.unpack()
+            for j in range(bf.size):
+                x = start_x + j * bit_size
+                y = start_y
+                
+                color = 'green' if bits[j] == 1 else 'lightgray'
+                border_color = 'darkgreen' if bits[j] == 1 else 'gray'
+                
+                # Ensure positive dimensions
+                right = x + max(1, bit_size - 1)
+                bottom = y + max(1, bit_size - 1)
+                draw.rectangle([x, y, right, bottom], fill=color, outline=border_color)
+        
+        # Draw statistics
+        stats_y = start_y + bit_size + 10
+        draw.text((x_offset, stats_y), f"Pool: {bf.size}", fill='black', font=font_small)
+        draw.text((x_offset, stats_y + 15), f"Hashes: {bf.num_hashes}", fill='black', font=font_small)
+        draw.text((x_offset, stats_y + 30), f"Swiped: {bf.element_count}", fill='black', font=font_small)
+        
+        fp_rate = bf.get_false_positive_rate()
+        draw.text((x_offset, stats_y + 45), f"FP Rate: {fp_rate:.4f}", fill='black', font=font_small)
+        if hasattr(bf, 'shards'):
+            fills = bf.shard_fill()
+            draw.text((x_offset, stats_y + 60), f"Shards: {len(fills)}, fill {min(fills):.1%} - {max(fills):.1%}",
+                      fill='black', font=font_small)
+    
+    return img
+
+@stage_timer.timed('draw')
+def create_slices_visualization(layered_filter, element=None, title="Tinder Scalable Bloom Filter", width=800, height=600):
+    """Draw each slice of a layered filter as its own bit row, optionally highlighting a profile"""
+    img = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(img)
+    
+    font_large, font_medium, font_small = _load_fonts()
+    
+    # Draw title
+    if element is not None:
+        title = f"Checking Profile: '{element}'"
+    draw.text((width//2 - 150, 20), title, fill='black', font=font_large)
+    
+    hash_positions = layered_filter.get_hash_positions(element) if element is not None else None
+    labels = layered_filter.describe_slices()
+    
+    # Leave room for the statistics below the slice rows
+    row_height = max(30, min(60, (height - 260) // max(1, len(layered_filter.slices))))
+    y = 70
+    for i, (bf, label) in enumerate(zip(layered_filter.slices, labels)):
+        if y + row_height > height - 180:
+            draw.text((50, y), f"... {len(layered_filter.slices) - i} more slices", fill='black', font=font_small)
+            y += 20
+            break
+        
+        draw.text((50, y), label, fill='black', font=font_small)
+        start_x = 50
+        start_y = y + 16
+        highlighted = set(hash_positions[i]) if hash_positions is not None else set()
+        
+        if _uses_heatmap(bf.size, width - 100):
+            # Large slice: fill-density heatmap strip
+            heatmap, _ = _heatmap_image(bf.bit_array, width - 100, max(1, row_height - 22), highlight=highlighted)
+            img.paste(heatmap, (start_x, start_y))
+            y += row_height
+            continue
+        
+        # Draw bit array
+        bit_size = max(1, min(20, row_height - 22, (width - 100) // bf.size))
+        bits = bf.bit_array.unpack()
+        for j in range(bf.size):
+            x = start_x + j * bit_size
+            if j in highlighted:
+                color, border_color = 'red', 'darkred'
+            elif bits[j] == 1:
+                color, border_color = 'green', 'darkgreen'
+            else:
+                color, border_color = 'lightgray', 'gray'
+            right = x + max(1, bit_size - 2)
+            bottom = start_y + max(1, bit_size - 2)
+            draw.rectangle([x, start_y, right, bottom], fill=color, outline=border_color)
+        
+        y += row_height
+    
+    # Draw statistics
+    stats_y = y + 20
+    draw.text((50, stats_y), f"Slices: {len(layered_filter.slices)} ({layered_filter.size} bits total)", fill='black', font=font_medium)
+    draw.text((50, stats_y + 25), f"Profiles Swiped: {layered_filter.element_count}", fill='black', font=font_medium)
+    fp_rate = layered_filter.get_false_positive_rate()
+    bound = getattr(layered_filter, 'error_rate', None)
+    bound_text = f" (bound {bound})" if bound is not None else ""
+    draw.text((50, stats_y + 50), f"False Positive Rate: {fp_rate:.4f}{bound_text}", fill='black', font=font_medium)
+    
+    if element is not None:
+        is_in_filter = layered_filter.contains(element)
+        status_color = 'red' if is_in_filter else 'green'
+        status_text = "MIGHT BE SWIPED" if is_in_filter else "DEFINITELY NOT SWIPED"
+        draw.text((50, stats_y + 75), f"Tinder Decision: {status_text}", fill=status_color, font=font_medium)
+    
+    # Draw legend
+    legend_y = stats_y + 110
+    draw.rectangle([50, legend_y, 70, legend_y + 20], fill='green', outline='darkgreen')
+    draw.text((80, legend_y), "Profile Swiped (1)", fill='black', font=font_medium)
+    if element is not None:
+        draw.rectangle([300, legend_y, 320, legend_y + 20], fill='red', outline='darkred')
+        draw.text((330, legend_y), f"Hash positions for '{element}'", fill='black', font=font_medium)
+    
+    return img
+
+def webp_supported():
+    """Whether this Pillow build can encode WebP"""
+    return features.check('webp')
+
+def render_filter(bloom_filter):
+    """Visualization for any filter type held in the registry"""
+    if hasattr(bloom_filter, 'shards'):
+        return create_slices_visualization(bloom_filter, title="Tinder Sharded Bloom Filter")
+    if hasattr(bloom_filter, 'slices'):
+        return create_slices_visualization(bloom_filter)
+    return create_bloom_filter_visualization(bloom_filter)
+
+def render_check(bloom_filter, element):
+    """Hash-position visualization for any filter type held in the registry"""
+    if hasattr(bloom_filter, 'slices'):
+        return create_slices_visualization(bloom_filter, element)
+    return create_hash_visualization(bloom_filter, element)
+
+def create_performance_analysis(bloom_filters, test_elements, width=800, height=600):
+    """Create performance analysis visualization"""
+    return Image.open(io.BytesIO(performance_analysis_png(bloom_filters, test_elements)))
+
+@stage_timer.timed('draw')
+def performance_analysis_png(bloom_filters, test_elements):
+    """Performance analysis chart as PNG bytes.
+
+    Uses matplotlib's object-oriented API on a private Agg canvas rather than
+    pyplot's global state, so charts can be drawn from any thread. matplotlib is
+    imported here, on the first chart, rather than with the module.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    
+    fig = Figure(figsize=(10, 8))
+    FigureCanvasAgg(fig)
+    ax1, ax2 = fig.subplots(2, 1)
+    
+    # Test each filter
+    results = {}
+    for name, bf in bloom_filters.items():
+        true_positives = 0
+        false_positives = 0
+        true_negatives = 0
+        false_negatives = 0
+        
+        detected = bf.contains_many(test_elements)
+        for element, is_detected in zip(test_elements, detected):
+            is_actually_in = element in bf.added_elements
+            
+            if is_actually_in and is_detected:
+                true_positives += 1
+            elif is_actually_in and not is_detected:
+                false_negatives += 1
+            elif not is_actually_in and is_detected:
+                false_positives += 1
+            else:
+                true_negatives += 1
+        
+        results[name] = {
+            'true_positives': true_positives,
+            'false_positives': false_positives,
+            'true_negatives': true_negatives,
+            'false_negatives': false_negatives
+        }
+    
+    # Plot 1: Accuracy metrics
+    names = list(results.keys())
+    precision = [results[name]['true_positives'] / (results[name]['true_positives'] + results[name]['false_positives']) 
+                 if (results[name]['true_positives'] + results[name]['false_positives']) > 0 else 0 
+                 for name in names]
+    recall = [results[name]['true_positives'] / (results[name]['true_positives'] + results[name]['false_negatives']) 
+              if (results[name]['true_positives'] + results[name]['false_negatives']) > 0 else 0 
+              for name in names]
+    
+    x = np.arange(len(names))
+    width = 0.35
+    
+    ax1.bar(x - width/2, precision, width, label='Precision', color='skyblue')
+    ax1.bar(x + width/2, recall, width, label='Recall', color='lightcoral')
+    ax1.set_xlabel('Tinder Configuration')
+    ax1.set_ylabel('Score')
+    ax1.set_title('Tinder Profile Detection Accuracy')
+    ax1.set_xticks(x)
+    ax1.set_xticklabels(names, rotation=45)
+    ax1.legend()
+    ax1.grid(True, alpha=0.3)
+    
+    # Plot 2: False positive rates
+    fp_rates = [bf.get_false_positive_rate() for bf in bloom_filters.values()]
+    ax2.bar(names, fp_rates, color='orange', alpha=0.7)
+    ax2.set_xlabel('Tinder Configuration')
+    ax2.set_ylabel('False Positive Rate')
+    ax2.set_title('False Positive Rate (Shows Already Swiped Profiles)')
+    ax2.tick_params(axis='x', rotation=45)
+    ax2.grid(True, alpha=0.3)
+    
+    fig.tight_layout()
+    
+    buf = io.BytesIO()
+    with stage_timer.stage('png'):
+        fig.savefig(buf, format='png', dpi=150, bbox_inches='tight', facecolor='white')
+    return buf.getvalue()
+
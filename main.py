@@ -2,545 +2,1651 @@ import os
 import io
 import base64
 import hashlib
-import random
-from flask import Flask, render_template, request, jsonify
-from PIL import Image, ImageDraw, ImageFont
+import json
+import math
+import time
+import sys
+import threading
+import zlib
+import itertools
+import bisect
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from flask import (Flask, Blueprint, current_app, render_template, request, jsonify, Response,
+                   stream_with_context, g)
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.utils import secure_filename
+from werkzeug.wsgi import get_input_stream
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from collections import defaultdict
-
-app = Flask(__name__)
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-app.secret_key = 'your-secret-key-here'
-
-class BloomFilter:
-    def __init__(self, size, num_hashes):
-        self.size = size
-        self.num_hashes = num_hashes
-        self.bit_array = [0] * size
-        self.added_elements = set()
-        self.hash_functions = self._create_hash_functions()
-    
-    def _create_hash_functions(self):
-        """Create multiple hash functions using different salts"""
-        salts = ['salt1', 'salt2', 'salt3', 'salt4', 'salt5', 'salt6', 'salt7', 'salt8']
-        return [lambda x, salt=salt: int(hashlib.md5((str(x) + salt).encode()).hexdigest(), 16) % self.size 
-                for salt in salts[:self.num_hashes]]
-    
-    def add(self, element):
-        """Add an element to the Bloom filter"""
-        self.added_elements.add(element)
-        for hash_func in self.hash_functions:
-            index = hash_func(element)
-            self.bit_array[index] = 1
+from collections import defaultdict, OrderedDict
+from contextlib import contextmanager, ExitStack
+
+from bloom_core import (
+    BloomFilter, CountingBloomFilter, BlockedBloomFilter, TimeDecayingBloomFilter, ScalableBloomFilter,
+    ShardedBloomFilter, DEFAULT_HASH_ENGINE, stage_timer, plan_filter, plan_grid, synthetic_workload,
+    sweep_grid, run_sweep
+)
+
+# Settings every app starts from; create_app() copies them into app.config.
+# Most can also be set through environment variables of the same name.
+DEFAULT_CONFIG = {
+    'MAX_CONTENT_LENGTH': 16 * 1024 * 1024,  # 16MB max file size
+    'SECRET_KEY': 'your-secret-key-here',
+    # API-only apps register no visualization routes and never import the drawing code
+    'API_ONLY': False,
+    # Idle named filters are evicted once all of them together exceed this many bytes
+    'FILTER_MEMORY_BUDGET': int(os.environ.get('FILTER_MEMORY_BUDGET', 512 * 1024 * 1024)),
+    # Directory holding snapshot files written by /filters/<filter_id>/snapshot
+    'FILTER_DATA_DIR': os.environ.get('FILTER_DATA_DIR', 'filters'),
+    # Process pool for /sweep, sized by SWEEP_WORKERS (default: one per CPU)
+    'SWEEP_WORKERS': int(os.environ.get('SWEEP_WORKERS', os.cpu_count() or 1)),
+    # Largest workload (members plus probes) a single sweep request may ask for
+    'SWEEP_MAX_ELEMENTS': int(os.environ.get('SWEEP_MAX_ELEMENTS', 4_000_000)),
+    # Worker threads for chart renders and how many finished charts to keep
+    'RENDER_WORKERS': int(os.environ.get('RENDER_WORKERS', 2)),
+    'RENDER_CACHE_SIZE': int(os.environ.get('RENDER_CACHE_SIZE', 64)),
+    # How long the synchronous chart routes wait for their job
+    'RENDER_TIMEOUT': float(os.environ.get('RENDER_TIMEOUT', 60)),
+    # Elements per add_many() call during bulk ingest; the filter's lock is taken per batch
+    'INGEST_BATCH_SIZE': int(os.environ.get('INGEST_BATCH_SIZE', 65536)),
+    # Set STAGE_TIMING=0 to turn the stage hooks into a flag check
+    'STAGE_TIMING': os.environ.get('STAGE_TIMING', '1') != '0',
+    # Sampling interval of the profiler toggled through /metrics/profiler
+    'PROFILER_INTERVAL': float(os.environ.get('PROFILER_INTERVAL', 0.005)),
+    # Largest candidate list one /filters/<filter_id>/check request may carry
+    'BATCH_CHECK_MAX_ELEMENTS': int(os.environ.get('BATCH_CHECK_MAX_ELEMENTS', 100000))
+}
+
+# Routes that work without any drawing code, and the ones that draw
+api = Blueprint('api', __name__)
+visual = Blueprint('visual', __name__)
+
+def _visualizations():
+    """The drawing module, imported on first use so API-only processes never load Pillow"""
+    import bloom_visualizations
+    return bloom_visualizations
+
+class FilterRegistry:
+    """Thread-safe registry of named Bloom filters (one per user or shard).
+
+    Each filter is guarded by one of a fixed pool of striped locks, so requests for
+    different filters rarely contend. Filters are kept in least-recently-used order
+    and idle ones are evicted once their total memory exceeds memory_budget bytes.
+    The budget is checked when a filter is registered and, through enforce_budget,
+    after requests that grow one; a single filter larger than the budget is refused.
+    """
+
+    def __init__(self, memory_budget=None, num_stripes=64):
+        self.memory_budget = memory_budget
+        self._filters = OrderedDict()
+        self._registry_lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(num_stripes)]
+
+    def lock_for(self, filter_id):
+        """The stripe lock guarding a filter"""
+        return self._stripes[self._stripe_index(filter_id)]
+
+    def _stripe_index(self, filter_id):
+        return hash(filter_id) % len(self._stripes)
+
+    @contextmanager
+    def locked(self, filter_id):
+        """Hold the filter's lock and yield the filter (None if it does not exist)"""
+        with self.lock_for(filter_id):
+            yield self.get(filter_id)
+
+    @contextmanager
+    def locked_pair(self, first_id, second_id):
+        """Hold two filters' locks and yield both filters (either may be None).
+
+        Stripes are always taken in index order, so requests locking the same two
+        filters in opposite orders cannot deadlock.
+        """
+        with ExitStack() as stack:
+            for index in sorted({self._stripe_index(first_id), self._stripe_index(second_id)}):
+                stack.enter_context(self._stripes[index])
+            yield self.get(first_id), self.get(second_id)
+
+    def get(self, filter_id):
+        with self._registry_lock:
+            bloom_filter = self._filters.get(filter_id)
+            if bloom_filter is not None:
+                self._filters.move_to_end(filter_id)
+            return bloom_filter
+
+    def put(self, filter_id, bloom_filter):
+        """Register (or replace) a filter, evicting idle filters if over budget.
+
+        Raises ValueError, before evicting anything, if the filter alone needs more
+        than the whole budget.
+        """
+        if self.memory_budget is not None and bloom_filter.memory_usage() > self.memory_budget:
+            raise ValueError(f'Filter needs {bloom_filter.memory_usage()} bytes, '
+                             f'more than the {self.memory_budget} byte memory budget')
+        with self._registry_lock:
+            self._filters[filter_id] = bloom_filter
+            self._filters.move_to_end(filter_id)
+            self._evict(protect=filter_id)
+
+    def enforce_budget(self, filter_id):
+        """Evict idle filters if filter_id has grown the registry past its budget"""
+        with self._registry_lock:
+            self._evict(protect=filter_id)
+
+    def remove(self, filter_id):
+        with self._registry_lock:
+            return self._filters.pop(filter_id, None)
+
+    def ids(self):
+        with self._registry_lock:
+            return list(self._filters)
+
+    def __len__(self):
+        return len(self._filters)
+
+    def memory_usage(self):
+        with self._registry_lock:
+            return sum(bf.memory_usage() for bf in self._filters.values())
+
+    def _evict(self, protect):
+        """Drop least recently used filters until under budget (registry lock held)"""
+        if self.memory_budget is None:
+            return
+        usage = sum(bf.memory_usage() for bf in self._filters.values())
+        for filter_id in list(self._filters):
+            if usage <= self.memory_budget:
+                break
+            if filter_id == protect:
+                continue
+            # Only evict idle filters: skip any whose stripe is busy right now
+            stripe = self.lock_for(filter_id)
+            if not stripe.acquire(blocking=False):
+                continue
+            try:
+                evicted = self._filters.pop(filter_id)
+                evicted.flush()
+                usage -= evicted.memory_usage()
+            finally:
+                stripe.release()
+
+class RenderQueue:
+    """Background chart rendering, memoized by configuration.
+
+    Jobs run on a small thread pool so slow chart renders never hold a request
+    thread. A job's ID is a hash of its kind and parameters, so submitting the same
+    configuration again returns the existing job (and, once done, its PNG) instead
+    of rendering it twice. Up to max_results finished jobs are kept, least recently
+    used first out; failed jobs are retried on resubmission.
+    """
+
+    def __init__(self, renderers, max_workers=2, max_results=64):
+        self.renderers = renderers
+        self.max_workers = max_workers
+        self.max_results = max_results
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='render')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, max_workers, max_results):
+        """Resize the worker pool and the result cache; jobs already queued still finish"""
+        with self._lock:
+            self.max_results = max_results
+            self._evict()
+            if max_workers != self.max_workers:
+                self._executor.shutdown(wait=False)
+                self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='render')
+                self.max_workers = max_workers
+
+    @staticmethod
+    def job_id(kind, params):
+        """Stable ID for a render: hash of the kind and its JSON-serializable parameters"""
+        payload = json.dumps([kind, params], sort_keys=True, separators=(',', ':'))
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+    def submit(self, kind, params):
+        """Queue a render (or find the matching one) and return its job ID"""
+        if kind not in self.renderers:
+            raise ValueError(f"Unknown render job kind '{kind}'")
+        job_id = self.job_id(kind, params)
+        with self._lock:
+            future = self._jobs.get(job_id)
+            if future is None or (future.done() and future.exception() is not None):
+                self._jobs[job_id] = self._executor.submit(self.renderers[kind], params)
+            self._jobs.move_to_end(job_id)
+            self._evict()
+        return job_id
+
+    def get(self, job_id):
+        """The job's future (result: PNG bytes), or None if unknown or evicted"""
+        with self._lock:
+            future = self._jobs.get(job_id)
+            if future is not None:
+                self._jobs.move_to_end(job_id)
+            return future
+
+    def wait(self, job_id, timeout):
+        """Block up to timeout seconds for a job to finish; returns its future"""
+        future = self.get(job_id)
+        if future is not None:
+            wait([future], timeout=timeout)
+        return future
+
+    @staticmethod
+    def status(future):
+        if not future.done():
+            return 'running' if future.running() else 'queued'
+        return 'failed' if future.exception() is not None else 'done'
+
+    def _evict(self):
+        """Drop the least recently used finished jobs beyond max_results (lock held)"""
+        excess = len(self._jobs) - self.max_results
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].done():
+                del self._jobs[job_id]
+                excess -= 1
+
+# Named Bloom filters, one per user or shard
+filter_registry = FilterRegistry(memory_budget=DEFAULT_CONFIG['FILTER_MEMORY_BUDGET'])
+
+DEFAULT_FILTER_ID = 'default'
+
+# Process pool for /sweep, sized by SWEEP_WORKERS when it starts
+_sweep_pool = None
+_sweep_pool_lock = threading.Lock()
+
+def _sweep_executor():
+    """Process pool shared by /sweep requests, started on first use"""
+    global _sweep_pool
+    with _sweep_pool_lock:
+        if _sweep_pool is None:
+            # Spawned rather than forked: the server process runs request threads
+            _sweep_pool = ProcessPoolExecutor(max_workers=current_app.config['SWEEP_WORKERS'],
+                                              mp_context=multiprocessing.get_context('spawn'))
+        return _sweep_pool
+
+def _discard_sweep_executor(pool):
+    """Forget a pool whose workers died so the next sweep starts a fresh one"""
+    global _sweep_pool
+    with _sweep_pool_lock:
+        if _sweep_pool is pool:
+            _sweep_pool = None
+    pool.shutdown(wait=False)
+
+# Sample profiles the comparison and analysis charts swipe on and then check
+DEMO_PROFILES = ['user_123', 'sarah_456', 'mike_789', 'emma_321', 'john_654', 'lisa_987', 'dave_147', 'anna_258',
+                 'tom_369', 'jessica_741', 'alex_852', 'rachel_963', 'chris_159', 'megan_357', 'ryan_753', 'ashley_951']
+
+def _chart_configurations(configurations):
+    """Validated [{'size', 'hashes'[, 'shards']}] list from a chart request (part of the job ID)"""
+    result = []
+    for config in configurations:
+        size, hashes = int(config['size']), int(config['hashes'])
+        if size < 1 or hashes < 1:
+            raise ValueError('size and hashes must be at least 1')
+        normalized = {'size': size, 'hashes': hashes}
+        shards = int(config.get('shards', 1))
+        if shards < 1:
+            raise ValueError('shards must be at least 1')
+        if shards > 1:
+            normalized['shards'] = shards
+        result.append(normalized)
+    if not result:
+        raise ValueError('No configurations given')
+    return result
+
+def _demo_filters(configurations, swiped):
+    """One Bloom filter per configuration, each holding the first `swiped` demo profiles"""
+    bloom_filters = {}
+    for config in configurations:
+        name = f"Size:{config['size']}, Hashes:{config['hashes']}"
+        if 'shards' in config:
+            name += f", Shards:{config['shards']}"
+            bf = ShardedBloomFilter(config['size'], config['hashes'], config['shards'])
+        else:
+            bf = BloomFilter(config['size'], config['hashes'])
+        bf.add_many(DEMO_PROFILES[:swiped])
+        bloom_filters[name] = bf
+    return bloom_filters
+
+def _render_comparison(params):
+    image = _visualizations().create_comparison_visualization(_demo_filters(params['configurations'], 4))
+    buffered = io.BytesIO()
+    with stage_timer.stage('png'):
+        image.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+def _render_performance_analysis(params):
+    return _visualizations().performance_analysis_png(_demo_filters(params['configurations'], 8), DEMO_PROFILES)
+
+# Longest a poll may block with ?wait=
+_MAX_POLL_SECONDS = 30
+
+render_queue = RenderQueue({'compare_filters': _render_comparison,
+                            'performance_analysis': _render_performance_analysis},
+                           max_workers=DEFAULT_CONFIG['RENDER_WORKERS'],
+                           max_results=DEFAULT_CONFIG['RENDER_CACHE_SIZE'])
+
+def _render_job_response(job_id, future):
+    """JSON status of a render job"""
+    status = RenderQueue.status(future)
+    result = {'success': True, 'job_id': job_id, 'status': status,
+              'image_url': f'/render_jobs/{job_id}/image'}
+    if status == 'failed':
+        result['error'] = str(future.exception())
+    return result
+
+def _chart_response(kind, data):
+    """Shared body of the chart routes: queue the render, then wait for it unless async"""
+    job_id = render_queue.submit(kind, {'configurations': _chart_configurations(data['configurations'])})
+    if data.get('async'):
+        return jsonify(_render_job_response(job_id, render_queue.get(job_id))), 202
     
-    def contains(self, element):
-        """Check if an element might be in the Bloom filter"""
-        for hash_func in self.hash_functions:
-            index = hash_func(element)
-            if self.bit_array[index] == 0:
-                return False
-        return True
+    future = render_queue.wait(job_id, current_app.config['RENDER_TIMEOUT'])
+    if not future.done():
+        return jsonify(_render_job_response(job_id, future)), 202
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'visualization': _base64(future.result()),
+        'configurations': len(data['configurations'])
+    })
+
+def _filter_path(filter_id):
+    """On-disk location of a filter's snapshot file"""
+    name = secure_filename(filter_id)
+    if not name:
+        raise ValueError(f"filter_id '{filter_id}' cannot be used as a file name")
+    return os.path.join(current_app.config['FILTER_DATA_DIR'], name + '.bloom')
+
+def _filter_dimensions(data):
+    """(size, num_hashes) from a request: given directly, or planned from capacity and error_rate"""
+    if 'size' not in data and 'capacity' in data:
+        plan = plan_filter(int(data['capacity']), float(data.get('error_rate', 0.01)))
+        return plan['size'], plan['num_hashes']
+    return int(data['size']), int(data['num_hashes'])
+
+def _build_filter(data):
+    """Construct the filter described by a /create_filter request body"""
+    filter_type = data.get('type', 'bloom')
+    hash_engine = data.get('hash_engine', DEFAULT_HASH_ENGINE)
+    mode = data.get('mode', 'exact')
+    if mode not in ('exact', 'production'):
+        raise ValueError("mode must be 'exact' or 'production'")
+    track_elements = (mode == 'exact')
     
-    def get_hash_positions(self, element):
-        """Get the hash positions for an element"""
-        positions = []
-        for hash_func in self.hash_functions:
-            index = hash_func(element)
-            positions.append(index)
-        return positions
+    if filter_type in ('bloom', 'blocked', 'counting', 'time_decaying', 'sharded'):
+        size, num_hashes = _filter_dimensions(data)
     
-    def get_false_positive_rate(self):
-        """Calculate theoretical false positive rate"""
-        if len(self.added_elements) == 0:
-            return 0.0
-        
-        # Calculate probability of a bit being set
-        p = 1 - (1 - 1/self.size) ** (self.num_hashes * len(self.added_elements))
-        
-        # False positive rate is p^k where k is number of hash functions
-        return p ** self.num_hashes
-
-def create_bloom_filter_visualization(bloom_filter, width=800, height=600):
-    """Create a visual representation of the Bloom filter with Tinder context"""
-    # Create image
-    img = Image.new('RGB', (width, height), 'white')
-    draw = ImageDraw.Draw(img)
+    if filter_type == 'bloom':
+        return BloomFilter(size, num_hashes, hash_engine,
+                           track_elements=track_elements)
+    if filter_type == 'scalable':
+        return ScalableBloomFilter(int(data.get('initial_capacity', 100)),
+                                   float(data.get('error_rate', 0.01)),
+                                   float(data.get('growth_factor', 2)),
+                                   float(data.get('tightening_ratio', 0.85)),
+                                   hash_engine, track_elements=track_elements)
+    if filter_type == 'blocked':
+        return BlockedBloomFilter(size, num_hashes, hash_engine,
+                                  track_elements=track_elements,
+                                  block_bits=int(data.get('block_bits', 512)))
+    if filter_type == 'counting':
+        return CountingBloomFilter(size, num_hashes, hash_engine,
+                                   track_elements=track_elements)
+    if filter_type == 'time_decaying':
+        return TimeDecayingBloomFilter(size, num_hashes,
+                                       float(data.get('window_seconds', 90 * 24 * 3600)),
+                                       int(data.get('generations', 3)), hash_engine)
+    if filter_type == 'sharded':
+        return ShardedBloomFilter(size, num_hashes, int(data.get('num_shards', 4)),
+                                  hash_engine, track_elements=track_elements)
+    raise ValueError(f"Unknown filter type '{filter_type}'")
+
+def _filter_id(data):
+    """Filter ID from a request body, falling back to the shared demo filter"""
+    filter_id = data.get('filter_id') or DEFAULT_FILTER_ID
+    if not isinstance(filter_id, str):
+        raise ValueError('filter_id must be a string')
+    return filter_id
+
+def _include_image(data):
+    """JSON routes embed a rendered image unless the body sets include_image to false.
+
+    API-only apps never draw, so there the default is false and true is refused.
+    """
+    api_only = current_app.config['API_ONLY']
+    include_image = data.get('include_image', not api_only)
+    if not isinstance(include_image, bool):
+        raise ValueError('include_image must be true or false')
+    if include_image and api_only:
+        raise ValueError('Visualizations are not available from the API-only app')
+    return include_image
+
+def _base64(data):
+    """Base64 text of bytes for a JSON response"""
+    with stage_timer.stage('base64'):
+        return base64.b64encode(data).decode()
+
+def _png_base64(image):
+    """Base64 PNG for embedding a visualization in a JSON response"""
+    buffered = io.BytesIO()
+    with stage_timer.stage('png'):
+        image.save(buffered, format="PNG")
+    return _base64(buffered.getvalue())
+
+class _IngestReader:
+    """Iterates the IDs in a streamed upload: one per line, plain or gzip/zlib-compressed.
+
+    The body is read and decompressed a chunk at a time, and decompression never
+    yields more than chunk_size bytes at once, so memory use grows neither with the
+    upload nor with its compression ratio. A line still unfinished after
+    max_line_bytes is a ValueError.
+    compressed=None sniffs the gzip magic bytes. bytes_read (from the wire),
+    bytes_decoded and rows track progress while iterating.
+    """
+    GZIP_MAGIC = b'\x1f\x8b'
+
+    def __init__(self, stream, compressed=None, chunk_size=1 << 20, max_line_bytes=64 * 1024):
+        self.stream = stream
+        self.compressed = compressed
+        self.chunk_size = chunk_size
+        self.max_line_bytes = max_line_bytes
+        self.bytes_read = 0
+        self.bytes_decoded = 0
+        self.rows = 0
+        self._decompressor = None
+
+    def __iter__(self):
+        pending = b''
+        while True:
+            chunk = self.stream.read(self.chunk_size)
+            if not chunk:
+                break
+            if self.compressed is None:
+                self.compressed = chunk.startswith(self.GZIP_MAGIC)
+            self.bytes_read += len(chunk)
+            for piece in self._decompress(chunk) if self.compressed else (chunk,):
+                self.bytes_decoded += len(piece)
+                pending += piece
+                # Only complete lines are parsed; a split line waits for the next piece
+                cut = pending.rfind(b'\n') + 1
+                if cut:
+                    yield from self._lines(pending[:cut])
+                    pending = pending[cut:]
+                if len(pending) > self.max_line_bytes:
+                    raise ValueError(f'Line {self.rows + 1} is longer than {self.max_line_bytes} bytes')
+        if self._decompressor is not None and not self._decompressor.eof:
+            raise ValueError('Compressed upload ended early')
+        yield from self._lines(pending)
+
+    def _decompress(self, data):
+        """Decompress data in pieces of at most chunk_size bytes"""
+        while data or self._decompressor is not None:
+            if self._decompressor is None:
+                # wbits=47 accepts both gzip and zlib headers
+                self._decompressor = zlib.decompressobj(wbits=47)
+            try:
+                piece = self._decompressor.decompress(data, self.chunk_size)
+            except zlib.error as e:
+                raise ValueError(f'Invalid compressed upload: {e}') from None
+            if piece:
+                yield piece
+            if self._decompressor.eof:
+                # Concatenated gzip members (e.g. appended log files) each get a fresh decompressor
+                data = self._decompressor.unused_data
+                self._decompressor = None
+                continue
+            data = self._decompressor.unconsumed_tail
+            # A full piece may leave output buffered even when all input is consumed
+            if not data and len(piece) < self.chunk_size:
+                break
+
+    def _lines(self, data):
+        if data.isspace():
+            # Skip blank padding without building a list of empty lines
+            return
+        for line in data.decode('utf-8').split('\n'):
+            line = line.strip()
+            if line:
+                self.rows += 1
+                yield line
+
+def _ingest(filter_id, reader, batch_size, report_seconds=1.0):
+    """Feed a reader's IDs into a filter batch by batch, yielding progress reports.
+
+    Reports come at most every report_seconds; the last one has 'done': True and the
+    filter's final stats.
+    """
+    start = last_report = time.perf_counter()
     
-    try:
-        font_large = ImageFont.truetype("arial.ttf", 20)
-        font_medium = ImageFont.truetype("arial.ttf", 16)
-        font_small = ImageFont.truetype("arial.ttf", 12)
-    except:
-        font_large = ImageFont.load_default()
-        font_medium = ImageFont.load_default()
-        font_small = ImageFont.load_default()
+    def progress(done):
+        seconds = time.perf_counter() - start
+        return {
+            'filter_id': filter_id,
+            'done': done,
+            'rows': reader.rows,
+            'bytes_read': reader.bytes_read,
+            'bytes_decoded': reader.bytes_decoded,
+            'seconds': seconds,
+            'rows_per_second': reader.rows / seconds if seconds else 0.0,
+            'mb_per_second': reader.bytes_decoded / 1e6 / seconds if seconds else 0.0
+        }
     
-    # Calculate bit array visualization - ensure minimum size
-    bit_size = max(1, min(20, (width - 100) // bloom_filter.size))
-    bit_array_width = bloom_filter.size * bit_size
-    start_x = (width - bit_array_width) // 2
-    start_y = 100
+    for batch in itertools.batched(reader, batch_size):
+        with filter_registry.locked(filter_id) as bloom_filter:
+            if bloom_filter is None:
+                raise LookupError(f"Bloom filter '{filter_id}' was removed during ingest")
+            bloom_filter.add_many(batch)
+        filter_registry.enforce_budget(filter_id)
+        if time.perf_counter() - last_report >= report_seconds:
+            last_report = time.perf_counter()
+            yield progress(False)
     
-    # Draw title
-    draw.text((width//2 - 150, 20), "Tinder Bloom Filter - Swiped Profiles", fill='black', font=font_large)
+    report = progress(True)
+    with filter_registry.locked(filter_id) as bloom_filter:
+        if bloom_filter is not None:
+            report.update({
+                'elements_count': bloom_filter.element_count,
+                'false_positive_rate': bloom_filter.get_false_positive_rate(),
+                'generation': bloom_filter.generation
+            })
+    yield report
+
+# Formats served by /filters/<filter_id>/image: Pillow format name and mimetype
+_IMAGE_FORMATS = {'png': ('PNG', 'image/png'), 'webp': ('WEBP', 'image/webp')}
+
+# Generations restart at 1 in every process, so ETags also carry a random per-process
+# epoch: a tag issued before a restart or by another worker never matches by accident
+_ETAG_EPOCH = os.urandom(6).hex()
+
+def _image_etag(bloom_filter, image_format, element=None):
+    """ETag for a rendered image: the filter state plus whatever else is drawn"""
+    tag = f"{_ETAG_EPOCH}-{bloom_filter.generation}-{image_format}"
+    if element is not None:
+        tag += '-' + hashlib.blake2b(element.encode('utf-8'), digest_size=8).hexdigest()
+    return tag
+
+class _TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with encoding and decoding timed as the 'json' stage"""
+
+    def dumps(self, obj, **kwargs):
+        with stage_timer.stage('json'):
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        with stage_timer.stage('json'):
+            return super().loads(s, **kwargs)
+
+class RouteMetrics:
+    """Request counts and latency histograms per route, in Prometheus' cumulative form.
+
+    Routes are labelled by their URL rule ('/filters/<filter_id>/check'), not the
+    concrete path, so the number of series stays bounded.
+    """
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # (route, method) -> [per-bucket counts with a final +Inf bucket, sum of seconds]
+        self._latency = {}
+        self._responses = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def observe(self, route, method, status, seconds):
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._latency.get((route, method))
+            if histogram is None:
+                histogram = self._latency[(route, method)] = [[0] * (len(self.buckets) + 1), 0.0]
+            histogram[0][bucket] += 1
+            histogram[1] += seconds
+            self._responses[(route, method, status)] += 1
+
+    def snapshot(self):
+        """Copies of (latency histograms, response counts by status)"""
+        with self._lock:
+            latency = {key: (list(counts), total) for key, (counts, total) in self._latency.items()}
+            return latency, dict(self._responses)
+
+class SamplingProfiler:
+    """Statistical profiler sampling every thread's Python stack on a timer.
+
+    A daemon thread reads sys._current_frames() every interval seconds and counts
+    each distinct stack, so the profiled code runs unhooked and the overhead is the
+    sampler's own CPU time. Threads parked in the standard library's waiting calls
+    (idle server and pool threads) are skipped. Stacks are reported in the collapsed
+    'outer;...;inner count' format read by flame graph tools.
+    """
+    IDLE_MODULES = frozenset({'threading.py', 'selectors.py', 'queue.py', 'socket.py', 'socketserver.py', 'thread.py'})
+
+    def __init__(self, interval=0.005, max_depth=64, max_stacks=10000):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.max_stacks = max_stacks
+        self.samples = 0
+        self.dropped = 0
+        self._stacks = defaultdict(int)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval=None):
+        with self._lock:
+            if interval is not None:
+                if not 0 < interval <= 1:
+                    raise ValueError('interval must be between 0 and 1 second')
+                self.interval = interval
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = self.dropped = 0
+
+    def collapsed(self, limit=None):
+        """'frame;frame;... count' lines, most sampled first"""
+        with self._lock:
+            stacks = sorted(self._stacks.items(), key=lambda item: item[1], reverse=True)
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks[:limit])
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or os.path.basename(frame.f_code.co_filename) in self.IDLE_MODULES:
+                    continue
+                names = []
+                while frame is not None and len(names) < self.max_depth:
+                    code = frame.f_code
+                    names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stacks.append(';'.join(reversed(names)))
+            with self._lock:
+                for stack in stacks:
+                    if stack in self._stacks or len(self._stacks) < self.max_stacks:
+                        self._stacks[stack] += 1
+                    else:
+                        self.dropped += 1
+                self.samples += len(stacks)
+
+route_metrics = RouteMetrics()
+profiler = SamplingProfiler(interval=DEFAULT_CONFIG['PROFILER_INTERVAL'])
+
+def _start_request_timing():
+    g.request_start = time.perf_counter()
+    stage_timer.begin_request()
+
+def _finish_request_timing(response):
+    """Record the route's latency and report this request's stages in Server-Timing"""
+    seconds = time.perf_counter() - g.request_start
+    route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+    route_metrics.observe(route, request.method, response.status_code, seconds)
+    stages = stage_timer.end_request()
+    if stages:
+        timing = ', '.join(f'{name};dur={stage_seconds * 1000:.3f}' for name, stage_seconds in stages.items())
+        existing = response.headers.get('Server-Timing')
+        response.headers['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+    return response
+
+def _metric_labels(**labels):
+    """Prometheus label set, e.g. {route="/add_element",method="POST"}"""
+    escaped = (str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+               for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+def _filter_gauges(bloom_filter):
+    """Fill ratio, estimated distinct count, live false positive rate and bytes for any filter type"""
+    parts = getattr(bloom_filter, 'slices', None) or [bloom_filter]
+    set_bits = sum(part.bit_array.count() for part in parts)
+    return {
+        'fill_ratio': set_bits / sum(part.size for part in parts),
+        'estimated_count': sum(part.estimated_count() for part in parts),
+        'false_positive_rate': bloom_filter.get_false_positive_rate(),
+        'memory_bytes': bloom_filter.memory_usage()
+    }
+
+# Filter gauges exported on /metrics: name suffix and help text
+_FILTER_GAUGES = {
+    'fill_ratio': 'Fraction of bits set',
+    'estimated_count': 'Distinct elements estimated from the set bits',
+    'false_positive_rate': 'Live false positive rate',
+    'memory_bytes': 'Bytes held by the filter'
+}
+
+def _prometheus_metrics():
+    """Every metric in the Prometheus text exposition format (version 0.0.4)"""
+    lines = []
     
-    # Draw bit array
-    for i in range(bloom_filter.size):
-        x = start_x + i * bit_size
-        y = start_y
-        
-        # Color based on bit value
-        color = 'green' if bloom_filter.bit_array[i] == 1 else 'lightgray'
-        border_color = 'darkgreen' if bloom_filter.bit_array[i] == 1 else 'gray'
-        
-        # Draw bit - ensure positive dimensions
-        right = x + max(1, bit_size - 2)
-        bottom = y + max(1, bit_size - 2)
-        draw.rectangle([x, y, right, bottom], fill=color, outline=border_color)
-        
-        # Draw index
-        if i % 10 == 0:  # Show every 10th index
-            draw.text((x, y + bit_size + 5), str(i), fill='black', font=font_small)
+    def metric(name, kind, help_text):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
     
-    # Draw statistics
-    stats_y = start_y + bit_size + 50
-    draw.text((50, stats_y), f"User Pool Size: {bloom_filter.size} profiles", fill='black', font=font_medium)
-    draw.text((50, stats_y + 25), f"Hash Functions: {bloom_filter.num_hashes}", fill='black', font=font_medium)
-    draw.text((50, stats_y + 50), f"Profiles Swiped: {len(bloom_filter.added_elements)}", fill='black', font=font_medium)
+    latency, responses = route_metrics.snapshot()
+    metric('bloom_http_request_duration_seconds', 'histogram', 'Request latency by route')
+    for (route, method), (counts, total) in sorted(latency.items()):
+        cumulative = 0
+        for bound, count in zip(route_metrics.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'bloom_http_request_duration_seconds_bucket'
+                         f'{_metric_labels(route=route, method=method, le=le)} {cumulative}')
+        lines.append(f'bloom_http_request_duration_seconds_sum{_metric_labels(route=route, method=method)} {total!r}')
+        lines.append(f'bloom_http_request_duration_seconds_count{_metric_labels(route=route, method=method)} {cumulative}')
+    metric('bloom_http_responses_total', 'counter', 'Responses by route and status code')
+    for (route, method, status), count in sorted(responses.items()):
+        lines.append(f'bloom_http_responses_total{_metric_labels(route=route, method=method, status=status)} {count}')
     
-    # Calculate and display false positive rate
-    fp_rate = bloom_filter.get_false_positive_rate()
-    draw.text((50, stats_y + 75), f"False Positive Rate: {fp_rate:.4f}", fill='black', font=font_medium)
+    totals = stage_timer.totals()
+    metric('bloom_stage_seconds_total', 'counter', 'Wall time spent in each hot-path stage (nested stages excluded)')
+    for stage, (calls, seconds) in totals.items():
+        lines.append(f'bloom_stage_seconds_total{_metric_labels(stage=stage)} {seconds!r}')
+    metric('bloom_stage_calls_total', 'counter', 'Timed calls of each hot-path stage')
+    for stage, (calls, seconds) in totals.items():
+        lines.append(f'bloom_stage_calls_total{_metric_labels(stage=stage)} {calls}')
     
-    # Draw legend
-    legend_y = stats_y + 120
-    draw.rectangle([50, legend_y, 70, legend_y + 20], fill='green', outline='darkgreen')
-    draw.text((80, legend_y), "Profile Swiped (1)", fill='black', font=font_medium)
-    draw.rectangle([50, legend_y + 30, 70, legend_y + 50], fill='lightgray', outline='gray')
-    draw.text((80, legend_y + 30), "Profile Not Swiped (0)", fill='black', font=font_medium)
+    gauges = []
+    for filter_id in filter_registry.ids():
+        with filter_registry.locked(filter_id) as bloom_filter:
+            if bloom_filter is not None:
+                gauges.append((filter_id, type(bloom_filter).__name__, _filter_gauges(bloom_filter)))
+    for name, help_text in _FILTER_GAUGES.items():
+        metric(f'bloom_filter_{name}', 'gauge', help_text)
+        for filter_id, filter_type, values in gauges:
+            lines.append(f'bloom_filter_{name}{_metric_labels(filter_id=filter_id, type=filter_type)} {values[name]!r}')
     
-    return img
+    metric('bloom_registry_filters', 'gauge', 'Filters held in the registry')
+    lines.append(f'bloom_registry_filters {len(gauges)}')
+    metric('bloom_registry_memory_bytes', 'gauge', 'Bytes held by all registered filters')
+    lines.append(f'bloom_registry_memory_bytes {sum(values["memory_bytes"] for _, _, values in gauges)}')
+    if filter_registry.memory_budget is not None:
+        metric('bloom_registry_memory_budget_bytes', 'gauge', 'Memory budget before idle filters are evicted')
+        lines.append(f'bloom_registry_memory_budget_bytes {filter_registry.memory_budget}')
+    metric('bloom_profiler_samples_total', 'counter', 'Stacks sampled by the profiler')
+    lines.append(f'bloom_profiler_samples_total {profiler.samples}')
+    return '\n'.join(lines) + '\n'
 
-def create_hash_visualization(bloom_filter, element, width=800, height=600):
-    """Create visualization showing hash positions for a specific profile"""
-    img = Image.new('RGB', (width, height), 'white')
-    draw = ImageDraw.Draw(img)
-    
+@visual.route('/')
+def index():
+    return render_template('index.html')
+
+# Largest capacity x error-rate table one /plan request may ask for
+_MAX_PLAN_CELLS = 100000
+
+def _float_list(value):
+    values = [float(v) for v in value.split(',') if v.strip()]
+    if not all(math.isfinite(v) for v in values):
+        raise ValueError('Values must be finite numbers')
+    return values
+
+@api.route('/plan', methods=['GET'])
+def plan():
+    """Optimal size and hash count for ?capacity=<n>&error_rate=<p>.
+
+    Either parameter may be a comma-separated list; the answer is then a row per
+    (capacity, error_rate) pair, computed in one vectorized pass.
+    """
     try:
-        font_large = ImageFont.truetype("arial.ttf", 20)
-        font_medium = ImageFont.truetype("arial.ttf", 16)
-        font_small = ImageFont.truetype("arial.ttf", 12)
-    except:
-        font_large = ImageFont.load_default()
-        font_medium = ImageFont.load_default()
-        font_small = ImageFont.load_default()
-    
-    # Calculate bit array visualization - ensure minimum size
-    bit_size = max(1, min(20, (width - 100) // bloom_filter.size))
-    bit_array_width = bloom_filter.size * bit_size
-    start_x = (width - bit_array_width) // 2
-    start_y = 100
-    
-    # Draw title
-    draw.text((width//2 - 200, 20), f"Checking Profile: '{element}'", fill='black', font=font_large)
-    
-    # Get hash positions for this element
-    hash_positions = bloom_filter.get_hash_positions(element)
-    
-    # Draw bit array with highlighted positions
-    for i in range(bloom_filter.size):
-        x = start_x + i * bit_size
-        y = start_y
-        
-        # Determine color
-        if i in hash_positions:
-            color = 'red'  # Hash position for this profile
-            border_color = 'darkred'
-        elif bloom_filter.bit_array[i] == 1:
-            color = 'green'  # Bit set by other profiles
-            border_color = 'darkgreen'
-        else:
-            color = 'lightgray'  # Bit clear
-            border_color = 'gray'
+        capacities = _float_list(request.args.get('capacity', ''))
+        error_rates = _float_list(request.args.get('error_rate', '0.01'))
+        if not capacities or not error_rates:
+            return jsonify({'error': 'capacity and error_rate are required'}), 400
+        if len(capacities) * len(error_rates) > _MAX_PLAN_CELLS:
+            return jsonify({'error': f'At most {_MAX_PLAN_CELLS} plans per request'}), 400
         
-        # Draw bit - ensure positive dimensions
-        right = x + max(1, bit_size - 2)
-        bottom = y + max(1, bit_size - 2)
-        draw.rectangle([x, y, right, bottom], fill=color, outline=border_color)
+        if len(capacities) == 1 and len(error_rates) == 1:
+            return jsonify({'success': True, 'plan': plan_filter(int(capacities[0]), error_rates[0])})
         
-        # Draw index
-        if i % 10 == 0:
-            draw.text((x, y + bit_size + 5), str(i), fill='black', font=font_small)
-    
-    # Draw hash positions info
-    info_y = start_y + bit_size + 50
-    draw.text((50, info_y), f"Hash Positions: {hash_positions}", fill='black', font=font_medium)
-    
-    # Check if element is in filter
-    is_in_filter = bloom_filter.contains(element)
-    status_color = 'red' if is_in_filter else 'green'
-    status_text = "MIGHT BE SWIPED" if is_in_filter else "DEFINITELY NOT SWIPED"
-    draw.text((50, info_y + 25), f"Tinder Decision: {status_text}", fill=status_color, font=font_medium)
-    
-    # Draw legend
-    legend_y = info_y + 60
-    draw.rectangle([50, legend_y, 70, legend_y + 20], fill='red', outline='darkred')
-    draw.text((80, legend_y), f"Hash positions for '{element}'", fill='black', font=font_medium)
-    draw.rectangle([50, legend_y + 30, 70, legend_y + 50], fill='green', outline='darkgreen')
-    draw.text((80, legend_y + 30), "Profiles already swiped", fill='black', font=font_medium)
-    draw.rectangle([50, legend_y + 60, 70, legend_y + 80], fill='lightgray', outline='gray')
-    draw.text((80, legend_y + 60), "Profiles not swiped", fill='black', font=font_medium)
-    
-    return img
+        grid = plan_grid(capacities, error_rates)
+        columns = list(grid)
+        rows = zip(*(grid[column].ravel().tolist() for column in columns))
+        return jsonify({'success': True, 'plans': [dict(zip(columns, row)) for row in rows]})
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-def create_comparison_visualization(bloom_filters, width=1200, height=800):
-    """Create comparison visualization of multiple Bloom filters"""
-    img = Image.new('RGB', (width, height), 'white')
-    draw = ImageDraw.Draw(img)
-    
+@api.route('/filters', methods=['GET'])
+def list_filters():
+    filters = []
+    for filter_id in filter_registry.ids():
+        with filter_registry.locked(filter_id) as bf:
+            if bf is None:
+                continue
+            filters.append({
+                'filter_id': filter_id,
+                'size': bf.size,
+                'num_hashes': bf.num_hashes,
+                'elements_count': bf.element_count,
+                'memory_bytes': bf.memory_usage()
+            })
+    return jsonify({
+        'success': True,
+        'filters': filters,
+        'memory_bytes': sum(f['memory_bytes'] for f in filters),
+        'memory_budget': filter_registry.memory_budget
+    })
+
+@api.route('/filters/<filter_id>', methods=['DELETE'])
+def delete_filter(filter_id):
+    with filter_registry.lock_for(filter_id):
+        removed = filter_registry.remove(filter_id)
+    if removed is None:
+        return jsonify({'error': f"Bloom filter '{filter_id}' not found"}), 404
+    return jsonify({'success': True, 'filter_id': filter_id})
+
+@api.route('/filters/<filter_id>/snapshot', methods=['POST'])
+def snapshot_filter(filter_id):
     try:
-        font_large = ImageFont.truetype("arial.ttf", 20)
-        font_medium = ImageFont.truetype("arial.ttf", 16)
-        font_small = ImageFont.truetype("arial.ttf", 12)
-    except:
-        font_large = ImageFont.load_default()
-        font_medium = ImageFont.load_default()
-        font_small = ImageFont.load_default()
-    
-    # Draw title
-    draw.text((width//2 - 200, 20), "Tinder Bloom Filter Comparison", fill='black', font=font_large)
-    
-    # Calculate layout
-    num_filters = len(bloom_filters)
-    cols = min(3, num_filters)
-    rows = (num_filters + cols - 1) // cols
-    
-    filter_width = (width - 50) // cols
-    filter_height = (height - 150) // rows
-    
-    for i, (name, bf) in enumerate(bloom_filters.items()):
-        row = i // cols
-        col = i % cols
-        
-        x_offset = 25 + col * filter_width
-        y_offset = 80 + row * filter_height
-        
-        # Draw filter name
-        draw.text((x_offset, y_offset), name, fill='black', font=font_medium)
-        
-        # Calculate bit visualization - ensure minimum size
-        bit_size = max(1, min(8, (filter_width - 20) // bf.size))
-        bit_array_width = bf.size * bit_size
-        start_x = x_offset + (filter_width - bit_array_width) // 2
-        start_y = y_offset + 30
-        
-        # Draw bit array
-        for j in range(bf.size):
-            x = start_x + j * bit_size
-            y = start_y
-            
-            color = 'green' if bf.bit_array[j] == 1 else 'lightgray'
-            border_color = 'darkgreen' if bf.bit_array[j] == 1 else 'gray'
+        with filter_registry.locked(filter_id) as bloom_filter:
+            if bloom_filter is None:
+                return jsonify({'error': f"Bloom filter '{filter_id}' not found"}), 404
+            if type(bloom_filter) not in (BloomFilter, BlockedBloomFilter):
+                return jsonify({'error': 'Only plain and blocked Bloom filters can be saved to disk'}), 400
             
-            # Ensure positive dimensions
-            right = x + max(1, bit_size - 1)
-            bottom = y + max(1, bit_size - 1)
-            draw.rectangle([x, y, right, bottom], fill=color, outline=border_color)
-        
-        # Draw statistics
-        stats_y = start_y + bit_size + 10
-        draw.text((x_offset, stats_y), f"Pool: {bf.size}", fill='black', font=font_small)
-        draw.text((x_offset, stats_y + 15), f"Hashes: {bf.num_hashes}", fill='black', font=font_small)
-        draw.text((x_offset, stats_y + 30), f"Swiped: {len(bf.added_elements)}", fill='black', font=font_small)
-        
-        fp_rate = bf.get_false_positive_rate()
-        draw.text((x_offset, stats_y + 45), f"FP Rate: {fp_rate:.4f}", fill='black', font=font_small)
-    
-    return img
+            path = _filter_path(filter_id)
+            if bloom_filter.path is not None and os.path.abspath(bloom_filter.path) == os.path.abspath(path):
+                # Already backed by this file: just push the mapped pages and header to disk
+                bloom_filter.flush()
+            else:
+                os.makedirs(current_app.config['FILTER_DATA_DIR'], exist_ok=True)
+                bloom_filter.snapshot(path)
+        
+        return jsonify({
+            'success': True,
+            'filter_id': filter_id,
+            'path': path,
+            'bytes': os.path.getsize(path)
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-def create_performance_analysis(bloom_filters, test_elements, width=800, height=600):
-    """Create performance analysis visualization"""
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8))
-    
-    # Test each filter
-    results = {}
-    for name, bf in bloom_filters.items():
-        true_positives = 0
-        false_positives = 0
-        true_negatives = 0
-        false_negatives = 0
-        
-        for element in test_elements:
-            is_actually_in = element in bf.added_elements
-            is_detected = bf.contains(element)
+@api.route('/filters/<filter_id>/open', methods=['POST'])
+def open_filter(filter_id):
+    try:
+        data = request.get_json(silent=True) or {}
+        mode = data.get('mode', 'r')
+        path = _filter_path(filter_id)
+        if not os.path.exists(path):
+            return jsonify({'error': f"No snapshot for Bloom filter '{filter_id}'"}), 404
+        
+        bloom_filter = BloomFilter.open(path, mode)
+        with filter_registry.lock_for(filter_id):
+            previous = filter_registry.get(filter_id)
+            if previous is not None:
+                previous.flush()
+            filter_registry.put(filter_id, bloom_filter)
+        
+        return jsonify({
+            'success': True,
+            'filter_id': filter_id,
+            'size': bloom_filter.size,
+            'num_hashes': bloom_filter.num_hashes,
+            'hash_engine': bloom_filter.hash_engine.name,
+            'elements_count': bloom_filter.element_count,
+            'writable': bloom_filter.writable
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@visual.route('/filters/<filter_id>/image', methods=['GET'])
+def filter_image(filter_id):
+    """The filter's visualization as a raw image, revalidated with ETag / If-None-Match.
+
+    ?format=png (default) or webp; ?element=<profile> renders the check view for it.
+    """
+    try:
+        image_format = request.args.get('format', 'png').lower()
+        if image_format not in _IMAGE_FORMATS:
+            return jsonify({'error': f"Unknown image format '{image_format}'"}), 400
+        pil_format, mimetype = _IMAGE_FORMATS[image_format]
+        if image_format == 'webp' and not _visualizations().webp_supported():
+            return jsonify({'error': 'WebP is not supported by this Pillow build'}), 400
+        element = request.args.get('element')
+        
+        with filter_registry.locked(filter_id) as bloom_filter:
+            if bloom_filter is None:
+                return jsonify({'error': f"Bloom filter '{filter_id}' not found"}), 404
+            if hasattr(bloom_filter, 'expire'):
+                # Apply due rotations first so the tag reflects what would be drawn
+                bloom_filter.expire()
+            etag = _image_etag(bloom_filter, image_format, element)
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
             
-            if is_actually_in and is_detected:
-                true_positives += 1
-            elif is_actually_in and not is_detected:
-                false_negatives += 1
-            elif not is_actually_in and is_detected:
-                false_positives += 1
+            if element is None:
+                vis_image = _visualizations().render_filter(bloom_filter)
             else:
-                true_negatives += 1
+                vis_image = _visualizations().render_check(bloom_filter, element)
         
-        results[name] = {
-            'true_positives': true_positives,
-            'false_positives': false_positives,
-            'true_negatives': true_negatives,
-            'false_negatives': false_negatives
-        }
-    
-    # Plot 1: Accuracy metrics
-    names = list(results.keys())
-    precision = [results[name]['true_positives'] / (results[name]['true_positives'] + results[name]['false_positives']) 
-                 if (results[name]['true_positives'] + results[name]['false_positives']) > 0 else 0 
-                 for name in names]
-    recall = [results[name]['true_positives'] / (results[name]['true_positives'] + results[name]['false_negatives']) 
-              if (results[name]['true_positives'] + results[name]['false_negatives']) > 0 else 0 
-              for name in names]
-    
-    x = np.arange(len(names))
-    width = 0.35
-    
-    ax1.bar(x - width/2, precision, width, label='Precision', color='skyblue')
-    ax1.bar(x + width/2, recall, width, label='Recall', color='lightcoral')
-    ax1.set_xlabel('Tinder Configuration')
-    ax1.set_ylabel('Score')
-    ax1.set_title('Tinder Profile Detection Accuracy')
-    ax1.set_xticks(x)
-    ax1.set_xticklabels(names, rotation=45)
-    ax1.legend()
-    ax1.grid(True, alpha=0.3)
-    
-    # Plot 2: False positive rates
-    fp_rates = [bf.get_false_positive_rate() for bf in bloom_filters.values()]
-    ax2.bar(names, fp_rates, color='orange', alpha=0.7)
-    ax2.set_xlabel('Tinder Configuration')
-    ax2.set_ylabel('False Positive Rate')
-    ax2.set_title('False Positive Rate (Shows Already Swiped Profiles)')
-    ax2.tick_params(axis='x', rotation=45)
-    ax2.grid(True, alpha=0.3)
+        buffered = io.BytesIO()
+        with stage_timer.stage('png'):
+            if pil_format == 'WEBP':
+                vis_image.save(buffered, format=pil_format, lossless=True)
+            else:
+                vis_image.save(buffered, format=pil_format)
+        response = Response(buffered.getvalue(), mimetype=mimetype)
+        response.set_etag(etag)
+        # Cacheable, but always revalidated: a 304 costs no rendering
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/filters/<filter_id>/ingest', methods=['POST'])
+def ingest_filter(filter_id):
+    """Bulk-add newline-delimited IDs streamed in the request body (plain or gzip).
+
+    The body is not subject to MAX_CONTENT_LENGTH and is never held in memory as a
+    whole. Returns a JSON summary, or with ?progress=ndjson streams one JSON
+    progress line per second and the summary as the last line.
+    """
+    with filter_registry.locked(filter_id) as bloom_filter:
+        if bloom_filter is None:
+            return jsonify({'error': f"Bloom filter '{filter_id}' not found"}), 404
     
-    plt.tight_layout()
+    encoding = request.headers.get('Content-Encoding', '').lower()
+    compressed = True if encoding in ('gzip', 'x-gzip', 'deflate') or \
+        request.mimetype in ('application/gzip', 'application/x-gzip') else None
+    # Read wsgi.input directly so the upload size limit does not apply
+    reader = _IngestReader(get_input_stream(request.environ, max_content_length=None), compressed)
+    try:
+        batch_size = max(1, int(request.args.get('batch_size', current_app.config['INGEST_BATCH_SIZE'])))
+    except ValueError:
+        return jsonify({'error': 'batch_size must be an integer'}), 400
+    reports = _ingest(filter_id, reader, batch_size)
     
-    # Convert to PIL Image
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, bbox_inches='tight', facecolor='white')
-    buf.seek(0)
-    plt.close()
+    if request.args.get('progress') == 'ndjson':
+        def generate():
+            try:
+                for report in reports:
+                    yield json.dumps(report) + '\n'
+            except Exception as e:
+                yield json.dumps({'error': str(e), 'rows_read': reader.rows}) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
     
-    return Image.open(buf)
-
-# Global Bloom filter instance
-bloom_filter = None
-
-@app.route('/')
-def index():
-    return render_template('index.html')
+    try:
+        for report in reports:
+            pass
+        report['success'] = True
+        return jsonify(report)
+    except (ValueError, LookupError) as e:
+        return jsonify({'error': str(e), 'rows_read': reader.rows}), 400
+    except Exception as e:
+        return jsonify({'error': str(e), 'rows_read': reader.rows}), 500
 
-@app.route('/create_filter', methods=['POST'])
-def create_filter():
-    global bloom_filter
+@api.route('/filters/<filter_id>/merge', methods=['POST'])
+def merge_filter(filter_id):
+    """Combine another named filter into this one: {"source": id, "op": "union" | "intersection"}"""
     try:
         data = request.get_json()
-        size = int(data['size'])
-        num_hashes = int(data['num_hashes'])
+        source_id = data['source']
+        op = data.get('op', 'union')
+        if op not in ('union', 'intersection'):
+            return jsonify({'error': "op must be 'union' or 'intersection'"}), 400
+        if source_id == filter_id:
+            return jsonify({'error': 'A filter cannot be merged with itself'}), 400
         
-        bloom_filter = BloomFilter(size, num_hashes)
+        with filter_registry.locked_pair(filter_id, source_id) as (target, source):
+            for name, bf in ((filter_id, target), (source_id, source)):
+                if bf is None:
+                    return jsonify({'error': f"Bloom filter '{name}' not found"}), 404
+            if not hasattr(target, 'update'):
+                return jsonify({'error': 'Only plain, blocked and sharded filters can be merged'}), 400
+            
+            if op == 'union':
+                target.update(source)
+            else:
+                target.intersection_update(source)
+            elements_count = target.element_count
+            false_positive_rate = target.get_false_positive_rate()
+            generation = target.generation
+        filter_registry.enforce_budget(filter_id)
         
-        # Create visualization
-        vis_image = create_bloom_filter_visualization(bloom_filter)
+        return jsonify({
+            'success': True,
+            'filter_id': filter_id,
+            'source': source_id,
+            'op': op,
+            'generation': generation,
+            'elements_count': elements_count,
+            'false_positive_rate': false_positive_rate
+        })
         
-        # Convert to base64
-        buffered = io.BytesIO()
-        vis_image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _delta_parts(bloom_filter):
+    """The bit-array filters a delta is made of: each shard, or the filter itself"""
+    if hasattr(bloom_filter, 'shards'):
+        return bloom_filter.shards
+    if hasattr(bloom_filter, 'export_delta'):
+        return [bloom_filter]
+    raise ValueError('Only plain, blocked and sharded filters support deltas')
+
+@api.route('/filters/<filter_id>/delta', methods=['GET'])
+def export_filter_delta(filter_id):
+    """The 64-bit words changed after generation ?since= (default 0: every set word).
+
+    Pass the returned generation as the next since. Indices and words are base64
+    little-endian uint64 arrays, one entry per shard.
+    """
+    try:
+        since = int(request.args.get('since', 0))
+        with filter_registry.locked(filter_id) as bloom_filter:
+            if bloom_filter is None:
+                return jsonify({'error': f"Bloom filter '{filter_id}' not found"}), 404
+            shards = []
+            for i, part in enumerate(_delta_parts(bloom_filter)):
+                indices, words = part.export_delta(since)
+                shards.append({
+                    'shard': i,
+                    'layout': list(part._layout()),
+                    'word_count': len(indices),
+                    'indices': _base64(indices.astype('<u8').tobytes()),
+                    'words': _base64(words.astype('<u8').tobytes())
+                })
+            generation = bloom_filter.generation
         
         return jsonify({
             'success': True,
-            'visualization': img_str,
-            'size': size,
-            'num_hashes': num_hashes
+            'filter_id': filter_id,
+            'since': since,
+            'generation': generation,
+            'shards': shards
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/filters/<filter_id>/delta', methods=['POST'])
+def import_filter_delta(filter_id):
+    """Apply a delta exported by GET /filters/<filter_id>/delta on another node"""
+    try:
+        data = request.get_json()
+        with filter_registry.locked(filter_id) as bloom_filter:
+            if bloom_filter is None:
+                return jsonify({'error': f"Bloom filter '{filter_id}' not found"}), 404
+            parts = _delta_parts(bloom_filter)
+            
+            # Validate every shard's delta before applying any of them
+            updates = []
+            for entry in data['shards']:
+                i = int(entry['shard'])
+                if not 0 <= i < len(parts):
+                    raise ValueError(f'Delta shard {i} does not exist in this filter')
+                if list(parts[i]._layout()) != list(entry['layout']):
+                    raise ValueError('Delta was exported from a filter with a different layout')
+                indices = np.frombuffer(base64.b64decode(entry['indices']), dtype='<u8')
+                words = np.frombuffer(base64.b64decode(entry['words']), dtype='<u8')
+                if len(indices) != len(words):
+                    raise ValueError('Delta indices and words differ in length')
+                if len(indices) and int(indices.max()) >= parts[i].bit_array.num_words:
+                    raise ValueError('Delta word index out of range for this filter')
+                updates.append((parts[i], indices, words))
+            
+            for part, indices, words in updates:
+                part.import_delta(indices, words)
+            generation = bloom_filter.generation
+            elements_count = bloom_filter.element_count
+        
+        return jsonify({
+            'success': True,
+            'filter_id': filter_id,
+            'generation': generation,
+            'words_applied': sum(len(indices) for _, indices, _ in updates),
+            'elements_count': elements_count
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/create_filter', methods=['POST'])
+def create_filter():
+    try:
+        data = request.get_json()
+        filter_id = _filter_id(data)
+        include_image = _include_image(data)
+        try:
+            bloom_filter = _build_filter(data)
+            if data.get('track_changes'):
+                if not hasattr(bloom_filter, 'enable_change_tracking'):
+                    raise ValueError('This filter type does not support change tracking')
+                bloom_filter.enable_change_tracking()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        with filter_registry.lock_for(filter_id):
+            filter_registry.put(filter_id, bloom_filter)
+            generation = bloom_filter.generation
+            
+            # Create visualization
+            vis_image = _visualizations().render_filter(bloom_filter) if include_image else None
+        
+        result = {
+            'success': True,
+            'filter_id': filter_id,
+            'generation': generation,
+            'type': data.get('type', 'bloom'),
+            'size': bloom_filter.size,
+            'num_hashes': bloom_filter.num_hashes,
+            'hash_engine': bloom_filter.hash_engine.name,
+            'mode': 'exact' if bloom_filter.track_elements else 'production',
+            'memory_bytes': bloom_filter.memory_usage()
+        }
+        if include_image:
+            result['visualization'] = _png_base64(vis_image)
+        return jsonify(result)
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/add_element', methods=['POST'])
+@api.route('/add_element', methods=['POST'])
 def add_element():
-    global bloom_filter
     try:
         data = request.get_json()
+        filter_id = _filter_id(data)
         element = data['element']
+        include_image = _include_image(data)
         
-        if bloom_filter is None:
-            return jsonify({'error': 'Bloom filter not created yet'}), 400
+        with filter_registry.locked(filter_id) as bloom_filter:
+            if bloom_filter is None:
+                return jsonify({'error': f"Bloom filter '{filter_id}' not created yet"}), 400
+            
+            layered = hasattr(bloom_filter, 'slices')
+            # Without an image the client redraws locally from the bits that flipped
+            changed_bits = None if include_image or layered else bloom_filter.changed_bits([element])
+            bloom_filter.add(element)
+            elements_count = bloom_filter.element_count
+            false_positive_rate = bloom_filter.get_false_positive_rate()
+            num_slices = len(bloom_filter.slices) if layered else 1
+            generation = bloom_filter.generation
+            
+            # Create visualization
+            vis_image = _visualizations().render_filter(bloom_filter) if include_image else None
+        # Exact-mode filters grow with every new element
+        filter_registry.enforce_budget(filter_id)
         
-        bloom_filter.add(element)
+        result = {
+            'success': True,
+            'filter_id': filter_id,
+            'generation': generation,
+            'element': element,
+            'elements_count': elements_count,
+            'false_positive_rate': false_positive_rate,
+            'slices': num_slices
+        }
+        if include_image:
+            result['visualization'] = _png_base64(vis_image)
+        else:
+            result['changed_bits'] = changed_bits
+        return jsonify(result)
         
-        # Create visualization
-        vis_image = create_bloom_filter_visualization(bloom_filter)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/remove_element', methods=['POST'])
+def remove_element():
+    try:
+        data = request.get_json()
+        filter_id = _filter_id(data)
+        element = data['element']
+        include_image = _include_image(data)
         
-        # Convert to base64
-        buffered = io.BytesIO()
-        vis_image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        with filter_registry.locked(filter_id) as bloom_filter:
+            if bloom_filter is None:
+                return jsonify({'error': f"Bloom filter '{filter_id}' not created yet"}), 400
+            if not hasattr(bloom_filter, 'remove'):
+                return jsonify({'error': "Only counting filters (type 'counting') support removal"}), 400
+            
+            removed = bloom_filter.remove(element)
+            elements_count = bloom_filter.element_count
+            false_positive_rate = bloom_filter.get_false_positive_rate()
+            generation = bloom_filter.generation
+            
+            # Create visualization
+            vis_image = _visualizations().render_filter(bloom_filter) if include_image else None
         
-        return jsonify({
+        result = {
             'success': True,
-            'visualization': img_str,
+            'filter_id': filter_id,
+            'generation': generation,
             'element': element,
-            'elements_count': len(bloom_filter.added_elements),
-            'false_positive_rate': bloom_filter.get_false_positive_rate()
-        })
+            'removed': removed,
+            'elements_count': elements_count,
+            'false_positive_rate': false_positive_rate
+        }
+        if include_image:
+            result['visualization'] = _png_base64(vis_image)
+        return jsonify(result)
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/check_element', methods=['POST'])
-def check_element():
-    global bloom_filter
+@api.route('/expire_filter', methods=['POST'])
+def expire_filter():
     try:
         data = request.get_json()
-        element = data['element']
+        filter_id = _filter_id(data)
+        include_image = _include_image(data)
         
-        if bloom_filter is None:
-            return jsonify({'error': 'Bloom filter not created yet'}), 400
+        with filter_registry.locked(filter_id) as bloom_filter:
+            if bloom_filter is None:
+                return jsonify({'error': f"Bloom filter '{filter_id}' not created yet"}), 400
+            if not hasattr(bloom_filter, 'rotate'):
+                return jsonify({'error': "Only time-decaying filters (type 'time_decaying') expire"}), 400
+            
+            # Apply any elapsed rotations, then force the requested extra ones
+            rotations = bloom_filter.expire()
+            steps = int(data.get('steps', 0))
+            bloom_filter.rotate(steps)
+            rotations += steps
+            elements_count = bloom_filter.element_count
+            false_positive_rate = bloom_filter.get_false_positive_rate()
+            generation = bloom_filter.generation
+            
+            # Create visualization
+            vis_image = _visualizations().render_filter(bloom_filter) if include_image else None
         
-        is_in_filter = bloom_filter.contains(element)
+        result = {
+            'success': True,
+            'filter_id': filter_id,
+            'generation': generation,
+            'rotations': rotations,
+            'elements_count': elements_count,
+            'false_positive_rate': false_positive_rate
+        }
+        if include_image:
+            result['visualization'] = _png_base64(vis_image)
+        return jsonify(result)
         
-        # Create hash visualization
-        vis_image = create_hash_visualization(bloom_filter, element)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/check_element', methods=['POST'])
+def check_element():
+    try:
+        data = request.get_json()
+        filter_id = _filter_id(data)
+        element = data['element']
+        include_image = _include_image(data)
         
-        # Convert to base64
-        buffered = io.BytesIO()
-        vis_image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        with filter_registry.locked(filter_id) as bloom_filter:
+            if bloom_filter is None:
+                return jsonify({'error': f"Bloom filter '{filter_id}' not created yet"}), 400
+            
+            is_in_filter = bloom_filter.contains(element)
+            hash_positions = bloom_filter.get_hash_positions(element)
+            generation = bloom_filter.generation
+            
+            # Create hash visualization
+            vis_image = _visualizations().render_check(bloom_filter, element) if include_image else None
         
-        return jsonify({
+        result = {
             'success': True,
-            'visualization': img_str,
+            'filter_id': filter_id,
+            'generation': generation,
             'element': element,
             'is_in_filter': is_in_filter,
-            'hash_positions': bloom_filter.get_hash_positions(element)
-        })
+            'hash_positions': hash_positions
+        }
+        if include_image:
+            result['visualization'] = _png_base64(vis_image)
+        return jsonify(result)
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _batch_check_elements():
+    """Candidate IDs from a batch check body: a JSON array or newline-delimited UTF-8"""
+    if request.is_json:
+        data = request.get_json()
+        elements = data.get('elements') if isinstance(data, dict) else data
+        if not isinstance(elements, list):
+            raise ValueError("Expected a JSON array or an object with an 'elements' array")
+        return elements
+    lines = request.get_data().decode('utf-8').split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    return [line.rstrip('\r') for line in lines]
+
+@api.route('/filters/<filter_id>/check', methods=['POST'])
+def batch_check(filter_id):
+    """Check many candidate profiles at once, with no rendering.
+
+    The body is a JSON array (or {"elements": [...]}) or newline-delimited IDs. The
+    answer is a JSON list of booleans in input order. With ?format=bitmap (or Accept:
+    application/octet-stream for raw bytes) it is a bitmap instead: bit i, in
+    little-endian bit order, is set if candidate i might have been swiped.
+    Stage latencies are reported in the Server-Timing header.
+    """
+    try:
+        start = time.perf_counter()
+        try:
+            elements = _batch_check_elements()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if len(elements) > current_app.config['BATCH_CHECK_MAX_ELEMENTS']:
+            return jsonify({'error': f"At most {current_app.config['BATCH_CHECK_MAX_ELEMENTS']} elements per request"}), 400
+        parsed = time.perf_counter()
+        
+        with filter_registry.locked(filter_id) as bloom_filter:
+            if bloom_filter is None:
+                return jsonify({'error': f"Bloom filter '{filter_id}' not found"}), 404
+            found = bloom_filter.contains_many(elements)
+            generation = bloom_filter.generation
+        checked = time.perf_counter()
+        
+        raw_bitmap = request.accept_mimetypes.best == 'application/octet-stream'
+        if raw_bitmap or request.args.get('format') == 'bitmap':
+            bitmap = np.packbits(found, bitorder='little').tobytes()
+            if raw_bitmap:
+                response = Response(bitmap, mimetype='application/octet-stream')
+                response.headers['X-Element-Count'] = str(len(elements))
+            else:
+                response = jsonify({'success': True, 'filter_id': filter_id, 'generation': generation,
+                                    'count': len(elements), 'matches': int(found.sum()),
+                                    'bitmap': _base64(bitmap)})
+        else:
+            response = jsonify({'success': True, 'filter_id': filter_id, 'generation': generation,
+                                'count': len(elements), 'matches': int(found.sum()),
+                                'results': found.tolist()})
+        
+        done = time.perf_counter()
+        response.headers['Server-Timing'] = ', '.join(
+            f'{name};dur={seconds * 1000:.3f}' for name, seconds in
+            (('parse', parsed - start), ('lookup', checked - parsed), ('encode', done - checked),
+             ('total', done - start)))
+        return response
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/add_multiple', methods=['POST'])
+@api.route('/add_multiple', methods=['POST'])
 def add_multiple():
-    global bloom_filter
     try:
         data = request.get_json()
+        filter_id = _filter_id(data)
         elements = data['elements'].split(',')
         elements = [elem.strip() for elem in elements if elem.strip()]
+        include_image = _include_image(data)
         
-        if bloom_filter is None:
-            return jsonify({'error': 'Bloom filter not created yet'}), 400
-        
-        for element in elements:
-            bloom_filter.add(element)
-        
-        # Create visualization
-        vis_image = create_bloom_filter_visualization(bloom_filter)
-        
-        # Convert to base64
-        buffered = io.BytesIO()
-        vis_image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        with filter_registry.locked(filter_id) as bloom_filter:
+            if bloom_filter is None:
+                return jsonify({'error': f"Bloom filter '{filter_id}' not created yet"}), 400
+            
+            layered = hasattr(bloom_filter, 'slices')
+            # Without an image the client redraws locally from the bits that flipped
+            changed_bits = None if include_image or layered else bloom_filter.changed_bits(elements)
+            bloom_filter.add_many(elements)
+            total_elements = bloom_filter.element_count
+            false_positive_rate = bloom_filter.get_false_positive_rate()
+            num_slices = len(bloom_filter.slices) if layered else 1
+            generation = bloom_filter.generation
+            
+            # Create visualization
+            vis_image = _visualizations().render_filter(bloom_filter) if include_image else None
+        filter_registry.enforce_budget(filter_id)
         
-        return jsonify({
+        result = {
             'success': True,
-            'visualization': img_str,
+            'filter_id': filter_id,
+            'generation': generation,
             'elements_added': len(elements),
-            'total_elements': len(bloom_filter.added_elements),
-            'false_positive_rate': bloom_filter.get_false_positive_rate()
-        })
+            'total_elements': total_elements,
+            'false_positive_rate': false_positive_rate,
+            'slices': num_slices
+        }
+        if include_image:
+            result['visualization'] = _png_base64(vis_image)
+        else:
+            result['changed_bits'] = changed_bits
+        return jsonify(result)
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/compare_filters', methods=['POST'])
+@visual.route('/compare_filters', methods=['POST'])
 def compare_filters():
+    try:
+        return _chart_response('compare_filters', request.get_json())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@visual.route('/performance_analysis', methods=['POST'])
+def performance_analysis():
+    try:
+        return _chart_response('performance_analysis', request.get_json())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@visual.route('/render_jobs', methods=['POST'])
+def submit_render_job():
+    """Queue a chart render ({kind, configurations}) and return its job ID right away"""
     try:
         data = request.get_json()
-        configurations = data['configurations']
-        
-        # Create multiple Bloom filters
-        bloom_filters = {}
-        test_elements = ['user_123', 'sarah_456', 'mike_789', 'emma_321', 'john_654', 'lisa_987', 'dave_147', 'anna_258']
-        
-        for config in configurations:
-            name = f"Size:{config['size']}, Hashes:{config['hashes']}"
-            bf = BloomFilter(config['size'], config['hashes'])
-            
-            # Add some test elements
-            for element in test_elements[:4]:  # Add first 4 elements
-                bf.add(element)
-            
-            bloom_filters[name] = bf
+        kind = data.get('kind', 'performance_analysis')
+        job_id = render_queue.submit(kind, {'configurations': _chart_configurations(data['configurations'])})
+        return jsonify(_render_job_response(job_id, render_queue.get(job_id))), 202
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _poll_render_job(job_id):
+    """Look up a job, first long-polling for up to ?wait= seconds"""
+    timeout = min(float(request.args.get('wait', 0)), _MAX_POLL_SECONDS)
+    return render_queue.wait(job_id, timeout) if timeout > 0 else render_queue.get(job_id)
+
+@visual.route('/render_jobs/<job_id>', methods=['GET'])
+def render_job_status(job_id):
+    future = _poll_render_job(job_id)
+    if future is None:
+        return jsonify({'error': f"Render job '{job_id}' not found"}), 404
+    return jsonify(_render_job_response(job_id, future))
+
+@visual.route('/render_jobs/<job_id>/image', methods=['GET'])
+def render_job_image(job_id):
+    """The finished chart as image/png; 202 with the job status while it is still rendering"""
+    future = _poll_render_job(job_id)
+    if future is None:
+        return jsonify({'error': f"Render job '{job_id}' not found"}), 404
+    status = RenderQueue.status(future)
+    if status == 'failed':
+        return jsonify(_render_job_response(job_id, future)), 500
+    if status != 'done':
+        return jsonify(_render_job_response(job_id, future)), 202
+    
+    response = Response(future.result(), mimetype='image/png')
+    # The job ID hashes the whole configuration, so its image never changes
+    response.set_etag(job_id)
+    response.headers['Cache-Control'] = 'public, max-age=86400, immutable'
+    return response.make_conditional(request)
+
+@api.route('/sweep', methods=['POST'])
+def sweep():
+    """Measured vs. theoretical false positive rates for many filter configurations.
+
+    Configurations come from 'configurations' (a list of {type, size, num_hashes,
+    hash_engine}) and/or 'grid' ({sizes, num_hashes, hash_engines, type}). The
+    workload is either uploaded ('elements', optionally 'probes') or synthetic
+    ('num_members' and 'num_probes' generated profile IDs).
+    """
+    try:
+        data = request.get_json()
+        configurations = list(data.get('configurations', []))
+        grid = data.get('grid')
+        if grid:
+            configurations += sweep_grid(grid['sizes'], grid['num_hashes'],
+                                         grid.get('hash_engines', [DEFAULT_HASH_ENGINE]),
+                                         grid.get('type', 'bloom'))
+        if not configurations:
+            return jsonify({'error': 'No configurations to evaluate'}), 400
         
-        # Create comparison visualization
-        vis_image = create_comparison_visualization(bloom_filters)
+        if 'elements' in data:
+            members = list(dict.fromkeys(str(e) for e in data['elements']))
+            if 'probes' in data:
+                probes = [str(p) for p in data['probes']]
+            else:
+                _, probes = synthetic_workload(0, int(data.get('num_probes', len(members))))
+            # A probe that was inserted is a true positive, not a false one
+            member_set = set(members)
+            probes = [p for p in dict.fromkeys(probes) if p not in member_set]
+        else:
+            members, probes = synthetic_workload(int(data.get('num_members', 10000)),
+                                                 int(data.get('num_probes', 10000)))
+        if len(members) + len(probes) > current_app.config['SWEEP_MAX_ELEMENTS']:
+            return jsonify({'error': f"Workload exceeds {current_app.config['SWEEP_MAX_ELEMENTS']} elements"}), 400
         
-        # Convert to base64
-        buffered = io.BytesIO()
-        vis_image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        start = time.perf_counter()
+        pool = _sweep_executor()
+        try:
+            results = run_sweep(configurations, members, probes, executor=pool)
+        except BrokenProcessPool:
+            _discard_sweep_executor(pool)
+            raise
         
         return jsonify({
             'success': True,
-            'visualization': img_str,
-            'configurations': len(configurations)
+            'members': len(members),
+            'probes': len(probes),
+            'results': results,
+            'seconds': time.perf_counter() - start
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/performance_analysis', methods=['POST'])
-def performance_analysis():
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    """Request latencies, stage timings and per-filter gauges for Prometheus to scrape"""
+    return Response(_prometheus_metrics(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/metrics/profiler', methods=['GET'])
+def profiler_stacks():
+    """Sampled stacks in collapsed form (?limit=N keeps the N most sampled)"""
     try:
-        data = request.get_json()
-        configurations = data['configurations']
-        
-        # Create multiple Bloom filters
-        bloom_filters = {}
-        test_elements = ['user_123', 'sarah_456', 'mike_789', 'emma_321', 'john_654', 'lisa_987', 'dave_147', 'anna_258',
-                        'tom_369', 'jessica_741', 'alex_852', 'rachel_963', 'chris_159', 'megan_357', 'ryan_753', 'ashley_951']
-        
-        for config in configurations:
-            name = f"Size:{config['size']}, Hashes:{config['hashes']}"
-            bf = BloomFilter(config['size'], config['hashes'])
-            
-            # Add some test elements
-            for element in test_elements[:8]:  # Add first 8 elements
-                bf.add(element)
-            
-            bloom_filters[name] = bf
-        
-        # Create performance analysis
-        vis_image = create_performance_analysis(bloom_filters, test_elements)
-        
-        # Convert to base64
-        buffered = io.BytesIO()
-        vis_image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        limit = request.args.get('limit', type=int)
+        response = Response(profiler.collapsed(limit), mimetype='text/plain')
+        response.headers['X-Profiler-Samples'] = str(profiler.samples)
+        response.headers['X-Profiler-Running'] = 'true' if profiler.running else 'false'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/metrics/profiler', methods=['POST'])
+def toggle_profiler():
+    """Start or stop the sampling profiler: {"enabled": bool, "interval": seconds, "reset": bool}"""
+    try:
+        data = request.get_json(silent=True) or {}
+        enabled = data.get('enabled', not profiler.running)
+        if not isinstance(enabled, bool):
+            return jsonify({'error': 'enabled must be true or false'}), 400
+        if data.get('reset'):
+            profiler.reset()
+        if enabled:
+            interval = data.get('interval')
+            profiler.start(float(interval) if interval is not None else None)
+        else:
+            profiler.stop()
         
         return jsonify({
             'success': True,
-            'visualization': img_str
+            'running': profiler.running,
+            'interval': profiler.interval,
+            'samples': profiler.samples,
+            'stacks_dropped': profiler.dropped
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def create_app(api_only=False, **config):
+    """Build the Flask app.
+
+    api_only=True leaves out the page, the image and the chart routes: the app
+    answers filter and membership requests only and never imports Pillow or
+    matplotlib. Extra keyword arguments override DEFAULT_CONFIG entries. The
+    filter registry, render queue, sweep pool, stage timer and profiler are shared
+    by the whole process and take the most recently created app's settings.
+    """
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG, API_ONLY=api_only, **config)
+    app.json = _TimedJSONProvider(app)
+    app.before_request(_start_request_timing)
+    app.after_request(_finish_request_timing)
+    app.register_blueprint(api)
+    if not api_only:
+        app.register_blueprint(visual)
+    
+    # Process-wide state follows the most recently created app's settings
+    filter_registry.memory_budget = app.config['FILTER_MEMORY_BUDGET']
+    render_queue.configure(app.config['RENDER_WORKERS'], app.config['RENDER_CACHE_SIZE'])
+    stage_timer.enabled = app.config['STAGE_TIMING']
+    profiler.interval = app.config['PROFILER_INTERVAL']
+    if _sweep_pool is not None:
+        # Started for an earlier app; the next sweep starts one with SWEEP_WORKERS workers
+        _discard_sweep_executor(_sweep_pool)
+    return app
+
+# The app served by `flask --app main run` and main(); API_ONLY=1 builds the API-only one
+app = create_app(api_only=os.environ.get('API_ONLY', '0') != '0')
+
 def main():
     print("Starting Tinder Bloom Filter Visualizer Flask App...")
     print("Open your browser and navigate to: http://localhost:5000")
     app.run(debug=True, host='0.0.0.0', port=5000)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
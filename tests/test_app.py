@@ -0,0 +1,177 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+import main
+
+@pytest.fixture
+def client():
+    return main.create_app().test_client()
+
+@pytest.fixture
+def small_budget_client():
+    """Client of an app with a 1 MiB filter budget; the process-wide budget is restored after"""
+    budget = main.filter_registry.memory_budget
+    yield main.create_app(FILTER_MEMORY_BUDGET=1 << 20).test_client()
+    main.filter_registry.memory_budget = budget
+
+def test_performance_analysis_with_shards(client):
+    response = client.post('/performance_analysis',
+                           json={'configurations': [{'size': 100, 'hashes': 3, 'shards': 2}]})
+    assert response.status_code == 200
+    assert response.get_json()['success'] is True
+
+def test_compare_filters_with_shards(client):
+    response = client.post('/compare_filters',
+                           json={'configurations': [{'size': 100, 'hashes': 3, 'shards': 2},
+                                                    {'size': 200, 'hashes': 2}]})
+    assert response.status_code == 200
+    assert response.get_json()['visualization']
+
+def test_chart_rejects_bad_configuration(client):
+    response = client.post('/performance_analysis', json={'configurations': [{'size': 100, 'hashes': 0}]})
+    assert response.status_code == 400
+
+def test_registry_refuses_filter_over_budget():
+    registry = main.FilterRegistry(memory_budget=4096)
+    registry.put('small', main.BloomFilter(1000, 3, track_elements=False))
+    with pytest.raises(ValueError):
+        registry.put('huge', main.BloomFilter(100000, 3, track_elements=False))
+    assert registry.ids() == ['small']
+
+def test_registry_evicts_after_growth():
+    registry = main.FilterRegistry(memory_budget=64 * 1024)
+    idle = main.BloomFilter(1000, 3, track_elements=False)
+    growing = main.BloomFilter(1000, 3)
+    registry.put('idle', idle)
+    registry.put('growing', growing)
+    growing.add_many(f'u{i}' for i in range(1000))
+    assert registry.memory_usage() > registry.memory_budget
+
+    registry.enforce_budget('growing')
+    assert registry.ids() == ['growing']
+
+def test_create_filter_over_budget_is_rejected(small_budget_client):
+    response = small_budget_client.post('/create_filter', json={'filter_id': 'too-big', 'size': 10 ** 8,
+                                                   'num_hashes': 3, 'mode': 'production'})
+    assert response.status_code == 400
+    assert 'too-big' not in main.filter_registry.ids()
+
+def test_create_app_reconfigures_shared_state():
+    main.create_app(RENDER_WORKERS=7, RENDER_CACHE_SIZE=3, PROFILER_INTERVAL=0.1, STAGE_TIMING=False)
+    try:
+        assert main.render_queue.max_workers == 7
+        assert main.render_queue.max_results == 3
+        assert main.profiler.interval == 0.1
+        assert main.stage_timer.enabled is False
+    finally:
+        main.create_app()
+    assert main.render_queue.max_workers == main.DEFAULT_CONFIG['RENDER_WORKERS']
+
+def test_async_chart_polls_to_a_png(client):
+    response = client.post('/compare_filters', json={'configurations': [{'size': 123, 'hashes': 3}], 'async': True})
+    assert response.status_code == 202
+    job = response.get_json()
+    assert job['status'] in ('queued', 'running', 'done')
+
+    image = client.get(job['image_url'] + '?wait=30')
+    assert image.status_code == 200
+    assert image.mimetype == 'image/png'
+    assert image.data.startswith(b'\x89PNG')
+    assert client.get(job['image_url'], headers={'If-None-Match': image.headers['ETag']}).status_code == 304
+
+def test_page_renders_charts_asynchronously(client):
+    page = client.get('/').get_data(as_text=True)
+    assert 'async: true' in page
+    assert "renderChart('/compare_filters'" in page
+    assert "renderChart('/performance_analysis'" in page
+
+def test_api_only_app_never_loads_drawing_code():
+    script = textwrap.dedent("""
+        import json, sys
+        import main
+        client = main.create_app(api_only=True).test_client()
+        created = client.post('/create_filter', json={'filter_id': 'a', 'size': 100, 'num_hashes': 3})
+        added = client.post('/add_element', json={'filter_id': 'a', 'element': 'u1'})
+        drawn = client.post('/add_element', json={'filter_id': 'a', 'element': 'u2', 'include_image': True})
+        checked = client.post('/filters/a/check', json=['u1', 'u3'])
+        print(json.dumps({
+            'statuses': [r.status_code for r in (created, added, drawn, checked)],
+            'visualization': 'visualization' in added.get_json(),
+            'routes': sorted(rule.rule for rule in client.application.url_map.iter_rules()),
+            'modules': [m for m in ('PIL', 'matplotlib', 'bloom_visualizations') if m in sys.modules]
+        }))
+    """)
+    env = dict(os.environ, API_ONLY='1')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', script], cwd=root, env=env, capture_output=True,
+                            text=True, check=True).stdout
+    result = json.loads(output.splitlines()[-1])
+    assert result['statuses'] == [200, 200, 400, 200]
+    assert result['visualization'] is False
+    assert result['modules'] == []
+    for route in ('/', '/filters/<filter_id>/image', '/compare_filters', '/performance_analysis', '/render_jobs'):
+        assert route not in result['routes']
+    assert '/filters/<filter_id>/check' in result['routes']
+
+@pytest.mark.parametrize('query', ['capacity=inf', 'capacity=nan', 'capacity=100&error_rate=nan',
+                                   'capacity=100,inf&error_rate=0.01', 'capacity=100,200&error_rate=nan'])
+def test_plan_rejects_non_finite_inputs(client, query):
+    response = client.get(f'/plan?{query}')
+    assert response.status_code == 400
+
+def test_plan_grid_route_matches_single_plans(client):
+    plans = client.get('/plan?capacity=1000,50000&error_rate=0.01,0.001').get_json()['plans']
+    for plan in plans:
+        single = client.get(f"/plan?capacity={plan['capacity']}&error_rate={plan['error_rate']}")
+        assert single.get_json()['plan'] == pytest.approx(plan)
+
+def _parse_prometheus(text):
+    """{metric name: kind} and [(name, {label: value}, value)] from the text exposition format"""
+    kinds, samples = {}, []
+    sample = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            name, kind = line[len('# TYPE '):].split(' ')
+            kinds[name] = kind
+        elif line and not line.startswith('#'):
+            name, labels, value = sample.match(line).groups()
+            samples.append((name, dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', labels or '')), float(value)))
+    return kinds, samples
+
+def test_metrics_scrape_parses(client):
+    client.post('/create_filter', json={'filter_id': 'scrape', 'size': 1000, 'num_hashes': 3})
+    client.post('/add_element', json={'filter_id': 'scrape', 'element': 'u1'})
+    try:
+        response = client.get('/metrics')
+    finally:
+        client.delete('/filters/scrape')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    kinds, samples = _parse_prometheus(response.get_data(as_text=True))
+    assert kinds['bloom_http_request_duration_seconds'] == 'histogram'
+    assert kinds['bloom_filter_fill_ratio'] == kinds['bloom_registry_filters'] == 'gauge'
+    assert kinds['bloom_stage_seconds_total'] == 'counter'
+
+    labels = {'route': '/add_element', 'method': 'POST'}
+    buckets = [(sample_labels['le'], value) for name, sample_labels, value in samples
+               if name == 'bloom_http_request_duration_seconds_bucket'
+               and {k: sample_labels[k] for k in labels} == labels]
+    assert buckets[-1][0] == '+Inf'
+    counts = [value for _, value in buckets]
+    assert counts == sorted(counts)
+    by_name = {name: value for name, sample_labels, value in samples if sample_labels == labels}
+    assert by_name['bloom_http_request_duration_seconds_count'] == counts[-1] >= 1
+    assert by_name['bloom_http_request_duration_seconds_sum'] > 0
+
+    gauges = {name: value for name, sample_labels, value in samples
+              if sample_labels == {'filter_id': 'scrape', 'type': 'BloomFilter'}}
+    assert gauges['bloom_filter_fill_ratio'] == 3 / 1000
+    assert gauges['bloom_filter_estimated_count'] == pytest.approx(1, abs=0.1)
+    assert 0 < gauges['bloom_filter_false_positive_rate'] < 1e-6
+    assert gauges['bloom_filter_memory_bytes'] > 0
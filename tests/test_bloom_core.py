@@ -0,0 +1,347 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from bloom_core import (
+    BloomFilter, BlockedBloomFilter, CountingBloomFilter, PackedCounterArray, ShardedBloomFilter,
+    StageTimer, TimeDecayingBloomFilter,
+    HASH_ENGINES, FILTER_FILE_BLOCKED, FILTER_FILE_HEADER, get_hash_engine
+)
+
+def _false_positive(bloom_filter, prefix='z'):
+    """First never-added element the filter reports as present"""
+    for i in range(100000):
+        element = f'{prefix}{i}'
+        if element not in bloom_filter.added_elements and bloom_filter.contains(element):
+            return element
+    raise AssertionError('no false positive found')
+
+def test_counting_remove_ignores_false_positives():
+    bf = CountingBloomFilter(64, 3)
+    added = [f'a{i}' for i in range(20)]
+    bf.add_many(added)
+    phantom = _false_positive(bf)
+
+    assert bf.remove(phantom) is False
+    assert all(bf.contains(element) for element in added)
+
+def test_counting_remove_many_ignores_false_positives_and_duplicates():
+    bf = CountingBloomFilter(64, 3)
+    added = [f'a{i}' for i in range(20)]
+    bf.add_many(added)
+    phantom = _false_positive(bf)
+
+    removed = bf.remove_many([phantom, 'a0', 'a0'])
+    assert removed.tolist() == [False, True, False]
+    assert all(bf.contains(element) for element in added[1:])
+    assert bf.element_count == 19
+
+def test_counting_remove_then_absent():
+    bf = CountingBloomFilter(1000, 4)
+    bf.add('swiped')
+    assert bf.remove('swiped') is True
+    assert not bf.contains('swiped')
+    assert bf.remove('swiped') is False
+    assert np.count_nonzero(bf.bit_array.counters) == 0
+
+def test_snapshot_round_trip(tmp_path):
+    bf = BloomFilter(1000, 4, 'murmur3', track_elements=False)
+    bf.add_many(f'u{i}' for i in range(100))
+    path = tmp_path / 'plain.bloom'
+    bf.snapshot(path)
+
+    reopened = BloomFilter.open(path)
+    assert type(reopened) is BloomFilter
+    assert (reopened.size, reopened.num_hashes, reopened.hash_engine.name) == (1000, 4, 'murmur3')
+    assert reopened.insertions == 100
+    assert np.array_equal(reopened.bit_array.bits, bf.bit_array.bits)
+    assert reopened.contains_many([f'u{i}' for i in range(100)]).all()
+    with pytest.raises(ValueError):
+        reopened.add('read-only')
+
+def test_header_layout(tmp_path):
+    bf = BlockedBloomFilter(2048, 3, block_bits=256, track_elements=False)
+    path = tmp_path / 'blocked.bloom'
+    bf.snapshot(path)
+    magic, version, flags, size, num_hashes, block_bits, insertions, engine = \
+        FILTER_FILE_HEADER.unpack(path.read_bytes()[:FILTER_FILE_HEADER.size])
+    assert (magic, version, flags) == (b'TBLF', 1, FILTER_FILE_BLOCKED)
+    assert (size, num_hashes, block_bits, insertions) == (2048, 3, 256, 0)
+    assert engine.rstrip(b'\0') == b'blake2b'
+    assert path.stat().st_size == FILTER_FILE_HEADER.size + 2048 // 8
+
+def test_blocked_snapshot_reopens_as_blocked(tmp_path):
+    bf = BlockedBloomFilter(10000, 5, block_bits=256, track_elements=False)
+    elements = [f'u{i}' for i in range(200)]
+    bf.add_many(elements)
+    path = tmp_path / 'blocked.bloom'
+    bf.snapshot(path)
+
+    for opener in (BloomFilter.open, BlockedBloomFilter.open):
+        reopened = opener(path)
+        assert isinstance(reopened, BlockedBloomFilter)
+        assert reopened.block_bits == 256
+        assert reopened.contains_many(elements).all()
+
+def test_snapshot_type_checks(tmp_path):
+    path = tmp_path / 'plain.bloom'
+    BloomFilter(100, 2).snapshot(path)
+    with pytest.raises(ValueError):
+        BlockedBloomFilter.open(path)
+    with pytest.raises(ValueError):
+        CountingBloomFilter(100, 2).snapshot(tmp_path / 'counting.bloom')
+
+def _popcount(bloom_filter):
+    return int(np.unpackbits(bloom_filter.bit_array.packed_bits()).sum())
+
+def test_running_bit_count_matches_popcount():
+    bf = BloomFilter(4096, 5, track_elements=False)
+    bf.add('one')
+    bf.add('one')
+    bf.add_many(f'u{i}' for i in range(300))
+    assert bf.bit_array.count() == _popcount(bf)
+
+    other = BloomFilter(4096, 5, track_elements=False)
+    other.add_many(f'v{i}' for i in range(300))
+    assert bf.union(other).bit_array.count() == _popcount(bf.union(other))
+    assert bf.intersection(other).bit_array.count() == _popcount(bf.intersection(other))
+
+    copy = BloomFilter(4096, 5, track_elements=False)
+    copy.import_delta(*other.export_delta())
+    assert copy.bit_array.count() == _popcount(other)
+    copy.import_delta(*bf.export_delta())
+    assert copy.bit_array.count() == _popcount(copy)
+
+    bf.update(other)
+    assert bf.bit_array.count() == _popcount(bf)
+    bf.intersection_update(other)
+    assert bf.bit_array.count() == _popcount(bf)
+
+def test_running_counter_count():
+    bf = CountingBloomFilter(999, 4, track_elements=False)
+    bf.add_many(f'u{i}' for i in range(100))
+    bf.remove_many(f'u{i}' for i in range(50))
+    counters = bf.bit_array
+    assert counters.count() == int(np.count_nonzero(counters.counts()))
+
+def test_read_only_map_counts_writer_updates(tmp_path):
+    path = tmp_path / 'shared.bloom'
+    BloomFilter(1000, 3, track_elements=False).snapshot(path)
+    writer = BloomFilter.open(path, 'r+')
+    reader = BloomFilter.open(path)
+    assert reader.fill_ratio() == 0
+    writer.add('u1')
+    writer.flush()
+    assert reader.bit_array.count() == writer.bit_array.count() > 0
+
+def test_delta_round_trip():
+    source = BloomFilter(5000, 4, track_elements=False)
+    source.enable_change_tracking()
+    source.add_many(f'u{i}' for i in range(100))
+    replica = BloomFilter(5000, 4, track_elements=False)
+    replica.import_delta(*source.export_delta())
+    assert np.array_equal(replica.bit_array.bits, source.bit_array.bits)
+
+    mark = source.generation
+    source.add_many(f'v{i}' for i in range(10))
+    indices, words = source.export_delta(since=mark)
+    assert 0 < len(indices) <= 40
+    replica.import_delta(indices, words)
+    assert np.array_equal(replica.bit_array.bits, source.bit_array.bits)
+    assert len(source.export_delta(since=source.generation)[0]) == 0
+
+def test_delta_partial_last_word():
+    # 100 bits fill 13 bytes: the second word is only partly inside the buffer
+    source = BloomFilter(100, 3, track_elements=False)
+    source.add_many(f'u{i}' for i in range(30))
+    replica = BloomFilter(100, 3, track_elements=False)
+    replica.import_delta(*source.export_delta())
+    assert np.array_equal(replica.bit_array.bits, source.bit_array.bits)
+    with pytest.raises(ValueError):
+        replica.import_delta(np.array([2], dtype=np.uint64), np.array([1], dtype=np.uint64))
+
+def test_delta_needs_change_tracking_or_production_mode():
+    bf = BloomFilter(1000, 3, track_elements=False)
+    with pytest.raises(ValueError):
+        bf.export_delta(since=1)
+    with pytest.raises(ValueError):
+        BloomFilter(1000, 3).import_delta(*bf.export_delta())
+
+def test_sharded_added_elements_spans_shards():
+    bf = ShardedBloomFilter(1000, 3, num_shards=4)
+    elements = {f'u{i}' for i in range(50)}
+    bf.add_many(elements)
+    assert bf.added_elements == elements
+    assert ShardedBloomFilter(1000, 3, track_elements=False).added_elements is None
+
+@pytest.mark.parametrize('engine', sorted(HASH_ENGINES))
+def test_scalar_and_vector_double_hashing_agree(engine):
+    bf = BloomFilter(1_000_003, 7, engine)
+    elements = [f'user_{i}' for i in range(200)] + ['', 'café']
+    h1, h2 = bf.hash_engine.hash_pairs(elements)
+    assert [bf.hash_engine.hash_pair(element) for element in elements] == list(zip(h1.tolist(), h2.tolist()))
+    vector = bf._indices(h1, h2)
+    for element, row in zip(elements, vector):
+        assert bf.get_hash_positions(element) == row.tolist()
+
+def test_unknown_hash_engine():
+    with pytest.raises(ValueError):
+        get_hash_engine('xxh3')
+
+def test_counter_nibbles_pack_independently():
+    counters = PackedCounterArray(7)
+    counters.increment([0, 1, 1, 2, 6, 6, 6])
+    assert counters.counts().tolist() == [1, 2, 1, 0, 0, 0, 3]
+    # Counter 0 is the low nibble and counter 1 the high nibble of byte 0
+    assert counters.counters[0] == 0x21
+    counters.decrement([1, 6])
+    assert counters.counts().tolist() == [1, 1, 1, 0, 0, 0, 2]
+    assert counters.counts(1, 3).tolist() == [1, 1]
+    assert counters.unpack().tolist() == [1, 1, 1, 0, 0, 0, 1]
+
+def test_counters_saturate_and_stay_saturated():
+    counters = PackedCounterArray(4)
+    counters.increment([2] * 20 + [3])
+    assert counters.get_count(2) == PackedCounterArray.MAX_COUNT
+    counters.decrement([2, 2, 3, 3])
+    # A saturated counter no longer knows its true count, so it is never decremented
+    assert counters.get_count(2) == PackedCounterArray.MAX_COUNT
+    assert counters.get_count(3) == 0
+    assert counters.counts().tolist() == [0, 0, 15, 0]
+
+class _FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def test_time_decaying_entries_expire_after_window():
+    clock = _FakeClock()
+    bf = TimeDecayingBloomFilter(1000, 3, window_seconds=300, generations=3, clock=clock)
+    bf.add('old')
+    clock.now += 150
+    bf.add('newer')
+    assert bf.contains('old') and bf.contains('newer')
+
+    # Two rotations: 'old' is in the oldest live generation, still visible
+    clock.now += 60
+    assert bf.contains('old')
+    # A third rotation drops the generation holding 'old'
+    clock.now += 100
+    assert not bf.contains('old')
+    assert bf.contains('newer')
+    clock.now += 300
+    assert not bf.contains('newer')
+    assert bf.element_count == 0
+
+def test_time_decaying_expire_counts_elapsed_periods():
+    clock = _FakeClock()
+    bf = TimeDecayingBloomFilter(1000, 3, window_seconds=300, generations=3, clock=clock)
+    bf.add_many(['a', 'b'])
+    assert bf.expire() == 0
+    clock.now += 250
+    assert bf.expire() == 2
+    # rotated_at advances by whole periods, so the leftover 50 s still counts
+    clock.now += 50
+    assert bf.expire() == 1
+    assert not bf.contains_many(['a', 'b']).any()
+
+def test_time_decaying_manual_rotation():
+    bf = TimeDecayingBloomFilter(1000, 3, generations=2, clock=_FakeClock())
+    bf.add('u1')
+    generation = bf.generation
+    bf.rotate()
+    assert bf.contains('u1')
+    assert bf.generation > generation
+    bf.rotate(steps=5)
+    assert not bf.contains('u1')
+    assert len(bf.slices) == 2
+
+def _block_popcounts(bf):
+    bits = np.unpackbits(bf.bit_array.bits, bitorder='little')
+    return bits.reshape(bf.num_blocks, -1).sum(axis=1)
+
+@pytest.mark.parametrize('block_bits', [16, 512])
+def test_blocked_block_counts_stay_current(block_bits):
+    bf = BlockedBloomFilter(8192, 4, block_bits=block_bits, track_elements=False)
+    bf.add('one')
+    bf.add_many(f'u{i}' for i in range(300))
+    assert np.array_equal(bf.block_fill() * block_bits, _block_popcounts(bf))
+
+    other = BlockedBloomFilter(8192, 4, block_bits=block_bits, track_elements=False)
+    other.add_many(f'v{i}' for i in range(300))
+    merged = bf.union(other)
+    assert np.array_equal(merged.block_fill() * block_bits, _block_popcounts(merged))
+    bf.update(other)
+    bf.add_many(f'w{i}' for i in range(50))
+    assert np.array_equal(bf.block_fill() * block_bits, _block_popcounts(bf))
+
+    expected = np.mean((_block_popcounts(bf) / block_bits) ** 4)
+    assert bf.get_false_positive_rate() == pytest.approx(expected)
+
+@pytest.mark.parametrize('cls', [BloomFilter, BlockedBloomFilter])
+def test_scalar_add_matches_batch_add(cls):
+    one, batch = cls(4096, 5, track_elements=False), cls(4096, 5, track_elements=False)
+    for bf in (one, batch):
+        bf.enable_change_tracking()
+    mark = one.generation
+    elements = [f'u{i}' for i in range(200)] + ['u0']
+    for element in elements:
+        one.add(element)
+    batch.add_many(elements)
+    assert np.array_equal(one.bit_array.bits, batch.bit_array.bits)
+    assert one.bit_array.count() == batch.bit_array.count() == _popcount(one)
+    assert one.get_false_positive_rate() == pytest.approx(batch.get_false_positive_rate())
+    assert np.array_equal(one.export_delta(since=mark)[0], batch.export_delta()[0])
+
+def test_nested_stages_are_timed_exclusively():
+    timer = StageTimer(('outer', 'inner'))
+
+    @timer.timed('inner')
+    def inner():
+        time.sleep(0.05)
+
+    timer.begin_request()
+    with timer.stage('outer'):
+        time.sleep(0.02)
+        inner()
+        time.sleep(0.02)
+    request = timer.end_request()
+    totals = timer.totals()
+
+    assert totals['inner'][0] == totals['outer'][0] == 1
+    assert totals['inner'][1] >= 0.05
+    # Counted inclusively the outer stage would be at least 0.09s
+    assert 0.04 <= totals['outer'][1] < 0.08
+    assert request == {'outer': totals['outer'][1], 'inner': totals['inner'][1]}
+    assert timer.end_request() == {}
+
+def test_stage_totals_outlive_their_threads():
+    timer = StageTimer(('hash',))
+
+    def work():
+        for _ in range(3):
+            with timer.stage('hash'):
+                pass
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert timer.totals()['hash'][0] == 12
+    # Finished threads are folded away, but their calls still count
+    assert timer._threads == []
+    work()
+    assert timer.totals()['hash'][0] == 15
+
+def test_disabled_stage_timer_records_nothing():
+    timer = StageTimer(('hash',))
+    timer.enabled = False
+    with timer.stage('hash'):
+        pass
+    assert timer.timed('hash')(len)('abc') == 3
+    assert timer.totals() == {'hash': (0, 0.0)}
@@ -0,0 +1,41 @@
+import main
+
+def _client():
+    client = main.create_app().test_client()
+    client.post('/create_filter', json={'filter_id': 'img', 'size': 64, 'num_hashes': 3, 'include_image': False})
+    return client
+
+def test_image_revalidates_until_the_filter_changes():
+    client = _client()
+    first = client.get('/filters/img/image')
+    assert first.status_code == 200
+    assert first.mimetype == 'image/png'
+    etag = first.headers['ETag']
+
+    cached = client.get('/filters/img/image', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.data == b''
+
+    client.post('/add_element', json={'filter_id': 'img', 'element': 'u1', 'include_image': False})
+    changed = client.get('/filters/img/image', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+def test_etag_from_another_process_does_not_match(monkeypatch):
+    client = _client()
+    etag = client.get('/filters/img/image').headers['ETag']
+    monkeypatch.setattr(main, '_ETAG_EPOCH', 'restarted')
+    assert client.get('/filters/img/image', headers={'If-None-Match': etag}).status_code == 200
+
+def test_add_without_image_returns_changed_bits():
+    client = _client()
+    bf = main.filter_registry.get('img')
+    expected = sorted(set(bf.get_hash_positions('u1')))
+    response = client.post('/add_element', json={'filter_id': 'img', 'element': 'u1', 'include_image': False})
+    assert response.get_json()['changed_bits'] == expected
+    # Adding it again turns nothing on
+    response = client.post('/add_element', json={'filter_id': 'img', 'element': 'u1', 'include_image': False})
+    assert response.get_json()['changed_bits'] == []
+
+    response = client.post('/add_multiple', json={'filter_id': 'img', 'elements': 'u1, u2', 'include_image': False})
+    assert response.get_json()['changed_bits'] == sorted(set(bf.get_hash_positions('u2')) - set(expected))
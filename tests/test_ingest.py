@@ -0,0 +1,62 @@
+import gzip
+import io
+import tracemalloc
+
+import pytest
+
+import main
+
+def _read(data, **kwargs):
+    return list(main._IngestReader(io.BytesIO(data), **kwargs))
+
+def test_lines_split_across_chunks():
+    data = b'alpha\r\nbeta\n\n  gamma  \ndelta'
+    for chunk_size in (1, 2, 3, 7, 1 << 20):
+        assert _read(data, chunk_size=chunk_size) == ['alpha', 'beta', 'gamma', 'delta']
+
+def test_multibyte_utf8_split_across_chunks():
+    assert _read('café\nüber\n'.encode('utf-8'), chunk_size=4) == ['café', 'über']
+
+def test_gzip_sniffed_and_concatenated_members():
+    data = gzip.compress(b'u1\nu2\n') + gzip.compress(b'u3\n')
+    reader = main._IngestReader(io.BytesIO(data), chunk_size=5)
+    assert list(reader) == ['u1', 'u2', 'u3']
+    assert reader.compressed is True
+    assert reader.rows == 3
+    assert reader.bytes_read == len(data)
+
+def test_truncated_gzip_is_rejected():
+    with pytest.raises(ValueError):
+        _read(gzip.compress(b'u1\nu2\n' * 100)[:-10])
+
+def test_line_without_newline_is_capped():
+    with pytest.raises(ValueError):
+        _read(b'x' * 200, chunk_size=16, max_line_bytes=100)
+    assert _read(b'x' * 100 + b'\n', chunk_size=16, max_line_bytes=100) == ['x' * 100]
+
+def test_ingest_route_rejects_overlong_line():
+    client = main.create_app().test_client()
+    client.post('/create_filter', json={'filter_id': 'ingest-cap', 'size': 1000, 'num_hashes': 3})
+    response = client.post('/filters/ingest-cap/ingest', data=b'u1\n' + b'x' * (200 * 1024),
+                           content_type='text/plain')
+    assert response.status_code == 400
+    assert response.get_json()['rows_read'] == 1
+
+def test_compressed_body_decompresses_in_bounded_pieces():
+    body = gzip.compress(b'\n' * (64 << 20) + b'u1\nu2\n', 9)
+    assert len(body) < 128 * 1024
+    tracemalloc.start()
+    try:
+        reader = main._IngestReader(io.BytesIO(body), chunk_size=1 << 20)
+        assert list(reader) == ['u1', 'u2']
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert reader.bytes_decoded == (64 << 20) + 6
+    assert peak < 8 << 20
+
+def test_compressed_line_without_newline_is_capped():
+    reader = main._IngestReader(io.BytesIO(gzip.compress(b'x' * (64 << 20))), max_line_bytes=1 << 16)
+    with pytest.raises(ValueError):
+        list(reader)
+    assert reader.bytes_decoded <= 2 << 20
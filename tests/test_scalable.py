@@ -0,0 +1,43 @@
+import pytest
+
+from bloom_core import ScalableBloomFilter, synthetic_workload
+
+def test_slices_are_added_as_capacity_fills():
+    bf = ScalableBloomFilter(initial_capacity=100, error_rate=0.01, growth_factor=2, track_elements=False)
+    assert len(bf.slices) == 1
+    bf.add_many(f'u{i}' for i in range(90))
+    assert len(bf.slices) == 1
+    bf.add_many(f'u{i}' for i in range(90, 150))
+    assert len(bf.slices) == 2
+    bf.add_many(f'u{i}' for i in range(150, 800))
+    assert len(bf.slices) == 4
+    assert bf.capacities == [100, 200, 400, 800]
+    assert all(s.insertions <= c for s, c in zip(bf.slices, bf.capacities))
+    # Each slice is sized for a tighter error rate than the one before it
+    assert [s.num_hashes for s in bf.slices] == sorted(s.num_hashes for s in bf.slices)
+
+def test_compound_false_positive_rate_stays_under_target():
+    members, probes = synthetic_workload(200_000, 100_000)
+    bf = ScalableBloomFilter(initial_capacity=1000, error_rate=0.01, track_elements=False)
+    for start in range(0, len(members), 20_000):
+        bf.add_many(members[start:start + 20_000])
+
+    assert len(bf.slices) > 5
+    assert bf.contains_many(members).all()
+    measured = bf.contains_many(probes).mean()
+    assert measured < 0.01
+    assert bf.get_false_positive_rate() < 0.01
+
+def test_repeated_elements_do_not_use_capacity():
+    bf = ScalableBloomFilter(initial_capacity=10, error_rate=0.01)
+    for _ in range(5):
+        bf.add_many(['a', 'b', 'c'])
+        bf.add('a')
+    assert len(bf.slices) == 1
+    assert bf.element_count == 3
+
+@pytest.mark.parametrize('kwargs', [{'initial_capacity': 0}, {'error_rate': 1}, {'growth_factor': 0.5},
+                                    {'tightening_ratio': 1}])
+def test_invalid_parameters(kwargs):
+    with pytest.raises(ValueError):
+        ScalableBloomFilter(**kwargs)
@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import main
+from bloom_core import plan_filter, plan_grid, run_sweep, sweep_grid, synthetic_workload
+
+def test_measured_rate_tracks_theory():
+    plan = plan_filter(20000, 0.01)
+    members, probes = synthetic_workload(20000, 20000)
+    configurations = sweep_grid([plan['size']], [plan['num_hashes'], 2], ['blake2b', 'murmur3'])
+    configurations.append({'type': 'blocked', 'size': plan['size'], 'num_hashes': plan['num_hashes']})
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = run_sweep(configurations, members, probes, executor=executor)
+
+    assert [(r['type'], r['num_hashes'], r['hash_engine']) for r in results] == \
+        [(c['type'], c['num_hashes'], c.get('hash_engine', 'blake2b')) for c in configurations]
+    for result in results:
+        assert result['members'] == result['probes'] == 20000
+        # 20,000 probes at ~1-3% give a standard error of about 0.1 percentage points
+        assert result['measured_fp_rate'] == pytest.approx(result['theoretical_fp_rate'], abs=0.005)
+    # The optimal k beats k=2 at the same size
+    assert results[0]['theoretical_fp_rate'] < results[2]['theoretical_fp_rate']
+
+def test_plan_grid_agrees_with_plan_filter():
+    capacities, error_rates = [1, 7, 1000, 123457], [0.5, 0.01, 1e-6]
+    grid = plan_grid(capacities, error_rates)
+    for i, capacity in enumerate(capacities):
+        for j, error_rate in enumerate(error_rates):
+            plan = plan_filter(capacity, error_rate)
+            for column in ('capacity', 'size', 'num_hashes', 'memory_bytes'):
+                assert grid[column][i, j] == plan[column]
+            for column in ('error_rate', 'bits_per_element', 'expected_fp_rate'):
+                assert grid[column][i, j] == pytest.approx(plan[column])
+
+@pytest.mark.parametrize('capacities, error_rates', [
+    ([float('nan')], [0.01]), ([float('inf')], [0.01]), ([0], [0.01]),
+    ([100], [float('nan')]), ([100], [0]), ([100], [1]),
+])
+def test_plans_reject_invalid_inputs(capacities, error_rates):
+    with pytest.raises(ValueError):
+        plan_grid(capacities, error_rates)
+    with pytest.raises(ValueError):
+        plan_filter(capacities[0], error_rates[0])
+
+def test_sweep_rejects_unknown_type_before_work():
+    with pytest.raises(ValueError):
+        run_sweep([{'type': 'counting', 'size': 100, 'num_hashes': 2}], ['a'], ['b'])
+
+def test_sweep_route(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(main, '_sweep_executor', lambda: executor)
+    client = main.create_app().test_client()
+    response = client.post('/sweep', json={'grid': {'sizes': [20000], 'num_hashes': [3, 5]},
+                                           'num_members': 2000, 'num_probes': 2000})
+    executor.shutdown()
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [r['num_hashes'] for r in body['results']] == [3, 5]
+    assert body['members'] == body['probes'] == 2000
+
+    response = client.post('/sweep', json={'grid': {'sizes': [100], 'num_hashes': [3],
+                                                    'hash_engines': ['xxh3']}})
+    assert response.status_code == 400